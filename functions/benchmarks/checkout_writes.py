@@ -0,0 +1,191 @@
+"""RPC count and latency of the track_checkout write path.
+
+Runs the write path against an in-memory Firestore stand-in that sleeps for a
+simulated round trip on every RPC, and compares:
+
+	legacy   get() of the event, set() of the event, then merge set()s of the shop
+	         summary and the daily rollup (one round trip each)
+	batched  handlers.checkout.record_checkout: create() + merges of a counter shard
+	         and the rollup in one commit
+
+It also replays the same transaction from several threads at once to show how
+many times each path counts it.
+
+Run from the functions directory:
+
+	python benchmarks/checkout_writes.py
+	python benchmarks/checkout_writes.py --rpc-ms 20 --iterations 500
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+from google.api_core import exceptions as google_exceptions
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers.checkout import record_checkout  # noqa: E402
+from handlers.rollups import event_day, rollup_increment, rollup_ref  # noqa: E402
+
+
+class FakeFirestore:
+	"""Just enough of the Firestore client for the checkout write path."""
+
+	def __init__(self, rpc_ms: float, jitter: float):
+		self.rpc_ms = rpc_ms
+		self.jitter = jitter
+		self.rpcs = 0
+		self.documents = {}
+		self.counted = 0
+		self._lock = threading.Lock()
+
+	def round_trip(self):
+		with self._lock:
+			self.rpcs += 1
+		time.sleep(random.lognormvariate(0, self.jitter) * self.rpc_ms / 1000)
+
+	def collection(self, name):
+		return _Reference(self, name)
+
+	def batch(self):
+		return _Batch(self)
+
+	def apply(self, method, path, data, merge=False):
+		"""Apply one write; the caller holds the lock."""
+		if method == "create" and path in self.documents:
+			raise google_exceptions.AlreadyExists(f"Document already exists: {path}")
+		# Merges carrying a counter field are what a replay must not repeat
+		if merge and ("count" in data or "total_events" in data):
+			self.counted += 1
+		self.documents[path] = data
+
+
+class _Reference:
+	def __init__(self, client, path):
+		self._client = client
+		self.path = path
+
+	def collection(self, name):
+		return _Reference(self._client, f"{self.path}/{name}")
+
+	def document(self, name):
+		return _Reference(self._client, f"{self.path}/{name}")
+
+	def get(self):
+		self._client.round_trip()
+		return _Snapshot(self.path in self._client.documents)
+
+	def set(self, data, merge=False):
+		self._client.round_trip()
+		with self._client._lock:
+			self._client.apply("set", self.path, data, merge)
+
+
+class _Snapshot:
+	def __init__(self, exists):
+		self.exists = exists
+
+
+class _Batch:
+	def __init__(self, client):
+		self._client = client
+		self._writes = []
+
+	def create(self, reference, data):
+		self._writes.append(("create", reference.path, data, False))
+
+	def set(self, reference, data, merge=False):
+		self._writes.append(("set", reference.path, data, merge))
+
+	def commit(self):
+		self._client.round_trip()
+		with self._client._lock:
+			# All or nothing, like a Firestore commit
+			for method, path, _, _ in self._writes:
+				if method == "create" and path in self._client.documents:
+					raise google_exceptions.AlreadyExists(f"Document already exists: {path}")
+			for write in self._writes:
+				self._client.apply(*write)
+
+
+def legacy_record_checkout(db, shop_doc_id: str, event_data: dict) -> bool:
+	"""The write path track_checkout used before batching, for comparison."""
+	shop_events_ref = db.collection("shops_events").document(shop_doc_id)
+	event_doc_ref = shop_events_ref.collection("events").document(str(event_data["transaction_id"]))
+	if event_doc_ref.get().exists:
+		return False
+	event_doc_ref.set(event_data)
+	shop_events_ref.set({"shop_name": event_data["affiliation"], "total_events": 1}, merge=True)
+	day = event_day(event_data.get("timestamp"))
+	rollup_ref(db, shop_doc_id, day).set(rollup_increment(event_data, day), merge=True)
+	return True
+
+
+def _event(transaction_id: str) -> dict:
+	return {
+		"transaction_id": transaction_id,
+		"affiliation": "bench.ikas.shop",
+		"timestamp": "2025-11-03T15:07:25.103Z",
+		"kons_ref": "bench",
+		"value": "18",
+		"currency": "TRY",
+	}
+
+
+def _percentile(samples, fraction):
+	ordered = sorted(samples)
+	return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(write, args) -> dict:
+	db = FakeFirestore(args.rpc_ms, args.jitter)
+	latencies = []
+	for i in range(args.iterations):
+		started = time.perf_counter()
+		write(db, "bench.ikas.shop", _event(f"txn-{i}"))
+		latencies.append((time.perf_counter() - started) * 1000)
+
+	# Replay one transaction concurrently, like retried beacons
+	replay = FakeFirestore(args.rpc_ms, args.jitter)
+	threads = [
+		threading.Thread(target=write, args=(replay, "bench.ikas.shop", _event("replayed")))
+		for _ in range(args.replays)
+	]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	return {
+		"rpcs_per_checkout": db.rpcs / args.iterations,
+		"p50_ms": statistics.median(latencies),
+		"p99_ms": _percentile(latencies, 0.99),
+		"replay_counted": replay.counted,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--rpc-ms", type=float, default=8.0, help="median simulated round trip")
+	parser.add_argument("--jitter", type=float, default=0.35, help="sigma of the lognormal round-trip jitter")
+	parser.add_argument("--iterations", type=int, default=200)
+	parser.add_argument("--replays", type=int, default=8, help="concurrent replays of one transaction")
+	args = parser.parse_args()
+
+	random.seed(0)
+	print(f"{'path':<10} {'rpcs':>6} {'p50':>9} {'p99':>9} {'replay counted':>16}")
+	for name, write in (("legacy", legacy_record_checkout), ("batched", record_checkout)):
+		row = measure(write, args)
+		print(
+			f"{name:<10} {row['rpcs_per_checkout']:>6.1f} {row['p50_ms']:>7.1f}ms {row['p99_ms']:>7.1f}ms "
+			f"{row['replay_counted']:>13}x"
+		)
+
+
+if __name__ == "__main__":
+	main()
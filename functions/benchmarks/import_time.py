@@ -0,0 +1,142 @@
+"""Per-endpoint cold-start import cost.
+
+Every endpoint is measured in fresh interpreters started with ``-X importtime``:
+the cost of ``import main`` (paid by every instance) plus the cost of the handler
+module the endpoint imports on its first call. The endpoint -> module mapping is
+read from main.py, so new endpoints are picked up automatically.
+
+Run from the functions directory:
+
+	python benchmarks/import_time.py
+	python benchmarks/import_time.py --json > benchmarks/import_time_baseline.json
+	python benchmarks/import_time.py --baseline benchmarks/import_time_baseline.json
+
+With --baseline the script exits with status 1 when any endpoint's median total
+import time exceeds the baseline by more than --tolerance.
+"""
+
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def endpoint_modules() -> dict:
+	"""Map each endpoint declared in main.py to the handlers module it imports."""
+	with open(os.path.join(FUNCTIONS_DIR, "main.py")) as f:
+		tree = ast.parse(f.read())
+
+	endpoints = {}
+	for node in tree.body:
+		if not isinstance(node, ast.FunctionDef) or not node.decorator_list:
+			continue
+		for statement in ast.walk(node):
+			if isinstance(statement, ast.ImportFrom) and statement.module == "handlers":
+				endpoints[node.name] = statement.names[0].name
+	return endpoints
+
+
+def _top_level_imports(stderr: str) -> list:
+	"""Parse -X importtime output into (name, cumulative_us) for top-level imports."""
+	entries = []
+	for line in stderr.splitlines():
+		if not line.startswith("import time:") or "cumulative" in line:
+			continue
+		_, cumulative, name = line[len("import time:"):].split("|", 2)
+		# Nested imports are indented under the module that triggered them
+		if name.startswith("  "):
+			continue
+		entries.append((name.strip(), int(cumulative)))
+	return entries
+
+
+def measure(module: str) -> tuple:
+	"""Return (main_ms, handler_ms) for one cold interpreter."""
+	result = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", f"import main; import handlers.{module}"],
+		cwd=FUNCTIONS_DIR,
+		capture_output=True,
+		text=True,
+		check=True,
+	)
+	entries = _top_level_imports(result.stderr)
+	names = [name for name, _ in entries]
+	main_index = names.index("main")
+	main_us = entries[main_index][1]
+	handler_us = sum(cumulative for _, cumulative in entries[main_index + 1:])
+	return main_us / 1000, handler_us / 1000
+
+
+def run(runs: int) -> dict:
+	endpoints = endpoint_modules()
+	# Populate the bytecode cache so every measured run starts from the same state
+	for module in set(endpoints.values()):
+		measure(module)
+
+	results = {}
+	for endpoint, module in sorted(endpoints.items()):
+		samples = [measure(module) for _ in range(runs)]
+		main_ms = statistics.median(sample[0] for sample in samples)
+		handler_ms = statistics.median(sample[1] for sample in samples)
+		results[endpoint] = {
+			"module": f"handlers.{module}",
+			"main_ms": round(main_ms, 1),
+			"handler_ms": round(handler_ms, 1),
+			"total_ms": round(statistics.median(sum(sample) for sample in samples), 1),
+		}
+	return {
+		"python": platform.python_version(),
+		"runs": runs,
+		"endpoints": results,
+	}
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+	"""Return a description of every endpoint that regressed beyond tolerance."""
+	regressions = []
+	for endpoint, current in report["endpoints"].items():
+		previous = baseline.get("endpoints", {}).get(endpoint)
+		if not previous:
+			continue
+		limit = previous["total_ms"] * (1 + tolerance)
+		if current["total_ms"] > limit:
+			regressions.append(
+				f"{endpoint}: {current['total_ms']}ms > {previous['total_ms']}ms baseline (+{tolerance:.0%} allowed)"
+			)
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--runs", type=int, default=5, help="cold interpreters per endpoint (median is reported)")
+	parser.add_argument("--json", action="store_true", help="print the report as JSON")
+	parser.add_argument("--baseline", help="JSON report to compare against")
+	parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+	args = parser.parse_args()
+
+	report = run(args.runs)
+
+	if args.json:
+		print(json.dumps(report, indent=2))
+	else:
+		print(f"{'endpoint':<28} {'module':<30} {'main':>8} {'handler':>8} {'total':>8}")
+		for endpoint, row in report["endpoints"].items():
+			print(f"{endpoint:<28} {row['module']:<30} {row['main_ms']:>6.1f}ms {row['handler_ms']:>6.1f}ms {row['total_ms']:>6.1f}ms")
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			regressions = compare(report, json.load(f), args.tolerance)
+		for regression in regressions:
+			print(f"REGRESSION {regression}", file=sys.stderr)
+		if regressions:
+			sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,152 @@
+"""Serialization cost of the largest admin and affiliate responses.
+
+Builds the biggest page each endpoint returns from synthetic Firestore data
+(DatetimeWithNanoseconds timestamps, nested maps and item lists) and compares:
+
+	legacy   get_all_users: convert every top-level timestamp field of every user
+	         into a new dict, then json.dumps; fetch_affiliate_stats:
+	         json.dumps(default=str) with a fresh encoder per call
+	shared   handlers.serialization.dumps, converting values from the reused
+	         encoder's default hook in a single pass
+
+Run from the functions directory:
+
+	python benchmarks/serialization.py
+	python benchmarks/serialization.py --repeat 50
+"""
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers.admin import USERS_MAX_PAGE_SIZE  # noqa: E402
+from handlers.affiliate import AFFILIATE_MAX_PAGE_SIZE  # noqa: E402
+from handlers.serialization import dumps  # noqa: E402
+
+_EPOCH = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _timestamp(seconds: int) -> DatetimeWithNanoseconds:
+	moment = _EPOCH + datetime.timedelta(seconds=seconds)
+	return DatetimeWithNanoseconds(*moment.timetuple()[:6], nanosecond=123456789, tzinfo=datetime.timezone.utc)
+
+
+def users_page() -> dict:
+	users = []
+	for i in range(USERS_MAX_PAGE_SIZE):
+		users.append({
+			"id": f"user-{i:04d}",
+			"email": f"user{i}@example.com",
+			"displayName": f"User {i}",
+			"userId": f"user-{i:04d}",
+			"role": "user",
+			"isAdmin": False,
+			"verified": i % 3 == 0,
+			"shop": f"shop-{i}.myshopify.com",
+			"platform": "shopify" if i % 2 else "ikas",
+			"createdAt": _timestamp(i * 3600),
+			"lastUpdated": _timestamp(i * 3600 + 60),
+			"lastLogin": _timestamp(i * 3600 + 120),
+			"onboardingCompletedAt": _timestamp(i * 3600 + 180),
+			"preferences": {"language": "tr", "notifications": True},
+		})
+	return {"users": users, "hasMore": True, "nextCursor": "eyJjcmVhdGVkQXQiOnt9fQ"}
+
+
+def affiliate_page() -> dict:
+	events = []
+	for i in range(AFFILIATE_MAX_PAGE_SIZE):
+		events.append({
+			"event_id": f"evt-{i}",
+			"eventType": "checkout_completed",
+			"timestamp": _timestamp(i * 60),
+			"kons_ref": f"ref-{i % 40}",
+			"ecommerce": {
+				"transaction_id": str(1000 + i),
+				"value": "189.90",
+				"currency": "TRY",
+				"items": [
+					{"item_id": f"sku-{i}-{n}", "item_name": "Product", "price": 63.3, "quantity": 1}
+					for n in range(3)
+				],
+			},
+		})
+	return {
+		"shop_name": "bench",
+		"shop_full_name": "bench.myshopify.com",
+		"total_checkout_events": 25000,
+		"events": events,
+		"page_size": AFFILIATE_MAX_PAGE_SIZE,
+		"has_more": True,
+		"next_cursor": "eyJ0aW1lc3RhbXAiOnt9fQ",
+	}
+
+
+def legacy_users(payload: dict) -> str:
+	"""get_all_users before the shared serializer: a converted copy of every user."""
+	def convert_timestamp(ts):
+		if not ts:
+			return None
+		if hasattr(ts, 'isoformat'):
+			return int(ts.timestamp() * 1000)
+		elif hasattr(ts, 'timestamp'):
+			return int(ts.timestamp() * 1000)
+		return None
+
+	users = []
+	for user in payload["users"]:
+		converted = {}
+		for key, value in user.items():
+			converted[key] = convert_timestamp(value) if hasattr(value, 'timestamp') or hasattr(value, 'isoformat') else value
+		users.append(converted)
+	return json.dumps({**payload, "users": users})
+
+
+def legacy_affiliate(payload: dict) -> str:
+	return json.dumps(payload, default=str)
+
+
+def _time(function, payload, repeat: int) -> tuple:
+	samples = []
+	for _ in range(repeat):
+		started = time.perf_counter()
+		body = function(payload)
+		samples.append((time.perf_counter() - started) * 1000)
+	return statistics.median(samples), len(body)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--repeat", type=int, default=30, help="serializations per case (median is reported)")
+	args = parser.parse_args()
+
+	users = users_page()
+	affiliate = affiliate_page()
+	cases = (
+		(f"get_all_users ({USERS_MAX_PAGE_SIZE} users)", users, (
+			("legacy", legacy_users),
+			("shared", lambda payload: dumps(payload, timestamps="millis")),
+		)),
+		(f"fetch_affiliate_stats ({AFFILIATE_MAX_PAGE_SIZE} events)", affiliate, (
+			("legacy", legacy_affiliate),
+			("shared", dumps),
+		)),
+	)
+
+	print(f"{'response':<36} {'path':<8} {'median':>9} {'bytes':>9}")
+	for name, payload, paths in cases:
+		for path, function in paths:
+			median_ms, size = _time(function, payload, args.repeat)
+			print(f"{name:<36} {path:<8} {median_ms:>7.2f}ms {size:>9}")
+
+
+if __name__ == "__main__":
+	main()
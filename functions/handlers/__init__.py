@@ -0,0 +1,6 @@
+"""Endpoint implementations for the Cloud Functions declared in main.py.
+
+Modules are grouped by the dependencies their endpoints need, and main.py imports a
+module only when one of its endpoints is first called. Keep heavy imports (requests,
+Firestore, the external project client) out of modules whose endpoints don't use them.
+"""
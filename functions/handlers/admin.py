@@ -0,0 +1,580 @@
+"""Admin management endpoints (admin and super admin only)."""
+
+from firebase_functions import https_fn
+from firebase_admin import auth as admin_auth, firestore
+
+import os
+
+from handlers.auth import SUPER_ADMIN_UID, get_auth_profiles, role_cache
+from handlers.common import logger, collect_stats, get_page_size, encode_cursor, decode_cursor, PUBLIC_CORS
+from handlers.pipeline import RequestContext, endpoint
+from handlers.serialization import to_millis
+
+# Page sizes and sort fields for get_all_users
+USERS_DEFAULT_PAGE_SIZE = 50
+USERS_MAX_PAGE_SIZE = 200
+USERS_ORDER_FIELDS = ("createdAt", "email", "lastUpdated")
+
+# Documents read per get_all_users call while looking for users without the orderBy field
+USERS_MISSING_FIELD_SCAN_LIMIT = 500
+
+# Admin roster: admin_roster/admins holds {"members": {uid: entry}, "bootstrapped": bool}.
+# add_admin, remove_admin and init_super_admin update it in the same transaction as
+# the user document, so get_all_admins reads one document instead of every user.
+ADMIN_ROSTER_COLLECTION = "admin_roster"
+ADMIN_ROSTER_DOCUMENT = "admins"
+
+# User document fields get_all_admins needs, copied into each roster entry
+_ROSTER_FIELDS = ("role", "isAdmin", "isSuperAdmin", "email", "displayName", "name", "createdAt", "promotedAt", "lastUpdated")
+
+
+def _roster_ref(db):
+	return db.collection(ADMIN_ROSTER_COLLECTION).document(ADMIN_ROSTER_DOCUMENT)
+
+
+def _roster_entry(user_data: dict) -> dict:
+	return {field: user_data[field] for field in _ROSTER_FIELDS if field in user_data}
+
+
+def _is_admin_user(user_data: dict) -> bool:
+	return (user_data.get("role") in ["admin", "super_admin"] or
+			user_data.get("isAdmin") == True or
+			user_data.get("isSuperAdmin") == True)
+
+
+@firestore.transactional
+def _write_admin(transaction, db, user_id: str, user_update_data: dict, created_fields: dict):
+	"""Update users/{user_id} and its roster entry atomically.
+
+	created_fields are added when the user document does not exist yet.
+	"""
+	user_ref = db.collection("users").document(user_id)
+	user_doc = user_ref.get(transaction=transaction)
+	if user_doc.exists:
+		user_data = {**user_doc.to_dict(), **user_update_data}
+		transaction.update(user_ref, user_update_data)
+	else:
+		logger.info(f"Creating new user document for {user_id}")
+		user_data = {**user_update_data, **created_fields}
+		transaction.set(user_ref, user_data)
+	transaction.set(_roster_ref(db), {"members": {user_id: _roster_entry(user_data)}}, merge=True)
+
+
+@firestore.transactional
+def _demote_admin(transaction, db, user_id: str, user_update_data: dict):
+	"""Update users/{user_id} and drop it from the roster atomically."""
+	transaction.update(db.collection("users").document(user_id), user_update_data)
+	transaction.set(_roster_ref(db), {"members": {user_id: firestore.DELETE_FIELD}}, merge=True)
+
+
+@firestore.transactional
+def _bootstrap_roster(transaction, db) -> dict:
+	"""Build the roster from the users collection the first time it is needed.
+
+	Runs three single-field equality queries instead of a collection scan. Reading
+	them in the transaction makes a concurrent add_admin or remove_admin retry
+	after (or before) the bootstrap rather than being overwritten by it.
+	"""
+	roster_ref = _roster_ref(db)
+	roster_doc = roster_ref.get(transaction=transaction)
+	roster = roster_doc.to_dict() if roster_doc.exists else {}
+	if roster.get("bootstrapped"):
+		return roster.get("members") or {}
+
+	users_ref = db.collection("users")
+	members = {}
+	for query in (
+		users_ref.where("role", "in", ["admin", "super_admin"]),
+		users_ref.where("isAdmin", "==", True),
+		users_ref.where("isSuperAdmin", "==", True),
+	):
+		for user_doc in transaction.get(query):
+			user_data = user_doc.to_dict()
+			if _is_admin_user(user_data):
+				members[user_doc.id] = _roster_entry(user_data)
+
+	transaction.set(roster_ref, {"members": members, "bootstrapped": True})
+	logger.info(f"Bootstrapped admin roster with {len(members)} admins")
+	return members
+
+
+def read_admin_roster(db) -> dict:
+	"""Return {uid: roster entry} for every admin, bootstrapping the roster if needed."""
+	roster_doc = _roster_ref(db).get()
+	roster = roster_doc.to_dict() if roster_doc.exists else {}
+	if roster.get("bootstrapped"):
+		return roster.get("members") or {}
+	return _bootstrap_roster(db.transaction(), db)
+
+
+@endpoint(auth="required")
+def check_admin_status(ctx: RequestContext) -> https_fn.Response:
+	"""Check if the authenticated user is an admin or super admin.
+	
+	Expects: POST request with idToken in body
+	Returns: JSON with admin and super admin status
+	"""
+	uid = ctx.uid
+	authz = ctx.authz
+
+	return ctx.json({
+		"userId": uid,
+		"isAdmin": authz.is_admin,
+		"isSuperAdmin": authz.is_super_admin
+	})
+
+
+@endpoint(auth="required")
+def get_all_admins(ctx: RequestContext) -> https_fn.Response:
+	"""Get list of all admin users (super admin only).
+	
+	Expects: POST request with idToken in body
+	Returns: JSON array of admin users with data from Firebase Auth
+	"""
+	if not ctx.authz.is_super_admin:
+		return ctx.error("Only super admin can view admin list", 403)
+
+	# Fetch all admin users from the roster
+	db = firestore.client()
+	admin_docs = list(read_admin_roster(db).items())
+
+	# Fetch user data from Firebase Auth to get the most accurate email and displayName
+	auth_profiles = get_auth_profiles(user_id for user_id, _ in admin_docs)
+
+	admins = []
+	for user_id, user_data in admin_docs:
+		auth_user_data = auth_profiles.get(user_id)
+		
+		# Prioritize Firebase Auth data over Firestore data
+		email = (auth_user_data.get("email") if auth_user_data else None) or user_data.get("email", "N/A")
+		display_name = (auth_user_data.get("displayName") if auth_user_data else None) or user_data.get("displayName") or user_data.get("name", "N/A")
+		
+		# Handle timestamps - determine which field to use for "added" date
+		is_super = user_id == SUPER_ADMIN_UID or user_data.get("isSuperAdmin") == True
+		
+		# For superusers: use createdAt from Auth or Firestore
+		# For regular admins: use promotedAt if available, otherwise createdAt
+		if is_super:
+			added_timestamp = user_data.get("createdAt")
+			# Fallback to Auth creation time if Firestore doesn't have it
+			if not added_timestamp and auth_user_data and auth_user_data.get("createdAt"):
+				added_timestamp = auth_user_data.get("createdAt")
+		else:
+			# For admins, prefer promotedAt over createdAt
+			added_timestamp = user_data.get("promotedAt") or user_data.get("createdAt")
+		
+		last_updated = user_data.get("lastUpdated")
+		promoted_at = user_data.get("promotedAt")
+		
+		# Convert timestamps to milliseconds for JSON serialization
+		added_at = to_millis(added_timestamp)
+		last_updated_ms = to_millis(last_updated)
+		promoted_at_ms = to_millis(promoted_at)
+		
+		admin_entry = {
+			"id": user_id,
+			"email": email,
+			"displayName": display_name,
+			"role": user_data.get("role", "admin"),
+			"isSuperAdmin": is_super,
+			"createdAt": added_at,
+			"lastUpdated": last_updated_ms
+		}
+		
+		# Add promotedAt only for non-superusers
+		if not is_super and promoted_at_ms:
+			admin_entry["promotedAt"] = promoted_at_ms
+		
+		admins.append(admin_entry)
+
+	# Sort: super admin first, then by creation/promotion date
+	admins.sort(key=lambda x: (not x["isSuperAdmin"], -(x.get("createdAt") or 0)))
+
+	return ctx.json({"admins": admins, "total": len(admins)})
+
+
+def _users_missing_field(users_ref, order_field: str, query_direction, after_id, count: int) -> tuple:
+	"""Up to count users without order_field, by document id after after_id.
+
+	Firestore leaves such users out of a query ordered on the field, so they are
+	found by scanning in document id order, at most USERS_MISSING_FIELD_SCAN_LIMIT
+	documents per call.
+
+	Returns:
+		(user documents, next cursor or None when no such user is left)
+	"""
+	query = users_ref.order_by("__name__", direction=query_direction)
+	if after_id is not None:
+		query = query.start_after({"__name__": after_id})
+
+	found = []
+	scanned = 0
+	last_id = after_id
+	for user_doc in query.limit(USERS_MISSING_FIELD_SCAN_LIMIT).stream():
+		scanned += 1
+		if order_field in user_doc.to_dict():
+			last_id = user_doc.id
+			continue
+		if len(found) == count:
+			# One more such user exists: the next page starts after this one's predecessor
+			return found, {"__name__": last_id}
+		found.append(user_doc)
+		last_id = user_doc.id
+
+	if scanned == USERS_MISSING_FIELD_SCAN_LIMIT:
+		return found, {"__name__": last_id}
+	return found, None
+
+
+@endpoint(auth="required")
+def get_all_users(ctx: RequestContext) -> https_fn.Response:
+	"""Get list of all users (admin only).
+	
+	Users are ordered by orderBy, then by document id, so every user appears on
+	exactly one page. Users without the orderBy field come after them, ordered by
+	document id in the same direction; a page of those may come back short (even
+	empty) with hasMore set when the scan limit is reached.
+
+	Expects: POST request with idToken in body, optional pageSize (default 50,
+		max 200), orderBy ("createdAt", "email" or "lastUpdated"; default
+		"createdAt"), direction ("desc" or "asc"; default "desc"), cursor
+		(nextCursor of the previous page) and includeTotal
+	Returns: JSON with users array, hasMore, nextCursor, and total when includeTotal is set
+	"""
+	page_size = get_page_size(ctx.body.get("pageSize"), USERS_DEFAULT_PAGE_SIZE, USERS_MAX_PAGE_SIZE)
+	order_field = ctx.body.get("orderBy") or "createdAt"
+	direction = (ctx.body.get("direction") or "desc").lower()
+	cursor = ctx.body.get("cursor")
+
+	if not ctx.authz.is_admin:
+		return ctx.error("Admin access required", 403)
+
+	if order_field not in USERS_ORDER_FIELDS:
+		return ctx.error(f"orderBy must be one of {', '.join(USERS_ORDER_FIELDS)}", 400)
+	if direction not in ("asc", "desc"):
+		return ctx.error("direction must be asc or desc", 400)
+
+	# The cursor carries the sort values of the previous page's last user. Once
+	# the users with the orderBy field are listed it carries only __name__: the
+	# id of the last user looked at without the field, or None to start there.
+	start_after = None
+	if cursor:
+		try:
+			start_after = decode_cursor(cursor)
+		except ValueError as e:
+			return ctx.error(str(e), 400)
+		if set(start_after) == {"__name__"}:
+			if start_after["__name__"] is not None and not isinstance(start_after["__name__"], str):
+				return ctx.error("Invalid cursor", 400)
+		elif set(start_after) != {order_field, "__name__"} or not isinstance(start_after["__name__"], str):
+			return ctx.error("Cursor does not match orderBy", 400)
+
+	# Fetch users from Firestore
+	db = firestore.client()
+	users_ref = db.collection("users")
+	query_direction = firestore.Query.DESCENDING if direction == "desc" else firestore.Query.ASCENDING
+	next_cursor = None
+	user_docs = []
+
+	if start_after is None or order_field in start_after:
+		query = (
+			users_ref
+			.order_by(order_field, direction=query_direction)
+			.order_by("__name__", direction=query_direction)
+		)
+		if start_after:
+			query = query.start_after(start_after)
+
+		# One extra document tells us whether another page exists
+		user_docs = list(query.limit(page_size + 1).stream())
+		if len(user_docs) > page_size:
+			user_docs = user_docs[:page_size]
+			last = user_docs[-1]
+			next_cursor = {order_field: last.get(order_field), "__name__": last.id}
+		start_after = {"__name__": None}
+
+	if next_cursor is None:
+		missing_docs, next_cursor = _users_missing_field(
+			users_ref, order_field, query_direction, start_after["__name__"], page_size - len(user_docs)
+		)
+		user_docs.extend(missing_docs)
+	has_more = next_cursor is not None
+
+	users = []
+
+	# Fetch user data from Firebase Auth, batched for the whole page
+	auth_profiles = get_auth_profiles(user_doc.id for user_doc in user_docs)
+
+	for user_doc in user_docs:
+		user_data = user_doc.to_dict()
+		user_id = user_doc.id
+		auth_user_data = auth_profiles.get(user_id)
+		
+		# Merge data
+		email = (auth_user_data.get("email") if auth_user_data else None) or user_data.get("email", "N/A")
+		display_name = (auth_user_data.get("displayName") if auth_user_data else None) or user_data.get("displayName") or user_data.get("name", "N/A")
+		
+		user_entry = {
+			"id": user_id,
+			"email": email,
+			"displayName": display_name,
+			**user_data  # Include all Firestore data; timestamps are converted while serializing
+		}
+		
+		users.append(user_entry)
+
+	response_data = {
+		"users": users,
+		"hasMore": has_more,
+		"nextCursor": None
+	}
+	
+	if has_more:
+		response_data["nextCursor"] = encode_cursor(next_cursor)
+
+	# The count aggregation is billed per 1000 index entries, not per document
+	if ctx.body.get("includeTotal"):
+		try:
+			response_data["total"] = users_ref.count(alias="total").get()[0][0].value
+		except Exception as e:
+			logger.warning(f"Failed to count users: {str(e)}")
+			response_data["total"] = None
+
+	# Timestamps are sent as epoch milliseconds
+	return ctx.json(response_data, timestamps="millis")
+
+
+@endpoint(auth="required")
+def add_admin(ctx: RequestContext) -> https_fn.Response:
+	"""Add a user as admin (super admin only).
+	
+	Expects: POST request with idToken and targetUserId in body
+	Returns: Success message
+	"""
+	uid = ctx.uid
+	target_user_id = ctx.body.get("targetUserId") or ctx.body.get("target_user_id")
+	
+	if not target_user_id:
+		return ctx.error("Missing targetUserId", 400)
+
+	if not ctx.authz.is_super_admin:
+		return ctx.error("Only super admin can add new admins", 403)
+
+	# Check if target user is super admin
+	if target_user_id == SUPER_ADMIN_UID:
+		return ctx.error("Cannot modify super admin privileges", 400)
+
+	# Fetch user data from Firebase Auth
+	try:
+		auth_user = admin_auth.get_user(target_user_id)
+		user_email = auth_user.email
+		user_display_name = auth_user.display_name
+		user_created_at = auth_user.user_metadata.creation_timestamp if auth_user.user_metadata else None
+	except Exception as e:
+		logger.error(f"Failed to fetch user from Auth: {str(e)}")
+		return ctx.error("Target user not found in Firebase Auth", 404)
+
+	# Set custom claims for admin access (CRITICAL for Firestore rules)
+	try:
+		custom_claims = {
+			"admin": True,
+			"role": "admin"
+		}
+		admin_auth.set_custom_user_claims(target_user_id, custom_claims)
+		logger.info(f"Custom claims set for user {target_user_id}: {custom_claims}")
+	except Exception as e:
+		logger.error(f"Failed to set custom claims for user {target_user_id}: {str(e)}")
+		return ctx.error(f"Failed to set admin privileges: {str(e)}", 500)
+
+	# Prepare user data with information from Firebase Auth
+	user_update_data = {
+		"role": "admin",
+		"isAdmin": True,
+		"customClaimsSet": True,
+		"lastUpdated": firestore.SERVER_TIMESTAMP,
+		"promotedBy": uid,
+		"promotedAt": firestore.SERVER_TIMESTAMP,
+		# Store email and displayName from Firebase Auth
+		"email": user_email,
+	}
+	
+	# Only add displayName if it exists
+	if user_display_name:
+		user_update_data["displayName"] = user_display_name
+	
+	# Update the user document (creating it with additional fields if missing) and the roster
+	db = firestore.client()
+	_write_admin(db.transaction(), db, target_user_id, user_update_data, {
+		"userId": target_user_id,
+		"createdAt": firestore.SERVER_TIMESTAMP
+	})
+
+	role_cache.invalidate(target_user_id)
+	logger.info(f"User {target_user_id} promoted to admin by super admin {uid}")
+
+	return ctx.json({
+		"success": True,
+		"message": "User successfully promoted to admin. User must sign out and sign back in for changes to take effect.",
+		"userId": target_user_id,
+		"email": user_email,
+		"displayName": user_display_name,
+		"note": "Custom claims have been set - user needs to refresh their session"
+	})
+
+
+@endpoint(auth="required")
+def remove_admin(ctx: RequestContext) -> https_fn.Response:
+	"""Remove admin privileges from a user (super admin only).
+	
+	Expects: POST request with idToken and targetUserId in body
+	Returns: Success message
+	"""
+	uid = ctx.uid
+	target_user_id = ctx.body.get("targetUserId") or ctx.body.get("target_user_id")
+	
+	if not target_user_id:
+		return ctx.error("Missing targetUserId", 400)
+
+	if not ctx.authz.is_super_admin:
+		return ctx.error("Only super admin can remove admins", 403)
+
+	# Prevent removing super admin
+	if target_user_id == SUPER_ADMIN_UID:
+		return ctx.error("Cannot remove super admin privileges", 400)
+
+	# Prevent super admin from removing themselves (redundant but safe)
+	if uid == target_user_id:
+		return ctx.error("Super admin cannot remove their own admin privileges", 400)
+
+	# Check if target user exists
+	db = firestore.client()
+	target_user_ref = db.collection("users").document(target_user_id)
+	target_user_doc = target_user_ref.get()
+	
+	if not target_user_doc.exists:
+		return ctx.error("Target user not found", 404)
+
+	# Remove custom claims (CRITICAL for Firestore rules)
+	try:
+		custom_claims = {
+			"admin": False,
+			"role": "user"
+		}
+		admin_auth.set_custom_user_claims(target_user_id, custom_claims)
+		logger.info(f"Custom claims removed for user {target_user_id}")
+	except Exception as e:
+		logger.error(f"Failed to remove custom claims for user {target_user_id}: {str(e)}")
+		return ctx.error(f"Failed to remove admin privileges: {str(e)}", 500)
+
+	# Remove admin privileges from Firestore and the roster
+	_demote_admin(db.transaction(), db, target_user_id, {
+		"role": "user",
+		"isAdmin": False,
+		"isSuperAdmin": False,
+		"customClaimsSet": False,
+		"lastUpdated": firestore.SERVER_TIMESTAMP,
+		"demotedBy": uid,
+		"demotedAt": firestore.SERVER_TIMESTAMP
+	})
+
+	role_cache.invalidate(target_user_id)
+	logger.info(f"Admin privileges removed from user {target_user_id} by super admin {uid}")
+
+	return ctx.json({
+		"success": True,
+		"message": "Admin privileges successfully removed. User must sign out and sign back in for changes to take effect.",
+		"userId": target_user_id,
+		"note": "Custom claims have been removed - user needs to refresh their session"
+	})
+
+
+@endpoint(cors=PUBLIC_CORS, auth="optional")
+def init_super_admin(ctx: RequestContext) -> https_fn.Response:
+	"""
+	Initialize super admin with custom claims.
+	This should be called ONCE to set up the super admin.
+	
+	Request body: { "secret": "your-secret-key" }
+	"""
+	secret = ctx.body.get("secret")
+	uid = ctx.uid
+	
+	# Allow if user is the super admin UID or has correct secret
+	expected_secret = os.environ.get("SUPER_ADMIN_INIT_SECRET", "konsiyer-super-admin-2025")
+	
+	if uid != SUPER_ADMIN_UID and secret != expected_secret:
+		logger.warning("Unauthorized super admin initialization attempt")
+		return ctx.error("Invalid secret or not super admin", 401)
+	
+	# Fetch user data from Firebase Auth
+	try:
+		auth_user = admin_auth.get_user(SUPER_ADMIN_UID)
+		user_email = auth_user.email
+		user_display_name = auth_user.display_name
+		logger.info(f"Fetched super admin data from Auth: {user_email}, {user_display_name}")
+	except Exception as e:
+		logger.error(f"Failed to fetch super admin from Auth: {str(e)}")
+		return ctx.error(f"Super admin user not found in Firebase Auth: {str(e)}", 404)
+	
+	# Set custom claims for super admin
+	logger.info(f"Setting custom claims for super admin: {SUPER_ADMIN_UID}")
+	
+	custom_claims = {
+		"superAdmin": True,
+		"admin": True,
+		"role": "super_admin"
+	}
+	
+	admin_auth.set_custom_user_claims(SUPER_ADMIN_UID, custom_claims)
+	
+	# Also update Firestore for record keeping with data from Firebase Auth
+	db = firestore.client()
+	
+	user_data = {
+		"role": "super_admin",
+		"isSuperAdmin": True,
+		"isAdmin": True,
+		"customClaimsSet": True,
+		"lastUpdated": firestore.SERVER_TIMESTAMP,
+		"email": user_email,
+	}
+	
+	# Only add displayName if it exists
+	if user_display_name:
+		user_data["displayName"] = user_display_name
+	
+	# createdAt and userId are only added if the user doc does not exist yet
+	_write_admin(db.transaction(), db, SUPER_ADMIN_UID, user_data, {
+		"createdAt": firestore.SERVER_TIMESTAMP,
+		"userId": SUPER_ADMIN_UID
+	})
+	
+	role_cache.invalidate(SUPER_ADMIN_UID)
+	logger.info(f"Super admin initialized successfully: {SUPER_ADMIN_UID}")
+	
+	return ctx.json({
+		"success": True,
+		"message": "Super admin initialized successfully",
+		"userId": SUPER_ADMIN_UID,
+		"email": user_email,
+		"displayName": user_display_name,
+		"customClaims": custom_claims,
+		"note": "User must sign out and sign back in for changes to take effect"
+	})
+
+
+@endpoint(auth="required")
+def get_runtime_stats(ctx: RequestContext) -> https_fn.Response:
+	"""Return the counters of every subsystem loaded on this instance (admin only).
+
+	Each deployed function runs on its own instances, so this reports the
+	get_runtime_stats instances only; every instance also logs the same snapshot
+	as a runtime_stats line every few minutes.
+
+	Expects: POST request with idToken in body
+	Returns: JSON object with one section per registered subsystem
+	"""
+	if not ctx.authz.is_admin:
+		return ctx.error("Admin access required", 403)
+
+	return ctx.json(collect_stats())
@@ -0,0 +1,194 @@
+"""Affiliate statistics read from the external project: fetch_affiliate_stats."""
+
+from firebase_functions import https_fn
+from firebase_admin import firestore
+
+from handlers.common import logger, get_page_size, encode_cursor, decode_cursor
+from handlers.external import get_external_firebase_client
+from handlers.pipeline import RequestContext, endpoint
+from handlers.serialization import dumps
+
+# Page sizes for the checkout event listing
+AFFILIATE_DEFAULT_PAGE_SIZE = 500
+AFFILIATE_MAX_PAGE_SIZE = 1000
+
+# Events read per query (and sent per chunk) by the NDJSON streaming mode
+AFFILIATE_STREAM_CHUNK_SIZE = 500
+
+
+def _stream_checkout_events(query, checkout_query, summary: dict, resumed: bool):
+	"""Yield NDJSON chunks: one {"event": ...} line per event, then a {"summary": ...} trailer.
+
+	The query is read AFFILIATE_STREAM_CHUNK_SIZE events at a time, resuming after
+	the last snapshot of the previous chunk, so at most one chunk is held in memory
+	and no single query stays open for the whole transfer.
+	"""
+	streamed = 0
+	last = None
+	try:
+		while True:
+			chunk_query = query.start_after(last) if last is not None else query
+			snapshots = list(chunk_query.limit(AFFILIATE_STREAM_CHUNK_SIZE).stream())
+			if not snapshots:
+				break
+			lines = []
+			for snapshot in snapshots:
+				event = snapshot.to_dict()
+				event["event_id"] = snapshot.id
+				lines.append(dumps({"event": event}))
+			streamed += len(snapshots)
+			last = snapshots[-1]
+			yield "\n".join(lines) + "\n"
+			if len(snapshots) < AFFILIATE_STREAM_CHUNK_SIZE:
+				break
+	except Exception as e:
+		# The 200 status is already sent; report the failure in the trailer instead
+		logger.exception(f"Failed to stream checkout events for {summary['shop_name']}")
+		yield dumps({"summary": {**summary, "streamed_events": streamed, "complete": False, "error": str(e)}}) + "\n"
+		return
+
+	# Streaming from the first event counted everything; a resumed stream needs the aggregation
+	total = streamed
+	if resumed:
+		try:
+			total = checkout_query.count(alias="total").get()[0][0].value
+		except Exception as e:
+			logger.warning(f"Failed to count checkout events for {summary['shop_name']}: {str(e)}")
+			total = None
+	yield dumps({"summary": {**summary, "streamed_events": streamed, "total_checkout_events": total, "complete": True}}) + "\n"
+
+
+@endpoint(auth="required")
+def fetch_affiliate_stats(ctx: RequestContext) -> https_fn.Response:
+	"""Fetch affiliate stats from external Firebase project for the authenticated user's shop.
+	
+	Events are filtered on eventType and ordered newest first by Firestore (see the
+	events index in firestore.indexes.json), so only one page is read per call.
+	Events without a timestamp field are not listed.
+
+	Expects:
+		POST request with idToken in body, optional pageSize (default 500, max 1000),
+		cursor (next_cursor of the previous page), select (list of event fields
+		to return; timestamp is always included) and format ("json" or "ndjson").
+	Returns:
+		JSON with affiliate stats data for the user's verified shop only: one page of
+		events plus next_cursor/has_more, and total_checkout_events for all pages.
+		With format "ndjson", every event from cursor on (or from the newest) is
+		streamed as an application/x-ndjson body of {"event": {...}} lines ending
+		with a {"summary": {...}} trailer that carries the shop names,
+		streamed_events, total_checkout_events and complete (false plus error
+		if reading stopped midway).
+	"""
+	response_format = ctx.body.get("format") or "json"
+	if response_format not in ("json", "ndjson"):
+		return ctx.error("format must be json or ndjson", 400)
+
+	page_size = get_page_size(ctx.body.get("pageSize"), AFFILIATE_DEFAULT_PAGE_SIZE, AFFILIATE_MAX_PAGE_SIZE)
+	cursor = ctx.body.get("cursor")
+	select = ctx.body.get("select")
+
+	if select is not None and (not isinstance(select, list) or not all(isinstance(f, str) and f for f in select)):
+		return ctx.error("select must be a list of field names", 400)
+
+	# The cursor carries the timestamp and document id of the previous page's last event
+	start_after = None
+	if cursor:
+		try:
+			start_after = decode_cursor(cursor)
+		except ValueError as e:
+			return ctx.error(str(e), 400)
+		if set(start_after) != {"timestamp", "__name__"}:
+			return ctx.error("Cursor does not match the events order", 400)
+		event_id = start_after["__name__"]
+		if not isinstance(event_id, str) or not event_id or "/" in event_id:
+			return ctx.error("Invalid cursor", 400)
+
+	uid = ctx.uid
+
+	# Get user's shop info
+	db = firestore.client()
+	user_doc = db.collection("users").document(uid).get()
+	if not user_doc.exists:
+		return ctx.error("User not found", 404)
+
+	user_data = user_doc.to_dict()
+	user_shop = user_data.get("shop")
+
+	# Fallback: find verified shop in subcollection
+	if not user_shop:
+		shops_ref = db.collection("users").document(uid).collection("shops")
+		verified_shops = list(shops_ref.where("verified", "==", True).limit(1).stream())
+		if verified_shops:
+			user_shop = verified_shops[0].id
+		else:
+			return ctx.error("No verified shop found for user", 403)
+
+	if not user_data.get("verified", False):
+		return ctx.error("Shop not verified for user", 403)
+
+	# Extract shop name
+	shop_name = user_shop.replace(".myshopify.com", "") if user_shop else None
+	if not shop_name:
+		return ctx.error("Invalid shop name", 400)
+
+	# Connect to external Firebase project
+	external_db = get_external_firebase_client()
+	events_ref = external_db.collection("pixel_events").document(shop_name).collection("events")
+	checkout_query = events_ref.where("eventType", "==", "checkout_completed")
+
+	query = (
+		checkout_query
+		.order_by("timestamp", direction=firestore.Query.DESCENDING)
+		.order_by("__name__", direction=firestore.Query.DESCENDING)
+	)
+	if select:
+		query = query.select(list(dict.fromkeys(select + ["timestamp"])))
+	if start_after:
+		query = query.start_after(start_after)
+
+	if response_format == "ndjson":
+		summary = {"shop_name": shop_name, "shop_full_name": f"{shop_name}.myshopify.com"}
+		return ctx.stream(
+			_stream_checkout_events(query, checkout_query, summary, resumed=start_after is not None),
+			"application/x-ndjson"
+		)
+
+	try:
+		# One extra document tells us whether another page exists
+		snapshots = list(query.limit(page_size + 1).stream())
+	except Exception as e:
+		return ctx.error(f"Failed to access events: {str(e)}", 500)
+
+	has_more = len(snapshots) > page_size
+	snapshots = snapshots[:page_size]
+
+	events = []
+	for snapshot in snapshots:
+		event = snapshot.to_dict()
+		event["event_id"] = snapshot.id
+		events.append(event)
+
+	next_cursor = None
+	if has_more:
+		last = snapshots[-1]
+		next_cursor = encode_cursor({"timestamp": last.get("timestamp"), "__name__": last.id})
+
+	# The count aggregation is billed per 1000 index entries, not per document
+	total = None
+	try:
+		total = checkout_query.count(alias="total").get()[0][0].value
+	except Exception as e:
+		logger.warning(f"Failed to count checkout events for {shop_name}: {str(e)}")
+
+	# Prepare response
+	shop_stats = {
+		"shop_name": shop_name,
+		"shop_full_name": f"{shop_name}.myshopify.com",
+		"total_checkout_events": total if total is not None else len(events),
+		"events": events,
+		"page_size": page_size,
+		"has_more": has_more,
+		"next_cursor": next_cursor,
+	}
+
+	return ctx.json(shop_stats)
@@ -0,0 +1,283 @@
+"""ID token verification and admin authorization shared by the authenticated endpoints."""
+
+from firebase_admin import auth as admin_auth, firestore
+
+import os
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from handlers.common import logger, register_stats
+
+
+class VerifiedTokenCache:
+	"""Per-instance, thread-safe LRU cache of verified Firebase ID tokens.
+
+	Entries are keyed by a SHA-256 digest of the raw token (the token itself is never
+	kept in memory) and are served only until the token's ``exp`` claim passes.
+	Entries verified with ``check_revoked=True`` are re-checked against Firebase Auth
+	once they are older than ``revocation_recheck_seconds``; entries verified without
+	it never satisfy a revocation-checked lookup. Failed verifications are not cached.
+	"""
+
+	def __init__(self, max_entries: int = 1024, revocation_recheck_seconds: int = 300):
+		self._max_entries = max_entries
+		self._revocation_recheck_seconds = revocation_recheck_seconds
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.expirations = 0
+
+	def verify(self, id_token: str, check_revoked: bool = False) -> dict:
+		"""Return the decoded claims for id_token, verifying it only on a cache miss.
+
+		Raises whatever admin_auth.verify_id_token raises for invalid tokens.
+		"""
+		key = hashlib.sha256(id_token.encode()).digest()
+		now = time.time()
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				decoded, expires_at, revocation_checked_at = entry
+				if now >= expires_at:
+					del self._entries[key]
+					self.expirations += 1
+				elif not check_revoked or (
+					revocation_checked_at is not None
+					and now - revocation_checked_at < self._revocation_recheck_seconds
+				):
+					self._entries.move_to_end(key)
+					self.hits += 1
+					return dict(decoded)
+			self.misses += 1
+
+		decoded = admin_auth.verify_id_token(id_token, check_revoked=check_revoked)
+		expires_at = decoded.get("exp")
+		if not expires_at:
+			return decoded
+
+		with self._lock:
+			self._entries[key] = (dict(decoded), float(expires_at), now if check_revoked else None)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self._max_entries:
+				self._entries.popitem(last=False)
+				self.evictions += 1
+		return decoded
+
+	def invalidate_uid(self, uid: str) -> int:
+		"""Drop every cached token belonging to uid (e.g. after revoking its sessions)."""
+		with self._lock:
+			stale = [key for key, entry in self._entries.items() if entry[0].get("uid") == uid]
+			for key in stale:
+				del self._entries[key]
+		return len(stale)
+
+	def stats(self) -> dict:
+		"""Snapshot of the cache counters."""
+		with self._lock:
+			lookups = self.hits + self.misses
+			return {
+				"size": len(self._entries),
+				"max_entries": self._max_entries,
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"expirations": self.expirations,
+				"hit_ratio": (self.hits / lookups) if lookups else 0.0,
+			}
+
+
+id_token_cache = VerifiedTokenCache(
+	max_entries=int(os.environ.get("ID_TOKEN_CACHE_SIZE", "1024")),
+)
+register_stats("id_token_cache", id_token_cache.stats)
+
+
+def verify_id_token(id_token: str, check_revoked: bool = False) -> dict:
+	"""Verify a Firebase ID token through the per-instance verified-token cache."""
+	return id_token_cache.verify(id_token, check_revoked=check_revoked)
+
+
+# Super Admin UID - This user has exclusive privileges to manage admins
+SUPER_ADMIN_UID = "GoWdiwdj6zUtlH6cZo2wla9GpYB2"
+
+
+# How long a role read from users/{uid} stays cached: regular users, and admins.
+# An admin entry bounds how long a demotion made on another instance goes unseen.
+ROLE_CACHE_TTL_SECONDS = 60
+ADMIN_ROLE_CACHE_TTL_SECONDS = 30
+
+
+class Authorization:
+	"""Authorization decision for a single request.
+
+	Built once per request by authorize() and reused by the handler for every
+	privilege check, so a request never reads the caller's user document twice.
+	"""
+
+	__slots__ = ("uid", "is_admin", "is_super_admin", "source")
+
+	def __init__(self, uid: str, is_admin: bool, is_super_admin: bool, source: str):
+		self.uid = uid
+		self.is_admin = is_admin
+		self.is_super_admin = is_super_admin
+		self.source = source  # "claims", "cache" or "firestore"
+
+
+class RoleCache:
+	"""Short-TTL, per-instance cache of roles read from users/{uid}.
+
+	Admin results expire after admin_ttl_seconds, regular-user results after
+	ttl_seconds. A stale entry can delay a promotion or a demotion made on another
+	instance by up to its TTL. add_admin, remove_admin and init_super_admin call
+	invalidate() so the change is seen at once on their own instance.
+	"""
+
+	def __init__(self, ttl_seconds: int = ROLE_CACHE_TTL_SECONDS,
+				 admin_ttl_seconds: int = ADMIN_ROLE_CACHE_TTL_SECONDS, max_entries: int = 512):
+		self._ttl_seconds = ttl_seconds
+		self._admin_ttl_seconds = admin_ttl_seconds
+		self._max_entries = max_entries
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, uid: str):
+		"""Return (is_admin, is_super_admin) for uid, or None if absent or expired."""
+		with self._lock:
+			entry = self._entries.get(uid)
+			if entry is None:
+				return None
+			is_admin, is_super_admin, cached_at = entry
+			ttl_seconds = self._admin_ttl_seconds if is_admin or is_super_admin else self._ttl_seconds
+			if time.time() - cached_at >= ttl_seconds:
+				del self._entries[uid]
+				return None
+			return is_admin, is_super_admin
+
+	def put(self, uid: str, is_admin: bool, is_super_admin: bool):
+		with self._lock:
+			self._entries[uid] = (is_admin, is_super_admin, time.time())
+			self._entries.move_to_end(uid)
+			while len(self._entries) > self._max_entries:
+				self._entries.popitem(last=False)
+
+	def invalidate(self, uid: str):
+		"""Forget the cached role for uid."""
+		with self._lock:
+			self._entries.pop(uid, None)
+
+	def clear(self):
+		"""Forget every cached role."""
+		with self._lock:
+			self._entries.clear()
+
+
+role_cache = RoleCache()
+
+
+def _roles_from_user_data(uid: str, user_data: dict):
+	"""Derive (is_admin, is_super_admin) from a users/{uid} document."""
+	is_super_admin = uid == SUPER_ADMIN_UID and (
+		user_data.get("role") == "super_admin" or user_data.get("isSuperAdmin") == True
+	)
+	is_admin = (user_data.get("role") in ["admin", "super_admin"] or
+				user_data.get("isAdmin") == True or
+				user_data.get("isSuperAdmin") == True)
+	return is_admin, is_super_admin
+
+
+def authorize(decoded: dict) -> Authorization:
+	"""Build the authorization decision for a verified ID token.
+
+	Custom claims (admin, superAdmin, role) set by add_admin/remove_admin/init_super_admin
+	settle regular users without a read. Claims granting admin rights are confirmed
+	against users/{uid}, since an ID token keeps its claims for up to an hour after
+	remove_admin. That result, like the role of a token without role claims, comes
+	from the role cache while its entry is fresh.
+
+	Args:
+		decoded: Claims returned by verify_id_token
+
+	Returns:
+		An Authorization; on Firestore errors the caller is treated as a regular user
+	"""
+	uid = decoded.get("uid")
+	if not uid:
+		return Authorization(uid, False, False, "claims")
+
+	has_role_claims = any(claim in decoded for claim in ("role", "admin", "superAdmin"))
+	if has_role_claims:
+		claimed_admin, claimed_super_admin = _roles_from_user_data(uid, {
+			"role": decoded.get("role"),
+			"isAdmin": decoded.get("admin"),
+			"isSuperAdmin": decoded.get("superAdmin"),
+		})
+		if not claimed_admin and not claimed_super_admin:
+			return Authorization(uid, False, False, "claims")
+
+	cached = role_cache.get(uid)
+	if cached is not None:
+		return Authorization(uid, *cached, "cache")
+
+	try:
+		db = firestore.client()
+		user_doc = db.collection("users").document(uid).get()
+		user_data = user_doc.to_dict() if user_doc.exists else {}
+	except Exception as e:
+		logger.error(f"Error checking admin status: {str(e)}")
+		return Authorization(uid, False, False, "firestore")
+
+	is_admin, is_super_admin = _roles_from_user_data(uid, user_data)
+	role_cache.put(uid, is_admin, is_super_admin)
+	return Authorization(uid, is_admin, is_super_admin, "firestore")
+
+
+# Firebase Auth's batch lookup accepts at most 100 identifiers per call
+AUTH_LOOKUP_BATCH_SIZE = 100
+
+# Batch lookups in flight at once per instance, shared by every request
+AUTH_LOOKUP_WORKERS = 4
+
+_auth_lookup_executor = ThreadPoolExecutor(max_workers=AUTH_LOOKUP_WORKERS, thread_name_prefix="auth-lookup")
+
+
+def _lookup_auth_profiles(uids: list) -> dict:
+	profiles = {}
+	try:
+		result = admin_auth.get_users([admin_auth.UidIdentifier(uid) for uid in uids])
+	except Exception as e:
+		logger.warning(f"Could not fetch Auth data for {len(uids)} users: {str(e)}")
+		return profiles
+	for auth_user in result.users:
+		profiles[auth_user.uid] = {
+			"email": auth_user.email,
+			"displayName": auth_user.display_name,
+			"createdAt": auth_user.user_metadata.creation_timestamp if auth_user.user_metadata else None
+		}
+	if result.not_found:
+		logger.warning(f"No Auth user for {len(result.not_found)} of {len(uids)} users")
+	return profiles
+
+
+def get_auth_profiles(uids) -> dict:
+	"""Fetch Firebase Auth profiles for many users with batched, concurrent lookups.
+
+	Args:
+		uids: User ids; duplicates are looked up once
+
+	Returns:
+		{uid: {"email", "displayName", "createdAt"}} for the users found in Firebase
+		Auth. Users that do not exist, or whose batch failed, are left out.
+	"""
+	uids = list(dict.fromkeys(uids))
+	chunks = [uids[i:i + AUTH_LOOKUP_BATCH_SIZE] for i in range(0, len(uids), AUTH_LOOKUP_BATCH_SIZE)]
+	if len(chunks) <= 1:
+		return _lookup_auth_profiles(chunks[0]) if chunks else {}
+	profiles = {}
+	for chunk_profiles in _auth_lookup_executor.map(_lookup_auth_profiles, chunks):
+		profiles.update(chunk_profiles)
+	return profiles
@@ -0,0 +1,429 @@
+"""Checkout tracking for the Ikas platform: track_checkout, track_checkout_batch."""
+
+from firebase_functions import https_fn
+from firebase_admin import firestore
+
+from google.api_core import exceptions as google_exceptions
+
+import os
+import re
+
+from handlers.common import logger, CREDENTIALS_CORS
+from handlers.counters import counter_increment, counters, shard_ref, shop_summary_ref, shop_summary_update
+from handlers.pipeline import RequestContext, endpoint
+from handlers.rollups import event_day, rollup_increment, rollup_increments, rollup_ref
+from handlers.write_behind import WriteBehindBuffer
+
+_AFFILIATION_UNSAFE_RE = re.compile(r'[^a-z0-9\-.]')
+
+# transaction_id becomes the event's document id, so it must be a valid one:
+# no "/", not "." or "..", not reserved like "__name__", at most 1500 bytes
+_RESERVED_DOC_ID_RE = re.compile(r'^__.*__$', re.DOTALL)
+_DOC_ID_MAX_BYTES = 1500
+
+# Most events track_checkout_batch accepts per request
+CHECKOUT_BATCH_MAX_EVENTS = 2000
+
+# Firestore allows at most 500 writes per commit, and get_all is chunked the same way
+_BATCH_WRITE_LIMIT = 500
+
+# Optional write-behind mode: track_checkout acknowledges after validation and queues
+# the event; queued events are bulk written every CHECKOUT_FLUSH_EVENTS events or
+# CHECKOUT_FLUSH_MAX_AGE_MS (the durability window), whichever comes first
+CHECKOUT_WRITE_BEHIND = os.environ.get("CHECKOUT_WRITE_BEHIND", "").lower() in ("1", "true", "yes")
+CHECKOUT_BUFFER_MAX_EVENTS = int(os.environ.get("CHECKOUT_BUFFER_MAX_EVENTS", "2000"))
+CHECKOUT_FLUSH_EVENTS = int(os.environ.get("CHECKOUT_FLUSH_EVENTS", "200"))
+CHECKOUT_FLUSH_MAX_AGE_MS = int(os.environ.get("CHECKOUT_FLUSH_MAX_AGE_MS", "1000"))
+
+
+def parse_checkout(payload) -> tuple:
+	"""Validate one checkout payload and build the event document.
+
+	Returns:
+		(shop_doc_id, event_data)
+
+	Raises:
+		ValueError: With the message returned to the client when the payload is invalid
+	"""
+	if not isinstance(payload, dict):
+		raise ValueError("Checkout payload must be an object")
+
+	# Extract required fields
+	kons_ref = payload.get("kons_ref")
+	timestamp = payload.get("timestamp")
+	page = payload.get("page")
+	ecommerce = payload.get("ecommerce")
+
+	# Validate required fields
+	if not ecommerce or not isinstance(ecommerce, dict):
+		raise ValueError("Missing or invalid ecommerce data")
+
+	# Extract shop affiliation (used as document name)
+	affiliation = ecommerce.get("affiliation")
+	if not affiliation or not isinstance(affiliation, str):
+		raise ValueError("Missing shop affiliation")
+
+	# Sanitize affiliation for use as document ID (remove special chars, lowercase)
+	shop_doc_id = _AFFILIATION_UNSAFE_RE.sub('', affiliation.lower())
+	if not shop_doc_id.strip("."):
+		raise ValueError("Invalid shop affiliation")
+	
+	# Extract transaction details
+	transaction_id = ecommerce.get("transaction_id")
+	if not transaction_id:
+		raise ValueError("Missing transaction_id")
+	if not isinstance(transaction_id, str):
+		raise ValueError("transaction_id must be a string")
+	if (
+		"/" in transaction_id
+		or transaction_id in (".", "..")
+		or _RESERVED_DOC_ID_RE.match(transaction_id)
+		or len(transaction_id.encode("utf-8")) > _DOC_ID_MAX_BYTES
+	):
+		raise ValueError("Invalid transaction_id")
+
+	customer = ecommerce.get("customer") or {}
+
+	# Prepare event data
+	event_data = {
+		"kons_ref": kons_ref,
+		"timestamp": timestamp,
+		"page": page,
+		"ecommerce": ecommerce,
+		"transaction_id": transaction_id,
+		"affiliation": affiliation,
+		"value": ecommerce.get("value"),
+		"currency": ecommerce.get("currency"),
+		"items_count": len(ecommerce.get("items") or []),
+		"customer_email": customer.get("email"),
+		"customer_id": customer.get("id"),
+		"received_at": firestore.SERVER_TIMESTAMP,
+		"event_type": "checkout_completed"
+	}
+	return shop_doc_id, event_data
+
+
+def checkout_writes(db, shop_doc_id: str, event_data: dict) -> list:
+	"""The writes recording one checkout event, as (method, reference, data, options) tuples.
+
+	The event document is created (failing if it exists) so a replayed transaction
+	aborts the whole commit, together with the event counter and daily rollup
+	increments that would otherwise be double counted. Both increments go to one
+	randomly picked shard so a busy shop's writes are spread over several documents.
+	The summary document is only included when counters.claim_summary_write() allows
+	it; callers release the claim if the commit fails.
+	"""
+	event_doc_ref = _event_ref(db, shop_doc_id, event_data)
+	day = event_day(event_data.get("timestamp"))
+	shard = counters.pick_shard(db, shop_doc_id)
+	writes = [
+		("create", event_doc_ref, event_data, {}),
+		("set", shard_ref(db, shop_doc_id, shard), counter_increment(event_data.get("affiliation")), {"merge": True}),
+		# Fold the event into its day's rollup for the dashboards
+		("set", rollup_ref(db, shop_doc_id, day, shard), rollup_increment(event_data, day), {"merge": True}),
+	]
+	if counters.claim_summary_write(shop_doc_id):
+		writes.append(("set", shop_summary_ref(db, shop_doc_id), shop_summary_update(event_data.get("affiliation")), {"merge": True}))
+	return writes
+
+
+def record_checkout(db, shop_doc_id: str, event_data: dict) -> bool:
+	"""Write a checkout event, the counter shard and the rollup in a single commit.
+
+	Using the transaction_id as the event document id with create() makes the write
+	idempotent: concurrent or replayed beacons for the same transaction fail with
+	AlreadyExists and change nothing.
+
+	Returns:
+		True if the event was recorded, False if it already existed
+	"""
+	batch = db.batch()
+	for method, reference, data, options in checkout_writes(db, shop_doc_id, event_data):
+		getattr(batch, method)(reference, data, **options)
+	try:
+		batch.commit()
+	except google_exceptions.AlreadyExists:
+		counters.release_summary_write(shop_doc_id)
+		return False
+	except Exception:
+		counters.release_summary_write(shop_doc_id)
+		raise
+	return True
+
+
+@endpoint(cors=CREDENTIALS_CORS)
+def track_checkout(ctx: RequestContext) -> https_fn.Response:
+	"""Track successful checkout completions from Ikas stores.
+	
+	Receives checkout data including affiliate reference, ecommerce details, and customer info.
+	Stores the event in Firestore under shops_events/{shop_affiliation}/events/{event_id}.
+	
+	Expected payload:
+	{
+		"kons_ref": "affiliate_reference_code",  # Can be null
+		"timestamp": "2025-11-03T15:07:25.103Z",
+		"page": "https://shop.ikas.shop/checkout?id=xxx&step=success",
+		"ecommerce": {
+			"transaction_id": "1011",
+			"affiliation": "dev-alfreya.ikas.shop",
+			"value": "18",
+			"tax": "3",
+			"shipping": "0",
+			"currency": "TRY",
+			"coupon": null,
+			"items": [...],
+			"customer": {...}
+		}
+	}
+	
+	Returns: JSON success response; 202 with queued: true when CHECKOUT_WRITE_BEHIND
+	is enabled and the event was queued instead of written
+	"""
+	try:
+		shop_doc_id, event_data = parse_checkout(ctx.body)
+	except ValueError as e:
+		logger.warning(f"Rejected checkout event: {str(e)}")
+		return ctx.error(str(e), 400)
+
+	transaction_id = event_data["transaction_id"]
+	affiliation = event_data["affiliation"]
+	kons_ref = event_data["kons_ref"]
+
+	# In write-behind mode acknowledge once queued; a full buffer falls through to a
+	# synchronous write, which slows callers down instead of dropping events
+	if checkout_buffer is not None and checkout_buffer.offer((shop_doc_id, event_data)):
+		return ctx.json({
+			"success": True,
+			"message": "Checkout event accepted",
+			"transaction_id": transaction_id,
+			"shop": affiliation,
+			"kons_ref": kons_ref,
+			"event_id": transaction_id,
+			"queued": True
+		}, status=202)
+
+	# Store in Firestore
+	db = firestore.client()
+	
+	# Structure: shops_events/{shop_affiliation}/events/{transaction_id}
+	if not record_checkout(db, shop_doc_id, event_data):
+		logger.info(f"Transaction {transaction_id} already recorded for {shop_doc_id}")
+		return ctx.json({
+			"success": True,
+			"message": "Transaction already recorded",
+			"transaction_id": transaction_id,
+			"shop": affiliation,
+			"duplicate": True
+		})
+	
+	logger.info(f"Successfully tracked checkout for {shop_doc_id}, transaction: {transaction_id}, kons_ref: {kons_ref}")
+
+	return ctx.json({
+		"success": True,
+		"message": "Checkout event tracked successfully",
+		"transaction_id": transaction_id,
+		"shop": affiliation,
+		"kons_ref": kons_ref,
+		"event_id": transaction_id
+	})
+
+
+def _batch_commits(items: list) -> list:
+	"""Split new (index, shop_doc_id, event_data) items into commits of at most 500 writes.
+
+	Every commit holds one create per event plus a counter and a summary merge per
+	shop and one rollup merge per shop and day, so each chunk is sized with those
+	counted in.
+	"""
+	chunks = []
+	chunk, shops, days = [], set(), set()
+	for item in items:
+		_, shop_doc_id, event_data = item
+		day_key = (shop_doc_id, event_day(event_data.get("timestamp")))
+		writes = len(chunk) + 2 * len(shops | {shop_doc_id}) + len(days | {day_key}) + 1
+		if chunk and writes > _BATCH_WRITE_LIMIT:
+			chunks.append(chunk)
+			chunk, shops, days = [], set(), set()
+		chunk.append(item)
+		shops.add(shop_doc_id)
+		days.add(day_key)
+	if chunk:
+		chunks.append(chunk)
+	return chunks
+
+
+def _event_ref(db, shop_doc_id: str, event_data: dict):
+	return db.collection("shops_events").document(shop_doc_id).collection("events").document(event_data["transaction_id"])
+
+
+def _aggregate_writes(db, recorded) -> list:
+	"""Counter, summary and rollup merges for (shop_doc_id, event_data) pairs, one per shop and per day.
+
+	Each shop's aggregated increments go to one randomly picked shard, and the
+	summary merge is included like checkout_writes() includes it.
+	"""
+	by_shop = {}
+	for shop_doc_id, event_data in recorded:
+		by_shop.setdefault(shop_doc_id, []).append(event_data)
+	writes = []
+	for shop_doc_id, events in by_shop.items():
+		shard = counters.pick_shard(db, shop_doc_id)
+		affiliation = events[-1].get("affiliation")
+		writes.append((shard_ref(db, shop_doc_id, shard), counter_increment(affiliation, len(events))))
+		if counters.claim_summary_write(shop_doc_id):
+			writes.append((shop_summary_ref(db, shop_doc_id), shop_summary_update(affiliation)))
+		for day, update in rollup_increments(events).items():
+			writes.append((rollup_ref(db, shop_doc_id, day, shard), update))
+	return writes
+
+
+def _commit_checkouts(db, chunk: list):
+	"""Create every event of chunk and apply the aggregated counter and rollup increments in one commit."""
+	batch = db.batch()
+	for _, shop_doc_id, event_data in chunk:
+		batch.create(_event_ref(db, shop_doc_id, event_data), event_data)
+	for reference, update in _aggregate_writes(db, [(shop_doc_id, event_data) for _, shop_doc_id, event_data in chunk]):
+		batch.set(reference, update, merge=True)
+	try:
+		batch.commit()
+	except Exception:
+		for shop_doc_id in {shop_doc_id for _, shop_doc_id, _ in chunk}:
+			counters.release_summary_write(shop_doc_id)
+		raise
+
+
+def _record_checkouts(db, candidates: list) -> list:
+	"""Record (index, shop_doc_id, event_data) items with distinct transactions.
+
+	Transactions already stored are duplicates, one get_all round trip per chunk. The
+	rest are committed in chunks of at most 500 writes, each event's create in the
+	same commit as the counter and rollup increments counting it, so an event is
+	never stored without being counted or counted without being stored.
+
+	Returns:
+		(item, status, error) per item, status "recorded", "duplicate" or "error"
+	"""
+	outcomes = []
+	new_items = []
+	for start in range(0, len(candidates), _BATCH_WRITE_LIMIT):
+		chunk = candidates[start:start + _BATCH_WRITE_LIMIT]
+		refs = [_event_ref(db, shop_doc_id, event_data) for _, shop_doc_id, event_data in chunk]
+		existing = {snapshot.reference.path for snapshot in db.get_all(refs) if snapshot.exists}
+		for item, ref in zip(chunk, refs):
+			if ref.path in existing:
+				outcomes.append((item, "duplicate", None))
+			else:
+				new_items.append(item)
+
+	for chunk in _batch_commits(new_items):
+		try:
+			_commit_checkouts(db, chunk)
+			outcomes.extend((item, "recorded", None) for item in chunk)
+		except google_exceptions.AlreadyExists:
+			# Another request recorded one of these since get_all; fall back to one commit per event
+			outcomes.extend(
+				(item, "recorded" if record_checkout(db, item[1], item[2]) else "duplicate", None)
+				for item in chunk
+			)
+		except Exception as e:
+			logger.exception("Failed to commit checkout batch")
+			outcomes.extend((item, "error", str(e)) for item in chunk)
+	return outcomes
+
+
+def _bulk_write_checkouts(items: list) -> dict:
+	"""Flush queued (shop_doc_id, event_data) pairs.
+
+	A transaction queued twice in one flush is written once; the repeats are
+	reported as duplicates, like transactions already stored.
+	"""
+	db = firestore.client()
+	seen = set()
+	candidates = []
+	outcome = {"written": 0, "duplicates": 0, "failed": 0}
+	for shop_doc_id, event_data in items:
+		path = _event_ref(db, shop_doc_id, event_data).path
+		if path in seen:
+			outcome["duplicates"] += 1
+			continue
+		seen.add(path)
+		candidates.append((len(candidates), shop_doc_id, event_data))
+
+	counted_as = {"recorded": "written", "duplicate": "duplicates", "error": "failed"}
+	for item, status, error in _record_checkouts(db, candidates):
+		outcome[counted_as[status]] += 1
+		if error is not None:
+			logger.error(f"Dropping buffered checkout {item[2]['transaction_id']} for {item[1]}: {error}")
+	return outcome
+
+
+checkout_buffer = None
+if CHECKOUT_WRITE_BEHIND:
+	checkout_buffer = WriteBehindBuffer(
+		"checkout_buffer",
+		_bulk_write_checkouts,
+		max_items=CHECKOUT_BUFFER_MAX_EVENTS,
+		flush_items=CHECKOUT_FLUSH_EVENTS,
+		max_age_seconds=CHECKOUT_FLUSH_MAX_AGE_MS / 1000,
+	)
+
+
+@endpoint(cors=CREDENTIALS_CORS)
+def track_checkout_batch(ctx: RequestContext) -> https_fn.Response:
+	"""Track many checkout completions from Ikas stores in one request.
+
+	For replays, backfills and storefront scripts that queue events offline. Each
+	payload uses the track_checkout schema. Payloads repeating a transaction_id
+	already seen in the batch or already stored are reported as duplicates and
+	not counted again. New events are written with batched commits of up to 500
+	writes.
+
+	Expected payload:
+	{
+		"events": [<track_checkout payload>, ...]  # at most 2000
+	}
+
+	Returns: JSON with one result per payload, in request order:
+	{"index", "transaction_id", "status": "recorded" | "duplicate" | "invalid" | "error", "error"?}
+	and counts per status.
+	"""
+	payloads = ctx.body.get("events")
+	if not isinstance(payloads, list) or not payloads:
+		return ctx.error("events must be a non-empty array of checkout payloads", 400)
+	if len(payloads) > CHECKOUT_BATCH_MAX_EVENTS:
+		return ctx.error(f"At most {CHECKOUT_BATCH_MAX_EVENTS} events per batch", 400)
+
+	# Validate and deduplicate in one pass
+	results = [None] * len(payloads)
+	seen = set()
+	candidates = []
+	for index, payload in enumerate(payloads):
+		try:
+			shop_doc_id, event_data = parse_checkout(payload)
+		except ValueError as e:
+			results[index] = {"index": index, "status": "invalid", "error": str(e)}
+			continue
+		transaction_id = event_data["transaction_id"]
+		key = (shop_doc_id, str(transaction_id))
+		if key in seen:
+			results[index] = {"index": index, "transaction_id": transaction_id, "status": "duplicate"}
+			continue
+		seen.add(key)
+		candidates.append((index, shop_doc_id, event_data))
+
+	for (index, _, event_data), status, error in _record_checkouts(firestore.client(), candidates):
+		results[index] = {"index": index, "transaction_id": event_data["transaction_id"], "status": status}
+		if error is not None:
+			results[index]["error"] = error
+
+	counts = {"recorded": 0, "duplicate": 0, "invalid": 0, "error": 0}
+	for result in results:
+		counts[result["status"]] += 1
+
+	logger.info(f"Tracked checkout batch: {counts}")
+
+	return ctx.json({
+		"success": counts["error"] == 0,
+		"counts": counts,
+		"results": results
+	})
@@ -0,0 +1,259 @@
+"""Configuration, logging, CORS and request helpers shared by every endpoint module."""
+
+import os
+import urllib.parse
+import re
+import logging
+import base64
+import datetime
+import json
+
+# Load environment variables from .env file if dotenv is available
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    # dotenv not available, environment variables should be set externally
+    pass
+
+# Load environment variables
+SHOPIFY_API_KEY = os.environ.get("SHOPIFY_API_KEY")
+SHOPIFY_API_SECRET = os.environ.get("SHOPIFY_API_SECRET")
+SHOPIFY_SCOPES = os.environ.get("SHOPIFY_SCOPES", "read_products")
+SHOPIFY_REDIRECT_URI = os.environ.get("SHOPIFY_REDIRECT_URI")
+FRONTEND_URL = os.environ.get("FRONTEND_URL")  # optional fallback: only used if return_url not provided
+
+# External Firebase Configuration (for affiliate stats)
+EXTERNAL_FIREBASE_PROJECT_ID = os.environ.get("EXTERNAL_FIREBASE_PROJECT_ID")
+EXTERNAL_FIREBASE_PRIVATE_KEY_ID = os.environ.get("EXTERNAL_FIREBASE_PRIVATE_KEY_ID")
+EXTERNAL_FIREBASE_PRIVATE_KEY = os.environ.get("EXTERNAL_FIREBASE_PRIVATE_KEY")
+EXTERNAL_FIREBASE_CLIENT_EMAIL = os.environ.get("EXTERNAL_FIREBASE_CLIENT_EMAIL")
+EXTERNAL_FIREBASE_CLIENT_ID = os.environ.get("EXTERNAL_FIREBASE_CLIENT_ID")
+
+logger = logging.getLogger("shopify_verify")
+logger.setLevel(logging.INFO)
+
+# Debug log environment variables (redacted)
+logger.info(f"Environment variables loaded - API_KEY: {'✓' if SHOPIFY_API_KEY else '✗'}, SECRET: {'✓' if SHOPIFY_API_SECRET else '✗'}, REDIRECT_URI: {SHOPIFY_REDIRECT_URI}, FRONTEND_URL: {FRONTEND_URL}")
+
+
+# Stats providers registered by the subsystems loaded on this instance
+_stats_providers = {}
+
+
+def register_stats(name: str, provider):
+	"""Register a zero-argument callable whose dict result is reported under name."""
+	_stats_providers[name] = provider
+
+
+def collect_stats() -> dict:
+	"""Snapshot every registered subsystem's counters."""
+	return {name: provider() for name, provider in _stats_providers.items()}
+
+
+class CorsPolicy:
+	"""Precomputed CORS behaviour for a group of endpoints.
+
+	Origin matching is a set lookup plus one str.endswith over a suffix tuple, and the
+	resulting header tuple is cached per origin, so preflights and regular responses
+	reuse the same immutable headers instead of rebuilding them on every request.
+
+	Args:
+		origins: Exact origins allowed with credentials
+		origin_suffixes: Origin suffixes (e.g. ".ikas.shop") allowed with credentials
+		unmatched: What to send for other origins: "*" (wildcard, also used when the
+			request has no Origin), "echo" (reflect the origin without credentials) or None
+		allow_methods: Value of Access-Control-Allow-Methods
+		preflight_status: Status code returned for OPTIONS requests
+	"""
+
+	MAX_CACHED_ORIGINS = 256
+
+	def __init__(self, origins=(), origin_suffixes=(), unmatched="*",
+				 allow_methods="GET, POST, OPTIONS", preflight_status=200):
+		self._origins = frozenset(origins)
+		self._origin_suffixes = tuple(origin_suffixes)
+		self._unmatched = unmatched
+		self.preflight_status = preflight_status
+		self._common_headers = (
+			("Access-Control-Allow-Methods", allow_methods),
+			("Access-Control-Allow-Headers", "Content-Type, Authorization"),
+			("Access-Control-Expose-Headers", "Location, Server-Timing"),
+			("Access-Control-Max-Age", "3600"),
+		)
+		self._headers_by_origin = {}
+
+	def allows(self, origin: str) -> bool:
+		return bool(origin) and (origin in self._origins or origin.endswith(self._origin_suffixes))
+
+	def headers_for(self, origin) -> tuple:
+		"""Return the CORS headers for a request from origin as an immutable tuple."""
+		headers = self._headers_by_origin.get(origin)
+		if headers is not None:
+			return headers
+
+		if self.allows(origin):
+			allow = (("Access-Control-Allow-Origin", origin), ("Access-Control-Allow-Credentials", "true"))
+		elif origin and self._unmatched == "echo":
+			allow = (("Access-Control-Allow-Origin", origin),)
+		elif self._unmatched == "*":
+			allow = (("Access-Control-Allow-Origin", "*"),)
+		else:
+			allow = ()
+		headers = allow + self._common_headers
+
+		# Origins are caller-controlled; stop caching new ones once the table is full
+		if len(self._headers_by_origin) < self.MAX_CACHED_ORIGINS:
+			self._headers_by_origin[origin] = headers
+		return headers
+
+
+# Frontend endpoints: known origins get credentials, anything else gets a wildcard
+DEFAULT_CORS = CorsPolicy(
+	origins=(
+		"https://dev-konsiyer.ikas.shop",
+		"http://localhost:5173",
+		"http://localhost:3000",
+		# Add more allowed origins here
+	),
+	origin_suffixes=(".ikas.shop", ".myikas.com"),
+)
+
+# Endpoints receiving credentialed requests from Ikas storefronts (like sendBeacon)
+CREDENTIALS_CORS = CorsPolicy(
+	origins=(
+		"https://dev-alfreya.ikas.shop",
+		"https://dev-konsiyer.ikas.shop",
+		"http://localhost:5173",
+		"http://localhost:3000",
+	),
+	origin_suffixes=(".ikas.shop", ".myikas.com"),
+	unmatched="echo",
+)
+
+# Endpoints callable from anywhere without credentials
+PUBLIC_CORS = CorsPolicy(allow_methods="POST, OPTIONS", preflight_status=204)
+
+
+def get_request_query(req):
+	"""Robustly extract query parameters as a dict from the incoming request."""
+	try:
+		qp = req.query
+		if qp:
+			return {k: v for k, v in qp.items()}
+	except Exception:
+		pass
+	try:
+		qp = req.args
+		if qp:
+			return {k: v for k, v in qp.items()}
+	except Exception:
+		pass
+	try:
+		raw_url = req.url
+		parsed = urllib.parse.urlparse(raw_url)
+		return dict(urllib.parse.parse_qsl(parsed.query))
+	except Exception:
+		pass
+	return {}
+
+
+def get_page_size(value, default: int, maximum: int) -> int:
+	"""Clamp a client-supplied page size to [1, maximum], falling back to default."""
+	try:
+		page_size = int(value) if value is not None else default
+	except (TypeError, ValueError):
+		page_size = default
+	return max(1, min(page_size, maximum))
+
+
+def encode_cursor(values: dict) -> str:
+	"""Encode the sort values of the last returned document as an opaque page cursor.
+
+	Datetimes (including Firestore timestamps) are tagged so decode_cursor can turn
+	them back into datetimes that compare correctly in start_after().
+	"""
+	encoded = {}
+	for key, value in values.items():
+		if isinstance(value, datetime.datetime):
+			encoded[key] = {"$dt": value.isoformat()}
+		else:
+			encoded[key] = value
+	raw = json.dumps(encoded, separators=(",", ":")).encode()
+	return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+	"""Decode a cursor produced by encode_cursor.
+
+	Raises:
+		ValueError: If the cursor is malformed
+	"""
+	try:
+		raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+		values = json.loads(raw)
+	except Exception as e:
+		raise ValueError(f"Invalid cursor: {str(e)}")
+	if not isinstance(values, dict):
+		raise ValueError("Invalid cursor")
+	for key, value in values.items():
+		if isinstance(value, dict) and "$dt" in value:
+			values[key] = datetime.datetime.fromisoformat(value["$dt"])
+	return values
+
+
+_SHOP_DOMAIN_RE = re.compile(r"^[a-z0-9][a-z0-9\-]*\.myshopify\.com$")
+
+# Trusted return URL hosts, compiled into a single alternation.
+# In production, you should configure this more strictly
+_TRUSTED_RETURN_HOST_RE = re.compile(
+	r"^(?:localhost|127\.0\.0\.1|.*\.(?:"
+	r"vercel\.app|netlify\.app|web\.app|firebaseapp\.com|konsiyer\.com|alfreya\.com"
+	# Add your production domain suffixes here
+	r"))$"
+)
+
+
+def is_valid_shop_domain(shop: str) -> bool:
+	if not shop:
+		return False
+	return _SHOP_DOMAIN_RE.match(shop.lower()) is not None
+
+
+def is_valid_return_url(url: str) -> bool:
+	"""Validate that the return URL is from a trusted origin to prevent open redirect vulnerabilities.
+	
+	Args:
+		url: The return URL to validate
+		
+	Returns:
+		True if the URL is valid and from a trusted origin, False otherwise
+	"""
+	if not url:
+		return False
+	
+	try:
+		parsed = urllib.parse.urlparse(url)
+		
+		# Must have a scheme (http/https)
+		if parsed.scheme not in ('http', 'https'):
+			logger.warning(f"Invalid scheme in return URL: {parsed.scheme}")
+			return False
+		
+		# Must have a hostname
+		if not parsed.hostname:
+			logger.warning("No hostname in return URL")
+			return False
+		
+		hostname = parsed.hostname.lower()
+		
+		if _TRUSTED_RETURN_HOST_RE.match(hostname):
+			logger.info(f"Return URL validated: {url}")
+			return True
+		
+		logger.warning(f"Return URL hostname not in trusted list: {hostname}")
+		return False
+		
+	except Exception as e:
+		logger.error(f"Error validating return URL: {str(e)}")
+		return False
@@ -0,0 +1,234 @@
+"""Sharded per-shop event counters: shops_events/{shop}/counter_shards/{n}.
+
+A single document sustains roughly one write per second, so incrementing
+shops_events/{shop}.total_events on every checkout makes a busy shop's summary
+document the bottleneck of the whole ingest. Writers instead increment one of N
+shard documents chosen at random, and readers sum every shard.
+
+Readers sum whatever shard documents exist, so a hot shop's shard count can be
+raised at any time without losing counts:
+
+	python -m handlers.counters shards <shop_doc_id> <count>
+	python -m handlers.counters read <shop_doc_id>
+
+Every shop gets COUNTER_DEFAULT_SHARDS shards unless one config document,
+counter_config/shard_counts, gives it its own count. Each instance re-reads that
+document every SHARD_COUNT_TTL_SECONDS on a background thread, never on the
+ingest path: until a refresh lands, writers keep using the counts they have (the
+default before the first one), which is safe because readers sum every shard.
+total_events left on the shop document by the unsharded writes is added to the sum.
+
+The summary document shops_events/{shop} keeps shop_name and last_event_at
+(shop_summary_update) so every shop has one, but each instance merges into it at
+most once per SUMMARY_WRITE_INTERVAL_SECONDS per shop (claim_summary_write).
+Readers take the freshest last_event_at from the shards.
+"""
+
+from firebase_admin import firestore
+
+from collections import OrderedDict
+import os
+import random
+import threading
+import time
+
+from handlers.common import logger, register_stats
+
+COUNTER_SHARDS_COLLECTION = "counter_shards"
+
+# Shards per shop unless counter_config/shard_counts overrides it
+COUNTER_DEFAULT_SHARDS = int(os.environ.get("COUNTER_SHARDS", "10"))
+COUNTER_MAX_SHARDS = 100
+
+# How long an instance trusts its copy of the per-shop shard counts
+SHARD_COUNT_TTL_SECONDS = 300
+
+# How often one instance merges into a shop's summary document, and how many shops
+# it remembers doing so for
+SUMMARY_WRITE_INTERVAL_SECONDS = 60
+SUMMARY_TRACKED_SHOPS = 4096
+
+# How long read_event_count() results are reused
+COUNT_CACHE_TTL_SECONDS = 10
+
+
+class ShardedCounters:
+	"""Shard selection and cached reads for the per-shop event counters."""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._shard_counts = {}
+		self._shard_counts_loaded_at = None
+		self._refresh_thread = None
+		self._summary_writes = OrderedDict()
+		self._counts = {}
+		self._stats = {
+			"config_reads": 0, "config_read_failures": 0, "summary_writes": 0,
+			"count_cache_hits": 0, "count_cache_misses": 0,
+		}
+
+	def _config_ref(self, db):
+		return db.collection("counter_config").document("shard_counts")
+
+	def _configured_counts(self, db) -> dict:
+		"""The per-shop shard counts as last loaded, starting a background refresh when stale."""
+		with self._lock:
+			loaded_at = self._shard_counts_loaded_at
+			stale = loaded_at is None or time.monotonic() - loaded_at >= SHARD_COUNT_TTL_SECONDS
+			refreshing = self._refresh_thread is not None and self._refresh_thread.is_alive()
+			if stale and not refreshing:
+				self._refresh_thread = threading.Thread(
+					target=self.refresh, args=(db,), name="counter-config-refresh", daemon=True
+				)
+				self._refresh_thread.start()
+			return self._shard_counts
+
+	def refresh(self, db):
+		"""Re-read counter_config/shard_counts; on failure the current counts are kept."""
+		try:
+			snapshot = self._config_ref(db).get()
+			shard_counts = (snapshot.to_dict() or {}).get("shards", {}) if snapshot.exists else {}
+		except Exception as e:
+			logger.warning(f"Failed to read counter shard counts, keeping the current ones: {str(e)}")
+			with self._lock:
+				self._stats["config_read_failures"] += 1
+			return
+		with self._lock:
+			self._shard_counts = shard_counts
+			self._shard_counts_loaded_at = time.monotonic()
+			self._stats["config_reads"] += 1
+
+	def shard_count(self, db, shop_doc_id: str) -> int:
+		"""Number of shards writers spread shop_doc_id's increments over."""
+		return self._configured_counts(db).get(shop_doc_id, COUNTER_DEFAULT_SHARDS)
+
+	def claim_summary_write(self, shop_doc_id: str) -> bool:
+		"""Whether this write should merge into the shop's summary document.
+
+		True at most once per SUMMARY_WRITE_INTERVAL_SECONDS per shop; a caller whose
+		commit then fails hands the claim back with release_summary_write().
+		"""
+		now = time.monotonic()
+		with self._lock:
+			written_at = self._summary_writes.get(shop_doc_id)
+			if written_at is not None and now - written_at < SUMMARY_WRITE_INTERVAL_SECONDS:
+				return False
+			self._summary_writes[shop_doc_id] = now
+			self._summary_writes.move_to_end(shop_doc_id)
+			while len(self._summary_writes) > SUMMARY_TRACKED_SHOPS:
+				self._summary_writes.popitem(last=False)
+			self._stats["summary_writes"] += 1
+			return True
+
+	def release_summary_write(self, shop_doc_id: str):
+		with self._lock:
+			self._summary_writes.pop(shop_doc_id, None)
+
+	def pick_shard(self, db, shop_doc_id: str) -> int:
+		return random.randrange(self.shard_count(db, shop_doc_id))
+
+	def set_shard_count(self, db, shop_doc_id: str, count: int):
+		"""Spread shop_doc_id's future increments over count shards.
+
+		Raises:
+			ValueError: If count is outside [1, COUNTER_MAX_SHARDS]
+		"""
+		if not 1 <= count <= COUNTER_MAX_SHARDS:
+			raise ValueError(f"Shard count must be between 1 and {COUNTER_MAX_SHARDS}")
+		self._config_ref(db).set({"shards": {shop_doc_id: count}}, merge=True)
+		with self._lock:
+			self._shard_counts = {**self._shard_counts, shop_doc_id: count}
+
+	def read(self, db, shop_doc_id: str) -> dict:
+		"""Sum shop_doc_id's shards: {"total_events", "last_event_at", "shards"}, cached briefly."""
+		with self._lock:
+			cached = self._counts.get(shop_doc_id)
+			if cached is not None and time.monotonic() - cached[1] < COUNT_CACHE_TTL_SECONDS:
+				self._stats["count_cache_hits"] += 1
+				return cached[0]
+			self._stats["count_cache_misses"] += 1
+
+		shop_ref = db.collection("shops_events").document(shop_doc_id)
+		shop_snapshot = shop_ref.get()
+		shop_data = (shop_snapshot.to_dict() or {}) if shop_snapshot.exists else {}
+		total = shop_data.get("total_events", 0)
+		last_event_at = shop_data.get("last_event_at")
+		shards = 0
+		for snapshot in shop_ref.collection(COUNTER_SHARDS_COLLECTION).stream():
+			shard = snapshot.to_dict() or {}
+			shards += 1
+			total += shard.get("count", 0)
+			shard_last = shard.get("last_event_at")
+			if shard_last is not None and (last_event_at is None or shard_last > last_event_at):
+				last_event_at = shard_last
+
+		result = {"total_events": total, "last_event_at": last_event_at, "shards": shards}
+		with self._lock:
+			self._counts[shop_doc_id] = (result, time.monotonic())
+		return result
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {**self._stats, "cached_counts": len(self._counts), "configured_shops": len(self._shard_counts)}
+
+
+counters = ShardedCounters()
+register_stats("counters", counters.stats)
+
+
+def shard_ref(db, shop_doc_id: str, shard: int):
+	return db.collection("shops_events").document(shop_doc_id).collection(COUNTER_SHARDS_COLLECTION).document(str(shard))
+
+
+def counter_increment(affiliation: str, count: int = 1) -> dict:
+	"""Merge payload adding count events to a shard; write with set(merge=True)."""
+	return {
+		"shop_name": affiliation,
+		"count": firestore.Increment(count),
+		"last_event_at": firestore.SERVER_TIMESTAMP,
+	}
+
+
+def shop_summary_update(affiliation: str) -> dict:
+	"""Merge payload for the shop's summary document shops_events/{shop}; write with set(merge=True)."""
+	return {
+		"shop_name": affiliation,
+		"last_event_at": firestore.SERVER_TIMESTAMP,
+	}
+
+
+def shop_summary_ref(db, shop_doc_id: str):
+	return db.collection("shops_events").document(shop_doc_id)
+
+
+def read_event_count(db, shop_doc_id: str) -> dict:
+	return counters.read(db, shop_doc_id)
+
+
+def main():
+	import argparse
+
+	from firebase_admin import initialize_app
+	import firebase_admin
+
+	parser = argparse.ArgumentParser(description="Inspect and resize the sharded event counters")
+	subcommands = parser.add_subparsers(dest="command", required=True)
+	shards = subcommands.add_parser("shards", help="set how many shards a shop's increments are spread over")
+	shards.add_argument("shop", help="shop document id under shops_events")
+	shards.add_argument("count", type=int)
+	read = subcommands.add_parser("read", help="sum a shop's shards")
+	read.add_argument("shop", help="shop document id under shops_events")
+	args = parser.parse_args()
+
+	if not firebase_admin._apps:
+		initialize_app()
+	db = firestore.client()
+	if args.command == "shards":
+		counters.set_shard_count(db, args.shop, args.count)
+		print(f"{args.shop}: {args.count} shards")
+	else:
+		print(read_event_count(db, args.shop))
+
+
+if __name__ == "__main__":
+	main()
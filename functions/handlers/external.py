@@ -0,0 +1,158 @@
+"""Firestore client for the external (konsiyer-sync) Firebase project."""
+
+from firebase_admin import firestore, credentials
+import firebase_admin
+
+import os
+import json
+import time
+import threading
+
+from handlers.common import (
+	EXTERNAL_FIREBASE_PROJECT_ID,
+	EXTERNAL_FIREBASE_PRIVATE_KEY_ID,
+	EXTERNAL_FIREBASE_PRIVATE_KEY,
+	EXTERNAL_FIREBASE_CLIENT_EMAIL,
+	EXTERNAL_FIREBASE_CLIENT_ID,
+	logger,
+	register_stats,
+)
+
+
+EXTERNAL_FIREBASE_APP_NAME = 'external_firebase_app'
+
+
+def _create_external_firebase_client():
+	"""Initialize the external Firebase app and return its Firestore client.
+
+	Only called by ExternalFirestoreHolder; use get_external_firebase_client() instead.
+	"""
+	app_name = EXTERNAL_FIREBASE_APP_NAME
+
+	# Reuse the app if it was initialized elsewhere in this process
+	try:
+		return firestore.client(firebase_admin.get_app(app_name))
+	except ValueError:
+		logger.info(f"Initializing new Firebase app: {app_name}")
+
+	# Try to load from JSON file first (most reliable)
+	key_file_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'firebase-key.json')
+	
+	if os.path.exists(key_file_path):
+		logger.info("Loading external Firebase credentials from firebase-key.json")
+		
+		# Use Firebase Admin SDK credentials
+		cred = credentials.Certificate(key_file_path)
+		
+		# Get project ID from the key file
+		with open(key_file_path, 'r') as f:
+			key_data = json.load(f)
+			project_id = key_data.get('project_id')
+		
+		# Initialize the Firebase app with a unique name
+		app = firebase_admin.initialize_app(cred, {
+			'projectId': project_id
+		}, name=app_name)
+		
+		logger.info(f"Initialized external Firebase app for project: {project_id}")
+		
+		# Return Firestore client for this app
+		return firestore.client(app)
+	
+	# Fallback to environment variables if file doesn't exist
+	if not all([EXTERNAL_FIREBASE_PROJECT_ID, EXTERNAL_FIREBASE_PRIVATE_KEY, EXTERNAL_FIREBASE_CLIENT_EMAIL]):
+		raise ValueError("External Firebase configuration is incomplete - missing firebase-key.json file and/or environment variables")
+	
+	logger.info("Loading external Firebase credentials from environment variables")
+	
+	# Create credentials from environment variables (with proper key formatting)
+	private_key = EXTERNAL_FIREBASE_PRIVATE_KEY
+	# Ensure the private key has proper line breaks
+	if "\\n" in private_key:
+		private_key = private_key.replace("\\n", "\n")
+	
+	credentials_dict = {
+		"type": "service_account",
+		"project_id": EXTERNAL_FIREBASE_PROJECT_ID,
+		"private_key_id": EXTERNAL_FIREBASE_PRIVATE_KEY_ID,
+		"private_key": private_key,
+		"client_email": EXTERNAL_FIREBASE_CLIENT_EMAIL,
+		"client_id": EXTERNAL_FIREBASE_CLIENT_ID,
+		"auth_uri": "https://accounts.google.com/o/oauth2/auth",
+		"token_uri": "https://oauth2.googleapis.com/token",
+		"auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+		"universe_domain": "googleapis.com"
+	}
+	
+	# Use Firebase Admin SDK credentials
+	cred = credentials.Certificate(credentials_dict)
+	
+	# Initialize the Firebase app with a unique name
+	app = firebase_admin.initialize_app(cred, {
+		'projectId': EXTERNAL_FIREBASE_PROJECT_ID
+	}, name=app_name)
+	
+	logger.info(f"Initialized external Firebase app for project: {EXTERNAL_FIREBASE_PROJECT_ID}")
+	
+	# Return Firestore client for this app
+	return firestore.client(app)
+
+
+class ExternalFirestoreHolder:
+	"""Process-wide, lazily created Firestore client for the external project.
+
+	The client (and its gRPC channel) is created once under a lock and then returned
+	without any app lookup, filesystem check or logging on the request path.
+	"""
+
+	def __init__(self):
+		self._client = None
+		self._lock = threading.Lock()
+		self._created_at = None
+		self._init_seconds = None
+		self.init_failures = 0
+
+	def get(self):
+		client = self._client
+		if client is not None:
+			return client
+
+		with self._lock:
+			if self._client is None:
+				started = time.perf_counter()
+				try:
+					client = _create_external_firebase_client()
+				except Exception as e:
+					self.init_failures += 1
+					logger.error(f"Failed to initialize external Firebase client: {str(e)}")
+					raise
+				self._init_seconds = time.perf_counter() - started
+				self._created_at = time.time()
+				self._client = client
+				logger.info(f"External Firestore client ready in {self._init_seconds * 1000:.1f}ms")
+			return self._client
+
+	def warm_up(self):
+		"""Create the client ahead of the first request; errors are logged, not raised."""
+		try:
+			self.get()
+		except Exception:
+			# Already logged; the next request will retry initialization
+			pass
+
+	def stats(self) -> dict:
+		return {
+			"initialized": self._client is not None,
+			"age_seconds": (time.time() - self._created_at) if self._created_at else None,
+			"init_latency_ms": (self._init_seconds * 1000) if self._init_seconds is not None else None,
+			"init_failures": self.init_failures,
+		}
+
+
+external_firestore = ExternalFirestoreHolder()
+register_stats("external_firestore", external_firestore.stats)
+
+
+def get_external_firebase_client():
+	"""Get the shared Firestore client for the external Firebase project."""
+	return external_firestore.get()
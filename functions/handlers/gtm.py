@@ -0,0 +1,86 @@
+"""Google Tag Manager installation check: verify_gtm."""
+
+from firebase_functions import https_fn
+import requests
+
+import logging
+
+from handlers.common import PUBLIC_CORS
+from handlers.pipeline import RequestContext, endpoint
+from handlers.resilience import RetryPolicy, resilient
+
+logger = logging.getLogger("verify_gtm")
+
+# Fetching a storefront is a GET, so gateway errors and dropped connections are retried
+STORE_FETCH_POLICY = RetryPolicy(attempts=3, retry_statuses=(502, 503, 504))
+
+
+@endpoint(cors=PUBLIC_CORS)
+def verify_gtm(ctx: RequestContext) -> https_fn.Response:
+	"""
+	Verify if GTM tag is installed on a given store URL.
+	
+	Expected JSON payload:
+	{
+		"storeUrl": "https://example.myikas.com"
+	}
+	
+	Returns:
+	{
+		"success": true,
+		"gtmInstalled": true/false,
+		"gtmId": "GTM-PH5FKW99" (if found)
+	}
+	"""
+	data = ctx.body
+	if not data:
+		return ctx.error("Invalid JSON payload", 400)
+	
+	store_url = data.get("storeUrl", "").strip()
+	if not store_url:
+		return ctx.error("storeUrl is required", 400)
+	
+	# Ensure URL has protocol
+	if not store_url.startswith("http"):
+		store_url = f"https://{store_url}"
+	
+	logger.info(f"Verifying GTM installation for: {store_url}")
+	
+	# Fetch the store's homepage
+	try:
+		response = resilient.get(
+			store_url,
+			STORE_FETCH_POLICY,
+			headers={
+				"User-Agent": "Mozilla/5.0 (compatible; AlfreyaBot/1.0; +https://alfreya.com)"
+			}
+		)
+		
+		if response.status_code != 200:
+			logger.warning(f"Failed to fetch store URL: HTTP {response.status_code}")
+			return ctx.json({
+				"success": False,
+				"error": f"Unable to access store (HTTP {response.status_code})"
+			})
+		
+		html_content = response.text
+		
+		# Check for GTM-PH5FKW99 in the HTML
+		gtm_id = "GTM-PH5FKW99"
+		gtm_installed = gtm_id in html_content
+		
+		logger.info(f"GTM verification result for {store_url}: {gtm_installed}")
+		
+		return ctx.json({
+			"success": True,
+			"gtmInstalled": gtm_installed,
+			"gtmId": gtm_id if gtm_installed else None,
+			"storeUrl": store_url
+		})
+		
+	except requests.RequestException as e:
+		logger.error(f"Request error fetching store URL: {str(e)}")
+		return ctx.json({
+			"success": False,
+			"error": f"Unable to connect to store: {str(e)}"
+		})
@@ -0,0 +1,63 @@
+"""Persisting a shop's GTM verification result: update_gtm_status."""
+
+from firebase_functions import https_fn
+from firebase_admin import firestore
+
+import logging
+
+from handlers.common import PUBLIC_CORS
+from handlers.pipeline import RequestContext, endpoint
+
+logger = logging.getLogger("update_gtm_status")
+
+
+@endpoint(cors=PUBLIC_CORS, auth="required")
+def update_gtm_status(ctx: RequestContext) -> https_fn.Response:
+	"""
+	Update GTM verification status for a user's Ikas shop.
+	
+	Expected JSON payload:
+	{
+		"idToken": "firebase_id_token",
+		"shopId": "shop_document_id",
+		"gtmVerified": true/false
+	}
+	
+	Returns:
+	{
+		"success": true,
+		"message": "GTM status updated"
+	}
+	"""
+	uid = ctx.uid
+	shop_id = ctx.body.get("shopId", "").strip()
+	gtm_verified = ctx.body.get("gtmVerified")
+	
+	if not shop_id:
+		return ctx.error("shopId is required", 400)
+	
+	if gtm_verified is None:
+		return ctx.error("gtmVerified is required", 400)
+	
+	# Update the shop document
+	db = firestore.client()
+	shop_ref = db.collection("users").document(uid).collection("shops").document(shop_id)
+	shop_doc = shop_ref.get()
+	
+	if not shop_doc.exists:
+		return ctx.error("Shop not found", 404)
+	
+	# Update GTM status
+	shop_ref.update({
+		"gtmVerified": gtm_verified,
+		"gtmVerifiedAt": firestore.SERVER_TIMESTAMP if gtm_verified else None,
+		"lastUpdated": firestore.SERVER_TIMESTAMP
+	})
+	
+	logger.info(f"Updated GTM status for shop {shop_id}, user {uid}: {gtm_verified}")
+	
+	return ctx.json({
+		"success": True,
+		"message": "GTM status updated successfully",
+		"gtmVerified": gtm_verified
+	})
@@ -0,0 +1,181 @@
+"""Shared, instrumented HTTP client for all outbound calls."""
+
+import requests
+
+import http.cookiejar
+import urllib.parse
+import time
+import threading
+from collections import OrderedDict
+
+from handlers.common import register_stats
+
+
+# Defaults for outbound HTTP calls: (connect, read) timeouts in seconds
+HTTP_DEFAULT_TIMEOUT = (5, 10)
+
+
+# Maximum concurrent requests (and pooled keep-alive connections) per host
+HTTP_MAX_CONCURRENCY_PER_HOST = 8
+
+
+# Number of per-host connection pools kept alive at once
+HTTP_MAX_HOST_POOLS = 32
+
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HTTP_LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class _HostState:
+	"""Concurrency limit and instrumentation for one outbound host."""
+
+	def __init__(self, max_concurrency: int):
+		self.semaphore = threading.BoundedSemaphore(max_concurrency)
+		self.requests = 0
+		self.errors = 0
+		self.new_connections = 0
+		self.latency_sum_ms = 0.0
+		self.latency_buckets = [0] * (len(HTTP_LATENCY_BUCKETS_MS) + 1)
+		self.pool = None
+		self.pool_connections_seen = 0
+		self.in_flight = 0
+
+
+class HostBusyError(requests.exceptions.ConnectionError):
+	"""Raised when no request slot for the host frees up within the connect timeout.
+
+	The limit is local to this instance, so the error says nothing about the host's
+	health; resilient does not count it against the host's circuit breaker.
+	"""
+
+
+class HttpClient:
+	"""Shared outbound HTTP client with per-host keep-alive pools.
+
+	A single requests.Session is reused for every outbound call (Ikas, Shopify Admin
+	API, GTM checks, the external processing function), so warm TLS connections are
+	reused across requests served by the same instance. Each host gets a bounded
+	concurrency limit, a latency histogram and a connection reuse counter.
+
+	The session serves every tenant's calls, so it never stores cookies: a cookie
+	set by one store would otherwise be replayed on later calls for other users.
+	"""
+
+	def __init__(self, max_concurrency_per_host: int = HTTP_MAX_CONCURRENCY_PER_HOST,
+				 max_host_pools: int = HTTP_MAX_HOST_POOLS,
+				 default_timeout=HTTP_DEFAULT_TIMEOUT):
+		self._max_concurrency_per_host = max_concurrency_per_host
+		self._max_hosts = max_host_pools * 8
+		self._default_timeout = default_timeout
+		self._adapter = requests.adapters.HTTPAdapter(
+			pool_connections=max_host_pools,
+			pool_maxsize=max_concurrency_per_host,
+		)
+		self._session = requests.Session()
+		self._session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+		self._session.mount("https://", self._adapter)
+		self._session.mount("http://", self._adapter)
+		self._hosts = OrderedDict()
+		self._lock = threading.Lock()
+
+	def _host_state(self, host: str) -> _HostState:
+		"""The host's state, counted as in flight until _release_host_state()."""
+		with self._lock:
+			state = self._hosts.get(host)
+			if state is None:
+				state = self._hosts[host] = _HostState(self._max_concurrency_per_host)
+				# verify_gtm can reach arbitrary store hosts; keep the table bounded. Hosts
+				# with requests in flight are kept so their semaphore keeps limiting them.
+				excess = len(self._hosts) - self._max_hosts
+				if excess > 0:
+					idle = [name for name, entry in self._hosts.items() if entry.in_flight == 0 and entry is not state]
+					for name in idle[:excess]:
+						del self._hosts[name]
+			else:
+				self._hosts.move_to_end(host)
+			state.in_flight += 1
+			return state
+
+	def _release_host_state(self, state: _HostState):
+		with self._lock:
+			state.in_flight -= 1
+
+	def _record(self, state: _HostState, url: str, elapsed_ms: float, failed: bool):
+		try:
+			pool = self._adapter.poolmanager.connection_from_url(url)
+		except Exception:
+			pool = None
+
+		bucket = len(HTTP_LATENCY_BUCKETS_MS)
+		for index, upper_bound in enumerate(HTTP_LATENCY_BUCKETS_MS):
+			if elapsed_ms <= upper_bound:
+				bucket = index
+				break
+
+		with self._lock:
+			state.requests += 1
+			state.errors += 1 if failed else 0
+			state.latency_sum_ms += elapsed_ms
+			state.latency_buckets[bucket] += 1
+			if pool is not None:
+				# Count connections opened since the last request on this pool
+				if pool is not state.pool:
+					state.pool = pool
+					state.pool_connections_seen = 0
+				state.new_connections += max(pool.num_connections - state.pool_connections_seen, 0)
+				state.pool_connections_seen = pool.num_connections
+
+	def request(self, method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+		"""Send a request through the shared session.
+
+		Waits up to the connect timeout for a free slot on the target host and raises
+		requests.exceptions.ConnectionError if none becomes available.
+		"""
+		timeout = timeout or self._default_timeout
+		connect_timeout = timeout[0] if isinstance(timeout, tuple) else timeout
+		host = urllib.parse.urlparse(url).netloc.lower()
+		state = self._host_state(host)
+		try:
+			if not state.semaphore.acquire(timeout=connect_timeout):
+				raise HostBusyError(f"Too many concurrent requests to {host}")
+
+			started = time.perf_counter()
+			failed = True
+			try:
+				response = self._session.request(method, url, timeout=timeout, **kwargs)
+				failed = response.status_code >= 500
+				return response
+			finally:
+				state.semaphore.release()
+				self._record(state, url, (time.perf_counter() - started) * 1000, failed)
+		finally:
+			self._release_host_state(state)
+
+	def get(self, url: str, **kwargs) -> requests.Response:
+		return self.request("GET", url, **kwargs)
+
+	def post(self, url: str, **kwargs) -> requests.Response:
+		return self.request("POST", url, **kwargs)
+
+	def stats(self) -> dict:
+		"""Per-host request counts, latency histogram and connection reuse ratio."""
+		with self._lock:
+			hosts = {}
+			for host, state in self._hosts.items():
+				hosts[host] = {
+					"requests": state.requests,
+					"errors": state.errors,
+					"new_connections": state.new_connections,
+					"reuse_ratio": (1 - state.new_connections / state.requests) if state.requests else 0.0,
+					"latency_avg_ms": (state.latency_sum_ms / state.requests) if state.requests else 0.0,
+					"latency_histogram_ms": {
+						**{f"le_{upper_bound}": count for upper_bound, count in zip(HTTP_LATENCY_BUCKETS_MS, state.latency_buckets)},
+						"gt_last": state.latency_buckets[-1],
+					},
+				}
+			return {"hosts": hosts}
+
+
+http_client = HttpClient()
+register_stats("http", http_client.stats)
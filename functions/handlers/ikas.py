@@ -0,0 +1,149 @@
+"""Ikas shop connection and access tokens: ikas_connect, get_ikas_access_token."""
+
+from firebase_functions import https_fn
+from firebase_admin import firestore
+import requests
+
+import urllib.parse
+import re
+
+from handlers.common import logger
+from handlers.ikas_tokens import IkasAuthError, fetch_ikas_token, ikas_tokens, token_expiry
+from handlers.pipeline import RequestContext, endpoint
+
+
+@endpoint(auth="required")
+def ikas_connect(ctx: RequestContext) -> https_fn.Response:
+	"""Connect to Ikas shop using client credentials.
+	
+	Expects: JSON body with shop_name, client_id, and client_secret.
+	Returns: Success response with shop connection data.
+	"""
+	body = ctx.body
+
+	# Extract parameters
+	shop_url = body.get("shop_url", "").strip()
+	client_id = body.get("client_id", "").strip()
+	client_secret = body.get("client_secret", "").strip()
+
+	# Validate required fields
+	if not shop_url or not client_id or not client_secret:
+		return ctx.error("Missing required fields: shop_url, client_id, client_secret", 400)
+
+	# Extract shop name from the URL
+	# Expected formats: https://shopname.myikas.com or shopname.myikas.com
+	try:
+		# Parse the URL
+		parsed_url = urllib.parse.urlparse(shop_url if "://" in shop_url else f"https://{shop_url}")
+		hostname = parsed_url.hostname or parsed_url.path.split("/")[0]
+		
+		# Extract shop name from hostname (e.g., "shopname" from "shopname.myikas.com")
+		if ".myikas.com" in hostname:
+			shop_name = hostname.replace(".myikas.com", "")
+		elif ".ikas.shop" in hostname:
+			shop_name = hostname.replace(".ikas.shop", "")
+		else:
+			return ctx.error("Invalid Ikas shop URL. Expected format: shopname.myikas.com or shopname.ikas.shop", 400)
+		
+		# Validate shop name is not empty and contains valid characters
+		if not shop_name or not re.match(r"^[a-z0-9][a-z0-9\-]*$", shop_name.lower()):
+			return ctx.error("Invalid shop name extracted from URL", 400)
+		
+		logger.info(f"Extracted shop name '{shop_name}' from URL: {shop_url}")
+		
+	except Exception as e:
+		logger.error(f"Failed to parse shop URL: {str(e)}")
+		return ctx.error(f"Invalid shop URL format: {str(e)}", 400)
+
+	uid = ctx.uid
+	user_email = ctx.decoded.get("email")
+
+	logger.info(f"Ikas connection request for shop: {shop_name}, user: {uid}")
+
+	# Fetch access token from Ikas API
+	try:
+		access_token, expires_at = fetch_ikas_token(shop_name, client_id, client_secret)
+		logger.info(f"Successfully fetched access token from Ikas for shop: {shop_name}")
+	except IkasAuthError as e:
+		return ctx.error(f"Failed to authenticate with Ikas: {str(e)}", 400)
+	except requests.exceptions.RequestException as e:
+		logger.exception(f"Error connecting to Ikas API: {str(e)}")
+		return ctx.error(f"Failed to connect to Ikas API: {str(e)}", 500)
+	except Exception as e:
+		logger.exception(f"Unexpected error fetching Ikas token: {str(e)}")
+		return ctx.error(f"Unexpected error: {str(e)}", 500)
+
+	# Save connection to Firestore
+	db = firestore.client()
+	
+	# Create shop document in user's shops subcollection
+	shop_doc_id = shop_name.lower().replace(" ", "-")
+	user_shop_ref = db.collection("users").document(uid).collection("shops").document(shop_doc_id)
+	
+	shop_data = {
+		"shopType": "ikas",
+		"shopName": shop_name,
+		"clientId": client_id,
+		"clientSecret": client_secret,
+		"accessToken": access_token,
+		"accessTokenExpiresAt": token_expiry(expires_at),
+		"userEmail": user_email,
+		"verified": True,
+		"connectedAt": firestore.SERVER_TIMESTAMP,
+		"fetchedAt": firestore.SERVER_TIMESTAMP
+	}
+	
+	user_shop_ref.set(shop_data)
+	ikas_tokens.remember((uid, shop_doc_id), access_token, expires_at)
+	logger.info(f"Saved Ikas shop connection for user {uid}, shop: {shop_name}")
+	
+	# Also update the main user document
+	user_doc_ref = db.collection("users").document(uid)
+	user_doc_ref.set({
+		"userId": uid,
+		"shop": shop_doc_id,
+		"shopType": "ikas",
+		"verified": True,
+		"lastUpdated": firestore.SERVER_TIMESTAMP
+	}, merge=True)
+
+	return ctx.json({
+		"success": True,
+		"message": "Ikas shop connected successfully",
+		"shop_name": shop_name
+	})
+
+
+@endpoint(auth="required")
+def get_ikas_access_token(ctx: RequestContext) -> https_fn.Response:
+	"""Return a usable Ikas access token for a shop (admin only).
+
+	The token is refreshed from the stored client credentials when it has
+	expired, and in the background when it is close to expiry.
+
+	Expects: POST request with idToken, user_id, shop_id and optional
+		force_refresh (after Ikas rejected the token) in body
+	Returns: JSON with accessToken and accessTokenExpiresAt (epoch millis)
+	"""
+	if not ctx.authz.is_admin:
+		return ctx.error("Admin access required", 403)
+
+	body = ctx.body
+	user_id = body.get("user_id")
+	shop_id = body.get("shop_id")
+	if not isinstance(user_id, str) or not user_id or not isinstance(shop_id, str) or not shop_id:
+		return ctx.error("Missing required fields: user_id, shop_id", 400)
+
+	db = firestore.client()
+	try:
+		access_token, expires_at = ikas_tokens.get_token(db, user_id, shop_id, force_refresh=body.get("force_refresh") is True)
+	except IkasAuthError as e:
+		return ctx.error(f"Failed to authenticate with Ikas: {str(e)}", 400)
+	except requests.exceptions.RequestException as e:
+		logger.exception(f"Error connecting to Ikas API: {str(e)}")
+		return ctx.error(f"Failed to connect to Ikas API: {str(e)}", 502)
+
+	return ctx.json({
+		"accessToken": access_token,
+		"accessTokenExpiresAt": int(expires_at * 1000)
+	})
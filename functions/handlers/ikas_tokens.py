@@ -0,0 +1,228 @@
+"""Ikas Admin API access tokens: client_credentials exchange, caching and refresh.
+
+ikas_connect stores the shop's client credentials in users/{uid}/shops/{shop}.
+The admin Ikas pipeline gets its token from get_ikas_access_token, which calls
+ikas_tokens.get_token(). That serves the token from memory, then from the shop
+document (accessToken / accessTokenExpiresAt), and only exchanges the
+credentials when neither holds a usable token:
+
+	fresh       more than IKAS_TOKEN_REFRESH_AHEAD_SECONDS before expiry: returned
+	expiring    inside that window: returned, and one background refresh starts
+	expired     refreshed before returning
+
+Refreshes are single-flight per shop: concurrent callers wait for the exchange
+already in flight instead of starting their own. Counters are reported under the
+"ikas_tokens" stats.
+"""
+
+from firebase_admin import firestore
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import datetime
+import threading
+import time
+
+from handlers.common import logger, register_stats
+from handlers.resilience import resilient
+
+# Lifetime assumed when the token response has no expires_in
+IKAS_TOKEN_DEFAULT_TTL_SECONDS = 3600
+
+# Tokens are refreshed in the background once they are this close to expiry
+IKAS_TOKEN_REFRESH_AHEAD_SECONDS = 300
+
+# Shops whose token is kept in memory
+IKAS_TOKEN_CACHE_SIZE = 512
+
+
+class IkasAuthError(Exception):
+	"""The Ikas token endpoint rejected the credentials or returned no token."""
+
+
+def ikas_token_url(shop_name: str) -> str:
+	# The Ikas API endpoint is on the store's subdomain
+	return f"https://{shop_name}.myikas.com/api/admin/oauth/token"
+
+
+def fetch_ikas_token(shop_name: str, client_id: str, client_secret: str) -> tuple:
+	"""Exchange client credentials for an access token.
+
+	Returns:
+		(access_token, expires_at epoch seconds)
+
+	Raises:
+		IkasAuthError: If Ikas answers with an error or without a token
+		requests.exceptions.RequestException: If Ikas cannot be reached
+	"""
+	token_url = ikas_token_url(shop_name)
+	logger.info(f"Requesting access token from Ikas API: {token_url}")
+
+	token_response = resilient.post(
+		token_url,
+		data={
+			"grant_type": "client_credentials",
+			"client_id": client_id,
+			"client_secret": client_secret
+		},
+		headers={"Content-Type": "application/x-www-form-urlencoded"}
+	)
+
+	if token_response.status_code != 200:
+		error_message = token_response.text or "Failed to fetch access token from Ikas"
+		logger.error(f"Ikas API error: {token_response.status_code} - {error_message}")
+		raise IkasAuthError(error_message)
+
+	token_json = token_response.json()
+	access_token = token_json.get("access_token")
+	if not access_token:
+		logger.error("No access token in Ikas response")
+		raise IkasAuthError("No access token in Ikas response")
+
+	expires_in = token_json.get("expires_in") or IKAS_TOKEN_DEFAULT_TTL_SECONDS
+	return access_token, time.time() + float(expires_in)
+
+
+def token_expiry(expires_at: float) -> datetime.datetime:
+	"""accessTokenExpiresAt value for an expiry in epoch seconds."""
+	return datetime.datetime.fromtimestamp(expires_at, tz=datetime.timezone.utc)
+
+
+def shop_ref(db, uid: str, shop_doc_id: str):
+	return db.collection("users").document(uid).collection("shops").document(shop_doc_id)
+
+
+class IkasTokenManager:
+	"""Per-shop token cache with refresh-ahead and single-flight refreshes."""
+
+	def __init__(self, fetch=fetch_ikas_token, refresh_workers: int = 2):
+		self._fetch = fetch
+		self._lock = threading.Lock()
+		self._tokens = OrderedDict()
+		self._inflight = {}
+		self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="ikas-token-refresh")
+		self._stats = {
+			"memory_hits": 0,
+			"firestore_hits": 0,
+			"refreshes": 0,
+			"refresh_ahead": 0,
+			"refresh_failures": 0,
+			"coalesced_waits": 0,
+		}
+
+	def _count(self, key: str):
+		with self._lock:
+			self._stats[key] += 1
+
+	def remember(self, key: tuple, access_token: str, expires_at: float):
+		"""Cache a token in memory only; key is (uid, shop_doc_id)."""
+		with self._lock:
+			self._tokens[key] = (access_token, expires_at)
+			self._tokens.move_to_end(key)
+			while len(self._tokens) > IKAS_TOKEN_CACHE_SIZE:
+				self._tokens.popitem(last=False)
+
+	def store(self, db, uid: str, shop_doc_id: str, access_token: str, expires_at: float):
+		"""Cache a token in memory and on the shop document."""
+		self.remember((uid, shop_doc_id), access_token, expires_at)
+		shop_ref(db, uid, shop_doc_id).set({
+			"accessToken": access_token,
+			"accessTokenExpiresAt": token_expiry(expires_at),
+			"fetchedAt": firestore.SERVER_TIMESTAMP
+		}, merge=True)
+
+	def _refresh(self, db, uid: str, shop_doc_id: str) -> tuple:
+		"""Exchange the shop's stored credentials; store and return (token, expires_at)."""
+		shop_doc = shop_ref(db, uid, shop_doc_id).get()
+		shop_data = shop_doc.to_dict() if shop_doc.exists else {}
+		if shop_data.get("shopType") != "ikas" or not shop_data.get("clientId"):
+			raise IkasAuthError(f"No Ikas credentials stored for shop {shop_doc_id}")
+
+		access_token, expires_at = self._fetch(shop_data["shopName"], shop_data["clientId"], shop_data["clientSecret"])
+		self.store(db, uid, shop_doc_id, access_token, expires_at)
+		self._count("refreshes")
+		logger.info(f"Refreshed Ikas access token for shop {shop_doc_id}")
+		return access_token, expires_at
+
+	def _refresh_once(self, db, uid: str, shop_doc_id: str, background: bool = False) -> Future:
+		"""Start a refresh unless one is in flight for the shop; return its future."""
+		key = (uid, shop_doc_id)
+		with self._lock:
+			future = self._inflight.get(key)
+			if future is not None:
+				self._stats["coalesced_waits"] += 1
+				return future
+			future = self._inflight[key] = Future()
+
+		def run():
+			try:
+				future.set_result(self._refresh(db, uid, shop_doc_id))
+			except Exception as e:
+				self._count("refresh_failures")
+				logger.warning(f"Failed to refresh Ikas access token for shop {shop_doc_id}: {str(e)}")
+				future.set_exception(e)
+			finally:
+				with self._lock:
+					self._inflight.pop(key, None)
+
+		if background:
+			self._executor.submit(run)
+		else:
+			run()
+		return future
+
+	def _usable(self, db, uid: str, shop_doc_id: str, cached: tuple) -> bool:
+		"""Whether cached has not expired, starting a background refresh when it is close."""
+		remaining = cached[1] - time.time()
+		if remaining <= 0:
+			return False
+		if remaining < IKAS_TOKEN_REFRESH_AHEAD_SECONDS:
+			with self._lock:
+				refreshing = (uid, shop_doc_id) in self._inflight
+			if not refreshing:
+				self._count("refresh_ahead")
+				self._refresh_once(db, uid, shop_doc_id, background=True)
+		return True
+
+	def get_token(self, db, uid: str, shop_doc_id: str, force_refresh: bool = False) -> tuple:
+		"""Access token of users/{uid}/shops/{shop_doc_id}, refreshed when needed.
+
+		Args:
+			force_refresh: Skip the cached token, e.g. after Ikas answered 401 with it
+
+		Returns:
+			(access_token, expires_at epoch seconds)
+
+		Raises:
+			IkasAuthError: If the shop has no stored credentials or Ikas rejects them
+			requests.exceptions.RequestException: If Ikas cannot be reached
+		"""
+		if force_refresh:
+			return self._refresh_once(db, uid, shop_doc_id).result()
+
+		key = (uid, shop_doc_id)
+		with self._lock:
+			cached = self._tokens.get(key)
+		if cached is not None and self._usable(db, uid, shop_doc_id, cached):
+			self._count("memory_hits")
+			return cached
+
+		shop_doc = shop_ref(db, uid, shop_doc_id).get()
+		shop_data = shop_doc.to_dict() if shop_doc.exists else {}
+		stored_expiry = shop_data.get("accessTokenExpiresAt")
+		if shop_data.get("accessToken") and stored_expiry is not None:
+			cached = (shop_data["accessToken"], stored_expiry.timestamp())
+			if self._usable(db, uid, shop_doc_id, cached):
+				self.remember(key, *cached)
+				self._count("firestore_hits")
+				return cached
+
+		return self._refresh_once(db, uid, shop_doc_id).result()
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {**self._stats, "cached_tokens": len(self._tokens), "refreshes_in_flight": len(self._inflight)}
+
+
+ikas_tokens = IkasTokenManager()
+register_stats("ikas_tokens", ikas_tokens.stats)
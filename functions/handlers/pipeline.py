@@ -0,0 +1,228 @@
+"""Declarative request pipeline shared by every endpoint.
+
+@endpoint(...) turns a handler that takes a RequestContext into a Cloud Functions
+request handler. The pipeline answers CORS preflights from a per-origin header
+cache, rejects unsupported methods, parses the body once, resolves the caller's
+ID token once, turns unexpected exceptions into a JSON 500 and reports its own
+overhead in a Server-Timing header.
+"""
+
+from firebase_functions import https_fn
+
+import functools
+import time
+import threading
+
+from handlers.common import CorsPolicy, DEFAULT_CORS, logger, register_stats, collect_stats, get_request_query
+from handlers.serialization import dumps
+
+# How often each instance logs a snapshot of every registered subsystem's stats
+STATS_LOG_INTERVAL_SECONDS = 300
+
+
+class RequestContext:
+	"""Everything a handler needs about the current request, resolved once."""
+
+	__slots__ = ("req", "method", "body", "decoded", "uid", "_cors_headers", "_query", "_authz")
+
+	def __init__(self, req: https_fn.Request, cors_headers: tuple):
+		self.req = req
+		self.method = req.method
+		self.body = {}
+		self.decoded = None
+		self.uid = None
+		self._cors_headers = cors_headers
+		self._query = None
+		self._authz = None
+
+	@property
+	def query(self) -> dict:
+		if self._query is None:
+			self._query = get_request_query(self.req)
+		return self._query
+
+	@property
+	def authz(self):
+		"""The caller's authorization decision, computed on first use."""
+		if self._authz is None:
+			from handlers.auth import authorize
+			self._authz = authorize(self.decoded or {})
+		return self._authz
+
+	def headers(self, content_type: str = None, **extra) -> dict:
+		"""Response headers: the precomputed CORS headers plus content type and extras."""
+		headers = dict(self._cors_headers)
+		if content_type:
+			headers["Content-Type"] = content_type
+		headers.update(extra)
+		return headers
+
+	def json(self, payload, status: int = 200, timestamps: str = "iso") -> https_fn.Response:
+		"""JSON response; Firestore values are converted by handlers.serialization."""
+		return https_fn.Response(
+			dumps(payload, timestamps), status=status, headers=self.headers("application/json")
+		)
+
+	def error(self, message: str, status: int) -> https_fn.Response:
+		return self.json({"error": message}, status=status)
+
+	def text(self, body: str, status: int = 200) -> https_fn.Response:
+		return https_fn.Response(body, status=status, headers=self.headers())
+
+	def stream(self, chunks, content_type: str, status: int = 200) -> https_fn.Response:
+		"""Chunked response whose body is produced by iterating chunks while it is sent.
+
+		Exceptions raised while iterating can no longer become a 500 (the status is
+		already sent), so generators should report failures in the body themselves.
+		"""
+		return https_fn.Response(chunks, status=status, headers=self.headers(content_type))
+
+
+class _PipelineStats:
+	"""Per-endpoint request counters and pipeline overhead."""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._endpoints = {}
+		self._last_logged = time.monotonic()
+
+	def record(self, name: str, status: int, overhead_ms: float, handler_ms: float, preflight: bool = False):
+		with self._lock:
+			stats = self._endpoints.get(name)
+			if stats is None:
+				stats = self._endpoints[name] = {
+					"requests": 0, "preflights": 0, "server_errors": 0,
+					"overhead_ms_total": 0.0, "handler_ms_total": 0.0,
+				}
+			if preflight:
+				stats["preflights"] += 1
+			else:
+				stats["requests"] += 1
+				stats["server_errors"] += 1 if status >= 500 else 0
+				stats["handler_ms_total"] += handler_ms
+			stats["overhead_ms_total"] += overhead_ms
+
+			now = time.monotonic()
+			log_due = now - self._last_logged >= STATS_LOG_INTERVAL_SECONDS
+			if log_due:
+				self._last_logged = now
+
+		# Each deployed function has its own instances; the periodic log is how their
+		# counters reach Cloud Logging
+		if log_due:
+			try:
+				logger.info(f"runtime_stats {dumps(collect_stats())}")
+			except Exception:
+				logger.exception("Failed to log runtime stats")
+
+	def snapshot(self) -> dict:
+		with self._lock:
+			snapshot = {}
+			for name, stats in self._endpoints.items():
+				calls = stats["requests"] + stats["preflights"]
+				snapshot[name] = {
+					**stats,
+					"overhead_ms_avg": (stats["overhead_ms_total"] / calls) if calls else 0.0,
+					"handler_ms_avg": (stats["handler_ms_total"] / stats["requests"]) if stats["requests"] else 0.0,
+				}
+			return snapshot
+
+
+_stats = _PipelineStats()
+register_stats("pipeline", _stats.snapshot)
+
+
+def _id_token_from(req: https_fn.Request, body: dict):
+	token = body.get("idToken") or body.get("id_token")
+	if token:
+		return token
+	authorization = req.headers.get("Authorization", "")
+	if authorization.startswith("Bearer "):
+		return authorization[len("Bearer "):].strip() or None
+	return None
+
+
+def endpoint(methods=("POST",), cors: CorsPolicy = DEFAULT_CORS, auth: str = None):
+	"""Wrap a handler taking a RequestContext into a Cloud Functions request handler.
+
+	Args:
+		methods: Allowed HTTP methods besides OPTIONS; others get a JSON 405
+		cors: CorsPolicy applied to preflights and every response, or None for no CORS
+		auth: None, "required" (missing idToken -> 400, invalid -> 401) or "optional"
+			(verified when present, ignored when invalid). The token is read from the
+			idToken/id_token body field or an Authorization: Bearer header.
+	"""
+	allowed_methods = frozenset(methods)
+
+	def decorator(handler):
+		name = handler.__name__
+
+		@functools.wraps(handler)
+		def wrapper(req: https_fn.Request) -> https_fn.Response:
+			started = time.perf_counter()
+			origin = req.headers.get("Origin") if cors else None
+			cors_headers = cors.headers_for(origin) if cors else ()
+
+			if cors and req.method == "OPTIONS":
+				response = https_fn.Response("", status=cors.preflight_status, headers=cors_headers)
+				_stats.record(name, response.status_code, (time.perf_counter() - started) * 1000, 0.0, preflight=True)
+				return response
+
+			ctx = RequestContext(req, cors_headers)
+			handler_ms = 0.0
+			auth_ms = 0.0
+			try:
+				if req.method not in allowed_methods:
+					response = ctx.error("Method Not Allowed", 405)
+				else:
+					if req.method != "GET":
+						ctx.body = req.get_json(silent=True) or {}
+						if not isinstance(ctx.body, dict):
+							ctx.body = {}
+
+					response = None
+					if auth:
+						auth_started = time.perf_counter()
+						response = _resolve_auth(ctx, name, required=auth == "required")
+						auth_ms = (time.perf_counter() - auth_started) * 1000
+
+					if response is None:
+						handler_started = time.perf_counter()
+						try:
+							response = handler(ctx)
+						finally:
+							handler_ms = (time.perf_counter() - handler_started) * 1000
+			except Exception as e:
+				logger.exception(f"Unexpected error in {name}")
+				response = ctx.error(f"Internal Server Error: {str(e)}", 500)
+
+			overhead_ms = (time.perf_counter() - started) * 1000 - handler_ms
+			response.headers["Server-Timing"] = (
+				f"pipeline;dur={overhead_ms - auth_ms:.2f}, auth;dur={auth_ms:.2f}, handler;dur={handler_ms:.2f}"
+			)
+			_stats.record(name, response.status_code, overhead_ms, handler_ms)
+			return response
+
+		wrapper.handler = handler
+		return wrapper
+
+	return decorator
+
+
+def _resolve_auth(ctx: RequestContext, name: str, required: bool):
+	"""Verify the caller's ID token into ctx; return an error response or None."""
+	id_token = _id_token_from(ctx.req, ctx.body)
+	if not id_token:
+		return ctx.error("Missing idToken", 400) if required else None
+
+	# Imported here so endpoints without authentication never load firebase_admin.auth
+	from handlers.auth import verify_id_token
+	try:
+		ctx.decoded = verify_id_token(id_token)
+		ctx.uid = ctx.decoded.get("uid")
+	except Exception:
+		if not required:
+			return None
+		logger.exception(f"Failed to verify id token in {name}")
+		return ctx.error("Invalid ID token", 401)
+	return None
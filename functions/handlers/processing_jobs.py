@@ -0,0 +1,250 @@
+"""Durable background jobs: processing_jobs/{job_id}.
+
+An endpoint records a job document and returns its id immediately; a worker
+performs the slow work and writes its progress to the document, which clients
+read back instead of holding the request open. Jobs move through
+
+	queued -> running -> (retrying -> running)* -> succeeded | failed
+
+How a queued job reaches its worker is chosen by PROCESSING_JOB_DISPATCH:
+
+	tasks   (default) enqueue on the job's Cloud Tasks queue function. An attempt
+	        that fails transiently raises JobRetry and Cloud Tasks redelivers it
+	        with backoff, so no instance sleeps between attempts.
+	local   run the worker on an in-process thread with the same attempt limit and
+	        backoff schedule, for the emulator and tests.
+
+A worker attempt claims the job in a transaction, which increments attempts and
+skips jobs that already finished, so a redelivered task never runs a job twice.
+
+An attempt that crashes counts like a transient failure (run_attempt), so the
+last one fails the job. An instance killed mid-attempt (timeout, out of memory)
+cannot record anything; a job whose last attempt has been running for longer
+than JOB_LEASE_SECONDS is failed when it is read (expire_stale_job).
+"""
+
+from firebase_admin import firestore
+
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import os
+import threading
+import time
+
+from handlers.common import logger, register_stats
+
+PROCESSING_JOBS_COLLECTION = "processing_jobs"
+
+# "tasks" or "local", see the module docstring
+PROCESSING_JOB_DISPATCH = os.environ.get("PROCESSING_JOB_DISPATCH", "tasks")
+
+# Attempt limit and backoff; main.py passes the same values to the queue's RetryConfig
+JOB_MAX_ATTEMPTS = 5
+JOB_MIN_BACKOFF_SECONDS = 10
+JOB_MAX_BACKOFF_SECONDS = 40
+
+JOB_TERMINAL_STATES = ("succeeded", "failed")
+
+# Longest a worker attempt can run: the queue function's timeout_sec in main.py plus margin
+JOB_LEASE_SECONDS = 360
+
+
+class JobRetry(Exception):
+	"""Raised by a worker attempt that failed transiently and should be retried."""
+
+
+def job_ref(db, job_id: str):
+	return db.collection(PROCESSING_JOBS_COLLECTION).document(job_id)
+
+
+def backoff_seconds(attempt: int) -> float:
+	"""Delay before the attempt after attempt: doubling from the minimum, capped."""
+	return min(JOB_MIN_BACKOFF_SECONDS * 2 ** (attempt - 1), JOB_MAX_BACKOFF_SECONDS)
+
+
+class _JobStats:
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._stats = {"created": 0, "attempts": 0, "retries": 0, "succeeded": 0, "failed": 0, "dispatch_failures": 0}
+
+	def add(self, key: str):
+		with self._lock:
+			self._stats[key] += 1
+
+	def snapshot(self) -> dict:
+		with self._lock:
+			return dict(self._stats)
+
+
+_job_stats = _JobStats()
+register_stats("processing_jobs", _job_stats.snapshot)
+
+
+def create_job(db, kind: str, uid: str, params: dict) -> str:
+	"""Record a queued job and return its id.
+
+	Args:
+		db: Firestore client the job is stored in
+		kind: Worker the job is meant for, e.g. "shopify_processing"
+		uid: User the job belongs to; only they (and admins) may read it
+		params: Input of the worker. Do not put credentials here, job documents
+			outlive the request.
+	"""
+	ref = db.collection(PROCESSING_JOBS_COLLECTION).document()
+	ref.set({
+		"kind": kind,
+		"uid": uid,
+		"params": params,
+		"status": "queued",
+		"attempts": 0,
+		"max_attempts": JOB_MAX_ATTEMPTS,
+		"result": None,
+		"error": None,
+		"created_at": firestore.SERVER_TIMESTAMP,
+		"updated_at": firestore.SERVER_TIMESTAMP,
+	})
+	_job_stats.add("created")
+	return ref.id
+
+
+@firestore.transactional
+def _claim_job(transaction, ref):
+	"""Mark the job running for one more attempt; None if it is missing or finished."""
+	snapshot = ref.get(transaction=transaction)
+	if not snapshot.exists:
+		return None
+	job = snapshot.to_dict()
+	if job.get("status") in JOB_TERMINAL_STATES:
+		return None
+	job["attempts"] = job.get("attempts", 0) + 1
+	transaction.update(ref, {
+		"status": "running",
+		"attempts": job["attempts"],
+		"updated_at": firestore.SERVER_TIMESTAMP,
+	})
+	return job
+
+
+def claim_job(db, job_id: str):
+	"""Start an attempt of job_id; returns the job data (attempts already counted) or None."""
+	job = _claim_job(db.transaction(), job_ref(db, job_id))
+	if job is not None:
+		_job_stats.add("attempts")
+	return job
+
+
+def update_job(db, job_id: str, fields: dict):
+	"""Record progress (e.g. the result of a finished step) on a running job."""
+	job_ref(db, job_id).update({**fields, "updated_at": firestore.SERVER_TIMESTAMP})
+
+
+def finish_job(db, job_id: str, status: str, result: dict = None, error: str = None):
+	"""Move a job to succeeded or failed."""
+	_job_stats.add(status)
+	update_job(db, job_id, {
+		"status": status,
+		"result": result,
+		"error": error,
+		"finished_at": firestore.SERVER_TIMESTAMP,
+	})
+
+
+def retry_job(db, job_id: str, job: dict, error: str):
+	"""Record a transient failure: raises JobRetry, or fails the job on its last attempt."""
+	if job["attempts"] >= job.get("max_attempts", JOB_MAX_ATTEMPTS):
+		logger.error(f"Job {job_id} failed after {job['attempts']} attempts: {error}")
+		finish_job(db, job_id, "failed", error=error)
+		return
+	_job_stats.add("retries")
+	update_job(db, job_id, {"status": "retrying", "error": error})
+	logger.warning(f"Job {job_id} attempt {job['attempts']} failed, retrying: {error}")
+	raise JobRetry(error)
+
+
+def run_attempt(db, job_id: str, job: dict, attempt):
+	"""Run attempt() for a claimed job, treating an unexpected error as a transient failure.
+
+	Raises:
+		JobRetry: If attempt() raised it, or crashed and attempts remain
+	"""
+	try:
+		attempt()
+	except JobRetry:
+		raise
+	except Exception as e:
+		logger.exception(f"Job {job_id} attempt {job['attempts']} crashed")
+		retry_job(db, job_id, job, f"Unexpected error: {str(e)}")
+
+
+def expire_stale_job(db, job_id: str, job: dict) -> dict:
+	"""Fail a job whose last attempt outlived JOB_LEASE_SECONDS; returns the job as stored after."""
+	updated_at = job.get("updated_at")
+	if (
+		job.get("status") != "running"
+		or job.get("attempts", 0) < job.get("max_attempts", JOB_MAX_ATTEMPTS)
+		or not isinstance(updated_at, datetime.datetime)
+	):
+		return job
+	if (datetime.datetime.now(datetime.timezone.utc) - updated_at).total_seconds() < JOB_LEASE_SECONDS:
+		return job
+	error = "The worker stopped before finishing the last attempt"
+	logger.error(f"Job {job_id} failed: {error}")
+	finish_job(db, job_id, "failed", error=error)
+	return job_ref(db, job_id).get().to_dict()
+
+
+class LocalJobWorker:
+	"""In-process stand-in for the Cloud Tasks queue.
+
+	Runs run(job_id) on a small thread pool, sleeping backoff_seconds(attempt)
+	between attempts that raise JobRetry, like the queue's retry policy would.
+
+	Args:
+		run: Worker attempt, called with the job id
+		max_workers: Jobs run concurrently
+		sleep: Called with the backoff delay; tests pass a no-op
+	"""
+
+	def __init__(self, run, max_workers: int = 2, sleep=time.sleep):
+		self._run = run
+		self._sleep = sleep
+		self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="processing-job")
+
+	def _run_with_retries(self, job_id: str):
+		for attempt in range(1, JOB_MAX_ATTEMPTS + 1):
+			try:
+				return self._run(job_id)
+			except JobRetry:
+				if attempt == JOB_MAX_ATTEMPTS:
+					raise
+				self._sleep(backoff_seconds(attempt))
+			except Exception:
+				logger.exception(f"Job {job_id} worker crashed")
+				raise
+
+	def submit(self, job_id: str):
+		"""Run job_id in the background; returns a Future of the worker's result."""
+		return self._executor.submit(self._run_with_retries, job_id)
+
+
+def dispatch_job(job_id: str, queue_function: str, local_worker: LocalJobWorker = None):
+	"""Hand a queued job to its worker.
+
+	Args:
+		job_id: Job created with create_job
+		queue_function: Name of the Cloud Tasks queue function running the worker
+		local_worker: Worker used when PROCESSING_JOB_DISPATCH is "local"
+
+	Raises:
+		Exception: If the task could not be enqueued; the job stays queued
+	"""
+	if PROCESSING_JOB_DISPATCH == "local":
+		local_worker.submit(job_id)
+		return
+	# Imported here so only the endpoints that enqueue jobs load the Tasks client
+	from firebase_admin import functions
+	try:
+		functions.task_queue(queue_function).enqueue({"job_id": job_id})
+	except Exception:
+		_job_stats.add("dispatch_failures")
+		raise
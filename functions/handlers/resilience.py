@@ -0,0 +1,300 @@
+"""Retries, a retry budget and circuit breakers for outbound HTTP calls.
+
+resilient.request() sends through the shared http_client and adds, per call:
+
+	retries         up to RetryPolicy.attempts, on connection errors (including
+	                connect timeouts and SSL errors) and on the policy's retry
+	                statuses, sleeping a jittered exponential delay ("full
+	                jitter": uniform in [0, min(max_delay, base * 2**n)]). POST and
+	                PATCH requests are only retried when they carry an
+	                Idempotency-Key header, since the first attempt may have been
+	                processed before its connection failed.
+	retry budget    one budget for the whole instance: every call deposits
+	                RETRY_BUDGET_RATIO of a retry, every retry spends one. When an
+	                outage makes every call fail, retries stop at that ratio of the
+	                traffic instead of multiplying it.
+	circuit breaker one per target host. CIRCUIT_FAILURE_THRESHOLD consecutive
+	                failures (connection errors, read timeouts, 5xx) open it; calls then
+	                raise CircuitOpenError without touching the network until
+	                CIRCUIT_RESET_SECONDS pass and a single probe call is let through.
+	                HostBusyError (this instance's per-host concurrency limit) is
+	                neither a failure nor retried.
+
+CircuitOpenError is a requests ConnectionError, so callers already handling
+requests exceptions fail fast without changes. Breaker states and counters are
+reported under the "resilience" stats.
+"""
+
+import requests
+
+from collections import OrderedDict
+import random
+import threading
+import time
+import urllib.parse
+
+from handlers.common import logger, register_stats
+from handlers.http_client import HostBusyError, http_client
+
+# Consecutive failures that open a host's breaker, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30
+
+# Retries allowed per call across the instance, plus a floor for low traffic
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MIN_PER_SECOND = 0.5
+RETRY_BUDGET_MAX_TOKENS = 20
+
+# Hosts with a breaker kept at once; verify_gtm can reach arbitrary store hosts
+CIRCUIT_MAX_HOSTS = 256
+
+# Methods retried only with an idempotency key, and the header carrying it
+NON_IDEMPOTENT_METHODS = frozenset(("POST", "PATCH"))
+IDEMPOTENCY_KEY_HEADER = "idempotency-key"
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+	"""Raised instead of calling a host whose circuit breaker is open."""
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+	"""Full-jitter exponential delay before retrying after the given attempt (1-based)."""
+	return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class RetryPolicy:
+	"""How one kind of call is retried.
+
+	Args:
+		attempts: Total attempts including the first
+		base_delay: Backoff base in seconds
+		max_delay: Backoff cap in seconds
+		retry_statuses: Response statuses worth another attempt
+		read_timeout_is_failure: False for calls expected to outlast their read
+			timeout, whose timeouts then do not count against the breaker
+	"""
+
+	def __init__(self, attempts: int = 1, base_delay: float = 0.5, max_delay: float = 4.0,
+				 retry_statuses=(), read_timeout_is_failure: bool = True):
+		self.attempts = attempts
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.retry_statuses = frozenset(retry_statuses)
+		self.read_timeout_is_failure = read_timeout_is_failure
+
+
+# Single attempt: only the circuit breaker applies
+NO_RETRY = RetryPolicy()
+
+
+class RetryBudget:
+	"""Token bucket limiting retries to a fraction of the calls made."""
+
+	def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND,
+				 max_tokens: float = RETRY_BUDGET_MAX_TOKENS):
+		self._ratio = ratio
+		self._min_per_second = min_per_second
+		self._max_tokens = max_tokens
+		self._tokens = max_tokens
+		self._refilled_at = time.monotonic()
+		self._lock = threading.Lock()
+		self._stats = {"deposits": 0, "withdrawals": 0, "exhausted": 0}
+
+	def _refill(self, amount: float):
+		now = time.monotonic()
+		amount += (now - self._refilled_at) * self._min_per_second
+		self._refilled_at = now
+		self._tokens = min(self._max_tokens, self._tokens + amount)
+
+	def deposit(self):
+		"""Record a call, earning it ratio of a retry."""
+		with self._lock:
+			self._refill(self._ratio)
+			self._stats["deposits"] += 1
+
+	def withdraw(self) -> bool:
+		"""Take one retry; False when the budget is spent."""
+		with self._lock:
+			self._refill(0)
+			if self._tokens < 1:
+				self._stats["exhausted"] += 1
+				return False
+			self._tokens -= 1
+			self._stats["withdrawals"] += 1
+			return True
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {**self._stats, "tokens": round(self._tokens, 2)}
+
+
+class CircuitBreaker:
+	"""Closed -> open after consecutive failures -> half-open probe -> closed or open."""
+
+	def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+				 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+		self.name = name
+		self._failure_threshold = failure_threshold
+		self._reset_seconds = reset_seconds
+		self._state = "closed"
+		self._failures = 0
+		self._opened_at = None
+		self._probing = False
+		self._lock = threading.Lock()
+		self._stats = {"successes": 0, "failures": 0, "short_circuited": 0, "opened": 0}
+
+	def before_call(self):
+		"""Raise CircuitOpenError unless a call may go out now."""
+		with self._lock:
+			if self._state == "open":
+				if time.monotonic() - self._opened_at < self._reset_seconds:
+					self._stats["short_circuited"] += 1
+					raise CircuitOpenError(f"Circuit open for {self.name}")
+				self._state = "half_open"
+			if self._state == "half_open":
+				if self._probing:
+					self._stats["short_circuited"] += 1
+					raise CircuitOpenError(f"Circuit half-open for {self.name}, probe in flight")
+				self._probing = True
+
+	def record_success(self):
+		with self._lock:
+			self._stats["successes"] += 1
+			self._failures = 0
+			self._probing = False
+			if self._state != "closed":
+				logger.info(f"Circuit for {self.name} closed")
+			self._state = "closed"
+
+	def record_failure(self):
+		with self._lock:
+			self._stats["failures"] += 1
+			self._failures += 1
+			self._probing = False
+			if self._state == "half_open" or self._failures >= self._failure_threshold:
+				if self._state != "open":
+					self._stats["opened"] += 1
+					logger.warning(f"Circuit for {self.name} opened after {self._failures} consecutive failures")
+				self._state = "open"
+				self._opened_at = time.monotonic()
+
+	def release(self):
+		"""End a call whose outcome says nothing about the host's health."""
+		with self._lock:
+			self._probing = False
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {**self._stats, "state": self._state, "consecutive_failures": self._failures}
+
+
+class ResilientClient:
+	"""http_client with per-host circuit breakers, a shared retry budget and retries."""
+
+	def __init__(self, client=http_client, budget: RetryBudget = None, max_hosts: int = CIRCUIT_MAX_HOSTS,
+				 sleep=time.sleep):
+		self._client = client
+		self._budget = budget or RetryBudget()
+		self._max_hosts = max_hosts
+		self._sleep = sleep
+		self._breakers = OrderedDict()
+		self._lock = threading.Lock()
+		self._stats = {"calls": 0, "retries": 0, "budget_denied": 0}
+
+	def breaker(self, host: str) -> CircuitBreaker:
+		with self._lock:
+			breaker = self._breakers.get(host)
+			if breaker is None:
+				breaker = self._breakers[host] = CircuitBreaker(host)
+				while len(self._breakers) > self._max_hosts:
+					self._breakers.popitem(last=False)
+			else:
+				self._breakers.move_to_end(host)
+			return breaker
+
+	def request(self, method: str, url: str, policy: RetryPolicy = NO_RETRY, **kwargs) -> requests.Response:
+		"""Send a request through the breaker of url's host, retrying per policy.
+
+		Returns the last response, including one with a retry status once attempts or
+		the budget run out. POST and PATCH requests without an Idempotency-Key header
+		get a single attempt whatever the policy.
+
+		Raises:
+			CircuitOpenError: If the host's breaker is open
+			HostBusyError: If this instance has too many requests to the host in flight
+			requests.exceptions.RequestException: The last error once attempts or the
+				budget run out
+		"""
+		breaker = self.breaker(urllib.parse.urlparse(url).netloc.lower())
+		self._budget.deposit()
+		with self._lock:
+			self._stats["calls"] += 1
+		if method.upper() in NON_IDEMPOTENT_METHODS and not any(
+			name.lower() == IDEMPOTENCY_KEY_HEADER for name in (kwargs.get("headers") or {})
+		):
+			policy = RetryPolicy(read_timeout_is_failure=policy.read_timeout_is_failure)
+
+		attempt = 1
+		while True:
+			breaker.before_call()
+			try:
+				response = self._client.request(method, url, **kwargs)
+			except HostBusyError:
+				breaker.release()
+				raise
+			except requests.exceptions.ConnectionError:
+				breaker.record_failure()
+				if not self._may_retry(policy, attempt):
+					raise
+			except requests.exceptions.ReadTimeout:
+				if policy.read_timeout_is_failure:
+					breaker.record_failure()
+				else:
+					breaker.release()
+				raise
+			except BaseException:
+				breaker.release()
+				raise
+			else:
+				if response.status_code >= 500:
+					breaker.record_failure()
+				else:
+					breaker.record_success()
+				if response.status_code not in policy.retry_statuses or not self._may_retry(policy, attempt):
+					return response
+
+			self._sleep(backoff_delay(attempt, policy.base_delay, policy.max_delay))
+			attempt += 1
+
+	def _may_retry(self, policy: RetryPolicy, attempt: int) -> bool:
+		if attempt >= policy.attempts:
+			return False
+		if not self._budget.withdraw():
+			with self._lock:
+				self._stats["budget_denied"] += 1
+			return False
+		with self._lock:
+			self._stats["retries"] += 1
+		return True
+
+	def get(self, url: str, policy: RetryPolicy = NO_RETRY, **kwargs) -> requests.Response:
+		return self.request("GET", url, policy, **kwargs)
+
+	def post(self, url: str, policy: RetryPolicy = NO_RETRY, **kwargs) -> requests.Response:
+		return self.request("POST", url, policy, **kwargs)
+
+	def stats(self) -> dict:
+		"""Call and retry counters, the retry budget and each host's breaker."""
+		with self._lock:
+			breakers = list(self._breakers.values())
+			stats = dict(self._stats)
+		return {
+			**stats,
+			"budget": self._budget.stats(),
+			"open_circuits": sum(1 for breaker in breakers if breaker.stats()["state"] != "closed"),
+			"circuits": {breaker.name: breaker.stats() for breaker in breakers},
+		}
+
+
+resilient = ResilientClient()
+register_stats("resilience", resilient.stats)
@@ -0,0 +1,334 @@
+"""Daily checkout rollups per shop: shops_events/{shop}/rollups/{YYYY-MM-DD}.
+
+track_checkout folds every new event into the rollup of its day with Increment
+transforms, so dashboards read one small document per day instead of every raw
+event. Each rollup holds:
+
+	checkout_count        number of checkout events
+	revenue               {currency: summed ecommerce value}
+	kons_ref_counts       {kons_ref: checkout events attributed to it}
+	unattributed_count    checkout events without a kons_ref
+
+Both maps are keyed by values the storefront sends, and Firestore rejects some
+map keys (non-strings, "", reserved "__x__", over 1500 bytes), which would fail
+the whole commit. Currencies are therefore kept only when they look like an ISO
+4217 code (otherwise UNKNOWN), and a kons_ref that is not a plain identifier of
+at most KONS_REF_KEY_MAX_LENGTH characters is stored under "h_" plus a hash of
+it (rollup_key_for_kons_ref).
+
+Like the event counters (see handlers.counters), a shop's day is spread over
+shards: shard 0 is stored as {YYYY-MM-DD}, shard n as {YYYY-MM-DD}_{n}, all with
+the same date field. read_rollups merges the shards of each day.
+
+Rollups can be recomputed from the raw events for backfill or drift repair:
+
+	python -m handlers.rollups rebuild <shop_doc_id> [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+"""
+
+from firebase_functions import https_fn
+from firebase_admin import firestore
+
+import datetime
+import hashlib
+import re
+
+from handlers.common import logger
+from handlers.counters import read_event_count
+from handlers.pipeline import RequestContext, endpoint
+
+ROLLUPS_COLLECTION = "rollups"
+
+# Longest range get_checkout_rollups returns in one call
+ROLLUP_MAX_DAYS = 400
+
+# Firestore allows at most 500 writes per batch
+_BATCH_LIMIT = 500
+
+# Map keys of the rollups, see the module docstring
+_CURRENCY_RE = re.compile(r'^[A-Z]{3}$')
+_KONS_REF_KEY_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_\-]*$')
+KONS_REF_KEY_MAX_LENGTH = 128
+
+
+def event_day(timestamp, fallback: datetime.datetime = None) -> str:
+	"""UTC day (YYYY-MM-DD) a checkout event belongs to.
+
+	Args:
+		timestamp: The event's timestamp: an ISO 8601 string as sent by the storefront
+			("2025-11-03T15:07:25.103Z") or a datetime
+		fallback: Used when timestamp is missing or unparseable (the stored received_at
+			when rebuilding); defaults to now, which is when a live event is received
+
+	Returns:
+		The UTC day of the timestamp
+	"""
+	moment = None
+	if isinstance(timestamp, datetime.datetime):
+		moment = timestamp
+	elif isinstance(timestamp, str) and timestamp:
+		try:
+			moment = datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+		except ValueError:
+			moment = None
+	if moment is None:
+		moment = fallback if isinstance(fallback, datetime.datetime) else datetime.datetime.now(datetime.timezone.utc)
+	elif moment.tzinfo is not None:
+		moment = moment.astimezone(datetime.timezone.utc)
+	return moment.strftime("%Y-%m-%d")
+
+
+def _event_value(event: dict) -> float:
+	try:
+		return float(event.get("value") or 0)
+	except (TypeError, ValueError):
+		return 0.0
+
+
+def rollup_currency(event: dict) -> str:
+	"""Key of the event's currency in revenue: an ISO 4217 style code or UNKNOWN."""
+	currency = event.get("currency")
+	if isinstance(currency, str) and _CURRENCY_RE.match(currency.strip().upper()):
+		return currency.strip().upper()
+	return "UNKNOWN"
+
+
+def rollup_key_for_kons_ref(kons_ref) -> str:
+	"""Key of a kons_ref in kons_ref_counts: the ref itself, or "h_" + a hash of it."""
+	key = str(kons_ref)
+	if len(key) <= KONS_REF_KEY_MAX_LENGTH and _KONS_REF_KEY_RE.match(key):
+		return key
+	return "h_" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def rollup_ref(db, shop_doc_id: str, day: str, shard: int = 0):
+	doc_id = day if not shard else f"{day}_{shard}"
+	return db.collection("shops_events").document(shop_doc_id).collection(ROLLUPS_COLLECTION).document(doc_id)
+
+
+def rollup_increment(event: dict, day: str) -> dict:
+	"""Merge payload folding one event into the rollup of day; write with set(merge=True)."""
+	kons_ref = event.get("kons_ref")
+	update = {
+		"date": day,
+		"checkout_count": firestore.Increment(1),
+		"revenue": {rollup_currency(event): firestore.Increment(_event_value(event))},
+		"updated_at": firestore.SERVER_TIMESTAMP,
+	}
+	if kons_ref:
+		update["kons_ref_counts"] = {rollup_key_for_kons_ref(kons_ref): firestore.Increment(1)}
+	else:
+		update["unattributed_count"] = firestore.Increment(1)
+	return update
+
+
+def compute_rollups(events) -> dict:
+	"""Recompute rollups from raw event dicts; returns {day: rollup document}."""
+	rollups = {}
+	for event in events:
+		day = event_day(event.get("timestamp"), event.get("received_at"))
+		rollup = rollups.get(day)
+		if rollup is None:
+			rollup = rollups[day] = {
+				"date": day,
+				"checkout_count": 0,
+				"revenue": {},
+				"kons_ref_counts": {},
+				"unattributed_count": 0,
+			}
+		rollup["checkout_count"] += 1
+		currency = rollup_currency(event)
+		rollup["revenue"][currency] = rollup["revenue"].get(currency, 0) + _event_value(event)
+		kons_ref = event.get("kons_ref")
+		if kons_ref:
+			key = rollup_key_for_kons_ref(kons_ref)
+			rollup["kons_ref_counts"][key] = rollup["kons_ref_counts"].get(key, 0) + 1
+		else:
+			rollup["unattributed_count"] += 1
+	return rollups
+
+
+def rollup_increments(events) -> dict:
+	"""Merge payloads folding several events into their days' rollups: {day: payload}."""
+	increments = {}
+	for day, rollup in compute_rollups(events).items():
+		update = {
+			"date": day,
+			"checkout_count": firestore.Increment(rollup["checkout_count"]),
+			"revenue": {currency: firestore.Increment(amount) for currency, amount in rollup["revenue"].items()},
+			"updated_at": firestore.SERVER_TIMESTAMP,
+		}
+		if rollup["kons_ref_counts"]:
+			update["kons_ref_counts"] = {
+				kons_ref: firestore.Increment(count) for kons_ref, count in rollup["kons_ref_counts"].items()
+			}
+		if rollup["unattributed_count"]:
+			update["unattributed_count"] = firestore.Increment(rollup["unattributed_count"])
+		increments[day] = update
+	return increments
+
+
+def read_rollups(db, shop_doc_id: str, start_day: str, end_day: str) -> dict:
+	"""Read the rollups of [start_day, end_day] and their totals.
+
+	Args:
+		db: Firestore client
+		shop_doc_id: Sanitized shop affiliation (document id under shops_events)
+		start_day: First day, YYYY-MM-DD, inclusive
+		end_day: Last day, YYYY-MM-DD, inclusive
+
+	Returns:
+		{"days": [rollup, ...] oldest first, "totals": rollup-shaped sums over the range}
+	"""
+
+	def add(target, rollup):
+		target["checkout_count"] += rollup.get("checkout_count", 0)
+		target["unattributed_count"] += rollup.get("unattributed_count", 0)
+		for currency, amount in (rollup.get("revenue") or {}).items():
+			target["revenue"][currency] = target["revenue"].get(currency, 0) + amount
+		for kons_ref, count in (rollup.get("kons_ref_counts") or {}).items():
+			target["kons_ref_counts"][kons_ref] = target["kons_ref_counts"].get(kons_ref, 0) + count
+
+	query = (
+		db.collection("shops_events").document(shop_doc_id).collection(ROLLUPS_COLLECTION)
+		.where("date", ">=", start_day)
+		.where("date", "<=", end_day)
+		.order_by("date")
+	)
+	days = {}
+	totals = {"checkout_count": 0, "revenue": {}, "kons_ref_counts": {}, "unattributed_count": 0}
+	for snapshot in query.stream():
+		rollup = snapshot.to_dict()
+		day = days.get(rollup["date"])
+		if day is None:
+			day = days[rollup["date"]] = {
+				"date": rollup["date"], "checkout_count": 0, "revenue": {}, "kons_ref_counts": {}, "unattributed_count": 0,
+			}
+		add(day, rollup)
+		add(totals, rollup)
+	return {"days": list(days.values()), "totals": totals}
+
+
+def rebuild_rollups(db, shop_doc_id: str, start_day: str = None, end_day: str = None) -> dict:
+	"""Recompute a shop's rollups from its raw events and overwrite the stored ones.
+
+	Each day is rewritten as a single shard 0 document; its other shards, and rollups
+	inside the range that no longer have events, are deleted.
+
+	Args:
+		db: Firestore client
+		shop_doc_id: Sanitized shop affiliation (document id under shops_events)
+		start_day: First day to rebuild, YYYY-MM-DD, inclusive (default: all)
+		end_day: Last day to rebuild, YYYY-MM-DD, inclusive (default: all)
+
+	Returns:
+		Counts of events read and rollups written and deleted
+	"""
+	shop_ref = db.collection("shops_events").document(shop_doc_id)
+
+	def in_range(day):
+		return (start_day is None or day >= start_day) and (end_day is None or day <= end_day)
+
+	events = 0
+	selected = []
+	fields = ["timestamp", "received_at", "currency", "value", "kons_ref"]
+	for snapshot in shop_ref.collection("events").select(fields).stream():
+		events += 1
+		event = snapshot.to_dict()
+		if in_range(event_day(event.get("timestamp"), event.get("received_at"))):
+			selected.append(event)
+	rollups = compute_rollups(selected)
+
+	stale = [
+		snapshot.reference
+		for snapshot in shop_ref.collection(ROLLUPS_COLLECTION).select(["date"]).stream()
+		if in_range(snapshot.get("date")) and snapshot.id not in rollups
+	]
+
+	batch = db.batch()
+	pending = 0
+	for day, rollup in rollups.items():
+		batch.set(rollup_ref(db, shop_doc_id, day), {**rollup, "updated_at": firestore.SERVER_TIMESTAMP})
+		pending += 1
+		if pending == _BATCH_LIMIT:
+			batch.commit()
+			batch, pending = db.batch(), 0
+	for ref in stale:
+		batch.delete(ref)
+		pending += 1
+		if pending == _BATCH_LIMIT:
+			batch.commit()
+			batch, pending = db.batch(), 0
+	if pending:
+		batch.commit()
+
+	logger.info(f"Rebuilt rollups for {shop_doc_id}: {events} events, {len(rollups)} days written, {len(stale)} deleted")
+	return {"events_read": events, "rollups_written": len(rollups), "rollups_deleted": len(stale)}
+
+
+def _user_owns_shop(db, uid: str, shop_doc_id: str) -> bool:
+	"""An Ikas shop is stored under users/{uid}/shops/{shop name}; affiliations are <shop name>.<domain>."""
+	shop_name = shop_doc_id.split(".", 1)[0]
+	shop_doc = db.collection("users").document(uid).collection("shops").document(shop_name).get()
+	return shop_doc.exists and (shop_doc.to_dict() or {}).get("verified", False)
+
+
+@endpoint(auth="required")
+def get_checkout_rollups(ctx: RequestContext) -> https_fn.Response:
+	"""Return a shop's daily checkout rollups for a date range.
+
+	Expects: POST request with idToken and shop (the affiliation, e.g.
+		"dev-alfreya.ikas.shop") in body, optional from and to (YYYY-MM-DD,
+		default the last 30 days). Admins may read any shop.
+	Returns: JSON with one rollup per day that had checkouts, the range totals and
+		the shop's all-time total_events
+	"""
+	shop = (ctx.body.get("shop") or "").strip().lower()
+	if not shop:
+		return ctx.error("Missing shop", 400)
+
+	today = datetime.datetime.now(datetime.timezone.utc).date()
+	try:
+		end = datetime.date.fromisoformat(ctx.body.get("to") or today.isoformat())
+		start = datetime.date.fromisoformat(ctx.body.get("from") or (end - datetime.timedelta(days=29)).isoformat())
+	except ValueError:
+		return ctx.error("from and to must be YYYY-MM-DD dates", 400)
+	if start > end:
+		return ctx.error("from must not be after to", 400)
+	if (end - start).days >= ROLLUP_MAX_DAYS:
+		return ctx.error(f"Date range must not exceed {ROLLUP_MAX_DAYS} days", 400)
+
+	db = firestore.client()
+	if not ctx.authz.is_admin and not _user_owns_shop(db, ctx.uid, shop):
+		return ctx.error("Shop not found for user", 403)
+
+	result = read_rollups(db, shop, start.isoformat(), end.isoformat())
+	return ctx.json({
+		"shop": shop,
+		"from": start.isoformat(),
+		"to": end.isoformat(),
+		"total_events": read_event_count(db, shop)["total_events"],
+		**result
+	})
+
+
+def main():
+	import argparse
+
+	from firebase_admin import initialize_app
+	import firebase_admin
+
+	parser = argparse.ArgumentParser(description="Maintain checkout rollups")
+	subcommands = parser.add_subparsers(dest="command", required=True)
+	rebuild = subcommands.add_parser("rebuild", help="recompute a shop's rollups from its raw events")
+	rebuild.add_argument("shop", help="shop document id under shops_events (the sanitized affiliation)")
+	rebuild.add_argument("--from", dest="start_day", help="first day to rebuild (YYYY-MM-DD)")
+	rebuild.add_argument("--to", dest="end_day", help="last day to rebuild (YYYY-MM-DD)")
+	args = parser.parse_args()
+
+	if not firebase_admin._apps:
+		initialize_app()
+	print(rebuild_rollups(firestore.client(), args.shop, args.start_day, args.end_day))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,87 @@
+"""JSON encoding of Firestore data for responses.
+
+Firestore documents come back with DatetimeWithNanoseconds, GeoPoint and
+DocumentReference values that the json module cannot encode. Instead of walking
+every document to convert them first, the encoders below convert them from the
+encoder's default hook while they serialize, so a response is built in a single
+pass with no intermediate copies of the documents. Encoder instances are created
+once per instance and reused.
+
+Timestamps are written as ISO 8601 strings by default, or as epoch milliseconds
+with timestamps="millis" (the format the admin user listings have always used).
+
+The pipeline imports this module for every endpoint, so it does not import the
+Firestore client: GeoPoint and DocumentReference values can only exist once an
+endpoint has loaded it, and they are looked up in sys.modules then.
+"""
+
+import base64
+import datetime
+import json
+import sys
+
+
+def to_millis(value):
+	"""Convert a timestamp to epoch milliseconds.
+
+	Args:
+		value: A datetime (including Firestore's DatetimeWithNanoseconds), or a number
+			of epoch seconds or milliseconds (numbers below 1e10 are taken as seconds)
+
+	Returns:
+		Epoch milliseconds, or None for empty or unsupported values
+	"""
+	if not value:
+		return None
+	if isinstance(value, datetime.datetime):
+		return int(value.timestamp() * 1000)
+	if isinstance(value, (int, float)):
+		if value < 10000000000:  # Less than year 2286 in seconds
+			return int(value * 1000)
+		return int(value)
+	return None
+
+
+def _encode_common(value):
+	firestore_v1 = sys.modules.get("google.cloud.firestore_v1")
+	if firestore_v1 is not None:
+		if isinstance(value, firestore_v1.GeoPoint):
+			return {"latitude": value.latitude, "longitude": value.longitude}
+		if isinstance(value, firestore_v1.DocumentReference):
+			return value.path
+	if isinstance(value, datetime.date):
+		return value.isoformat()
+	if isinstance(value, (bytes, bytearray)):
+		return base64.b64encode(value).decode()
+	if isinstance(value, (set, frozenset)):
+		return list(value)
+	# Anything else is reported rather than failing the whole response
+	return str(value)
+
+
+def _encode_iso(value):
+	if isinstance(value, datetime.datetime):
+		return value.isoformat()
+	return _encode_common(value)
+
+
+def _encode_millis(value):
+	if isinstance(value, datetime.datetime):
+		return int(value.timestamp() * 1000)
+	return _encode_common(value)
+
+
+_ENCODERS = {
+	"iso": json.JSONEncoder(default=_encode_iso),
+	"millis": json.JSONEncoder(default=_encode_millis),
+}
+
+
+def dumps(payload, timestamps: str = "iso") -> str:
+	"""Serialize payload to JSON, converting Firestore values on the fly.
+
+	Args:
+		payload: JSON-compatible data that may contain Firestore values
+		timestamps: "iso" for ISO 8601 strings or "millis" for epoch milliseconds
+	"""
+	return _ENCODERS[timestamps].encode(payload)
@@ -0,0 +1,217 @@
+"""Shopify OAuth shop-ownership verification: shopify_auth, shopify_callback, shopify_finalize."""
+
+from firebase_functions import https_fn
+from firebase_admin import firestore
+
+import hmac
+import hashlib
+import secrets
+import urllib.parse
+
+from handlers.common import (
+	SHOPIFY_API_KEY,
+	SHOPIFY_API_SECRET,
+	SHOPIFY_SCOPES,
+	SHOPIFY_REDIRECT_URI,
+	FRONTEND_URL,
+	logger,
+	is_valid_shop_domain,
+	is_valid_return_url,
+)
+from handlers.pipeline import RequestContext, endpoint
+
+
+@endpoint(methods=("GET", "POST"))
+def shopify_auth(ctx: RequestContext) -> https_fn.Response:
+	"""Start Shopify OAuth to verify shop ownership.
+
+	Expects: JSON or form body or query param with 'shop' (shop domain) and 'return_url' (frontend URL to redirect back to).
+	Returns: 302 redirect to Shopify authorize URL with state equal to a Firestore-backed nonce.
+	"""
+	body = ctx.query
+	if ctx.method == "POST":
+		body = dict(ctx.body)
+		try:
+			form = ctx.req.form
+			if form:
+				body.update({k: v for k, v in form.items()})
+		except Exception:
+			pass
+
+	shop = (body.get("shop") or body.get("shop_domain") or "").strip()
+	return_url = (body.get("return_url") or "").strip()
+
+	if not is_valid_shop_domain(shop):
+		return ctx.text("Invalid shop domain", status=400)
+
+	# Validate the return URL for security (prevent open redirect attacks)
+	if return_url and not is_valid_return_url(return_url):
+		logger.warning(f"Invalid or untrusted return URL provided: {return_url}")
+		return ctx.text("Invalid return URL - must be from a trusted origin", status=400)
+
+	db = firestore.client()
+	
+	# Check if shop already exists and is verified in shopify_states
+	existing_states = db.collection("shopify_states").where("shop", "==", shop).where("verified", "==", True).limit(1).stream()
+	existing_verified = list(existing_states)
+	
+	if existing_verified:
+		return ctx.json({"success": True, "message": "This shop is already verified", "already_verified": True})
+	
+	# Create a Firestore state document that will be referenced by Shopify's redirect
+	state_id = secrets.token_urlsafe(24)
+	state_ref = db.collection("shopify_states").document(state_id)
+	
+	# Store the return URL in the state document for use in the callback
+	state_data = {
+		"shop": shop,
+		"verified": False,
+		"created_at": firestore.SERVER_TIMESTAMP,
+	}
+	
+	# Only add return_url if it was provided and validated
+	if return_url:
+		state_data["return_url"] = return_url
+		logger.info(f"Storing return URL in state: {return_url}")
+	
+	state_ref.set(state_data)
+
+	params = {
+		"client_id": SHOPIFY_API_KEY,
+		"scope": SHOPIFY_SCOPES,
+		"redirect_uri": SHOPIFY_REDIRECT_URI,
+		"state": state_id,
+	}
+	logger.info(f"Initiating Shopify OAuth for shop {shop} with state {state_id} and redirect URI {SHOPIFY_REDIRECT_URI}")
+	logger.info(f"OAuth URL params: {params}")
+	query = urllib.parse.urlencode(params)
+	redirect_url = f"https://{shop}/admin/oauth/authorize?{query}"
+	logger.info(f"Returning Shopify OAuth URL: {redirect_url}")
+
+	# Return the redirect URL in JSON format instead of using 302 redirect
+	return ctx.json({"redirect_url": redirect_url, "success": True})
+
+
+@endpoint(methods=("GET",), cors=None)
+def shopify_callback(ctx: RequestContext) -> https_fn.Response:
+	"""Handle Shopify OAuth redirect: verify HMAC and mark the state doc as verified.
+
+	Does NOT exchange code for an access token. After verifying HMAC the state doc is
+	updated and the user is redirected back to the frontend with the state id and shop
+	using the return_url stored in the state document.
+	"""
+	try:
+		qp = ctx.query
+		shop = qp.get("shop")
+		provided_hmac = qp.get("hmac")
+		state_id = qp.get("state")
+
+		if not shop or not provided_hmac or not state_id:
+			return https_fn.Response("Missing required params", status=400)
+
+		if not is_valid_shop_domain(shop):
+			return https_fn.Response("Invalid shop domain", status=400)
+
+		# Verify HMAC using the SHOPIFY_API_SECRET
+		params = {k: v for k, v in qp.items() if k not in ("hmac", "signature")}
+		message = urllib.parse.urlencode(sorted(params.items()))
+		calculated_hmac = hmac.new(SHOPIFY_API_SECRET.encode(), message.encode(), hashlib.sha256).hexdigest()
+		if not hmac.compare_digest(calculated_hmac, provided_hmac):
+			logger.warning("HMAC verification failed. calculated=%s provided=%s", calculated_hmac, provided_hmac)
+			return https_fn.Response("HMAC verification failed", status=400)
+
+		db = firestore.client()
+		state_ref = db.collection("shopify_states").document(state_id)
+		state = state_ref.get()
+		
+		# Get the return URL from the state document
+		return_url = None
+		if state.exists:
+			data = state.to_dict()
+			return_url = data.get("return_url")
+			# update verified flag and timestamp
+			state_ref.update({"verified": True, "verified_at": firestore.SERVER_TIMESTAMP})
+			logger.info(f"Retrieved return URL from state: {return_url}")
+		else:
+			# If the state doc doesn't exist, create it as verified (robustness)
+			state_ref.set({"shop": shop, "verified": True, "verified_at": firestore.SERVER_TIMESTAMP})
+			logger.warning(f"State document {state_id} did not exist, created new verified state")
+
+		# Build the redirect location
+		dashboard_path = f"/dashboard?shop={urllib.parse.quote_plus(shop)}&state={urllib.parse.quote_plus(state_id)}"
+		
+		# Use the stored return_url if available and valid, otherwise fallback to FRONTEND_URL or relative path
+		if return_url:
+			# Parse the return URL to get the origin
+			try:
+				parsed = urllib.parse.urlparse(return_url)
+				origin = f"{parsed.scheme}://{parsed.netloc}"
+				location = origin + dashboard_path
+				logger.info(f"Redirecting to stored return URL: {location}")
+			except Exception as e:
+				logger.error(f"Error parsing return URL: {str(e)}, falling back")
+				# Fallback to FRONTEND_URL or relative path
+				if FRONTEND_URL:
+					location = FRONTEND_URL.rstrip("/") + dashboard_path
+				else:
+					location = dashboard_path
+		elif FRONTEND_URL:
+			location = FRONTEND_URL.rstrip("/") + dashboard_path
+			logger.info(f"Using FRONTEND_URL fallback: {location}")
+		else:
+			location = dashboard_path
+			logger.info(f"Using relative path fallback: {location}")
+
+		logger.info(f"Final redirect location: {location}")
+		return https_fn.Response("", status=302, headers={"Location": location})
+	except Exception:
+		logger.exception("Unexpected error in shopify_callback")
+		return https_fn.Response("Internal Server Error", status=500)
+
+
+@endpoint(auth="required")
+def shopify_finalize(ctx: RequestContext) -> https_fn.Response:
+	"""Finalize verification: frontend posts idToken and state (state id).
+
+	This verifies the Firebase ID token, ensures the state doc is marked verified, then
+	writes the shop under users/{uid}/shops/{shop} with verified:true.
+	"""
+	uid = ctx.uid
+	state_id = ctx.body.get("state")
+
+	if not state_id:
+		return ctx.text("Missing idToken or state", status=400)
+
+	db = firestore.client()
+	state_ref = db.collection("shopify_states").document(state_id)
+	state = state_ref.get()
+	if not state.exists:
+		return ctx.text("Invalid or expired state", status=400)
+	data = state.to_dict()
+	if not data.get("verified"):
+		return ctx.text("Shop not verified by Shopify", status=400)
+
+	shop = data.get("shop")
+	if not shop:
+		return ctx.text("State missing shop", status=400)
+
+	# Write to user's shops subcollection
+	user_shop_ref = db.collection("users").document(uid).collection("shops").document(shop)
+	user_shop_ref.set({"verified": True, "verified_at": firestore.SERVER_TIMESTAMP})
+
+	# Also create/update the main user document with shop information
+	user_doc_ref = db.collection("users").document(uid)
+	user_doc_ref.set({
+		"userId": uid,
+		"shop": shop,
+		"verified": True,
+		"lastUpdated": firestore.SERVER_TIMESTAMP
+	}, merge=True)
+
+	# Optionally delete the state doc
+	try:
+		state_ref.delete()
+	except Exception:
+		logger.warning("Failed to delete state doc %s", state_id)
+
+	return ctx.text("OK", status=200)
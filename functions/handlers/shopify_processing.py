@@ -0,0 +1,448 @@
+"""Starting the Shopify product sync in the external project.
+
+start_shopify_processing records a processing job (see handlers.processing_jobs)
+and returns its id; run_shopify_processing_job creates the web pixel and triggers
+the external sync in the background, retrying while the new access token
+propagates. get_processing_job reads the job back.
+"""
+
+from firebase_functions import https_fn
+from firebase_admin import firestore
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from handlers.common import EXTERNAL_FIREBASE_PROJECT_ID, logger, register_stats
+from handlers.external import get_external_firebase_client
+from handlers.resilience import CircuitOpenError, RetryPolicy, resilient
+from handlers.pipeline import RequestContext, endpoint
+from handlers.processing_jobs import (
+	LocalJobWorker, claim_job, create_job, dispatch_job, expire_stale_job, finish_job, job_ref, retry_job,
+	run_attempt, update_job
+)
+from handlers.shopify_status import normalize_shop_domain
+
+PROCESSING_JOB_KIND = "shopify_processing"
+
+# Cloud Tasks queue function running the jobs, declared in main.py
+PROCESSING_JOB_QUEUE = "run_shopify_processing_job"
+
+# Job fields returned by get_processing_job
+PROCESSING_JOB_FIELDS = (
+	"status", "attempts", "max_attempts", "pixel_status", "step_timings_ms", "result", "error",
+	"created_at", "updated_at", "finished_at",
+)
+
+# Outbound calls of a job attempt. Both are POSTs sent with an Idempotency-Key derived
+# from the job id (job_idempotency_key), so connection errors get one quick in-process
+# retry; the job queue retries the attempt itself. The sync function usually outlasts
+# the read timeout, so its timeouts do not count against the circuit breaker.
+SHOPIFY_ADMIN_POLICY = RetryPolicy(attempts=3, retry_statuses=(429, 502, 503, 504))
+EXTERNAL_TRIGGER_POLICY = RetryPolicy(attempts=2, base_delay=1.0, read_timeout_is_failure=False)
+
+# The web pixel is created on this pool while the job's thread triggers the sync
+PROCESSING_STEP_WORKERS = 4
+
+_step_executor = ThreadPoolExecutor(max_workers=PROCESSING_STEP_WORKERS, thread_name_prefix="processing-step")
+
+
+class _StepTimings:
+	"""Duration totals of the processing job steps on this instance."""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._steps = {}
+
+	def record(self, timings_ms: dict):
+		with self._lock:
+			for step, elapsed_ms in timings_ms.items():
+				entry = self._steps.setdefault(step, {"count": 0, "ms_total": 0.0, "ms_max": 0.0})
+				entry["count"] += 1
+				entry["ms_total"] += elapsed_ms
+				entry["ms_max"] = max(entry["ms_max"], elapsed_ms)
+
+	def snapshot(self) -> dict:
+		with self._lock:
+			return {step: dict(entry) for step, entry in self._steps.items()}
+
+
+_step_timings = _StepTimings()
+register_stats("processing_steps", _step_timings.snapshot)
+
+
+def _timed(function, *args) -> tuple:
+	"""Call function(*args); return (result, elapsed milliseconds)."""
+	started = time.perf_counter()
+	result = function(*args)
+	return result, round((time.perf_counter() - started) * 1000, 1)
+
+
+def _read_access_token(external_db, normalized_shop: str) -> tuple:
+	"""Return (session_id, access token or None, session exists)."""
+	session_id = f"offline_{normalized_shop}"
+	logger.info(f"Fetching Shopify session with ID: {session_id}")
+	session_doc = external_db.collection('shopify_sessions').document(session_id).get()
+	if not session_doc.exists:
+		return session_id, None, False
+	return session_id, session_doc.to_dict().get('accessToken'), True
+
+
+def job_idempotency_key(job_id: str, step: str) -> str:
+	"""Idempotency-Key of one step of a job, the same for every attempt and retry."""
+	return f"{job_id}:{step}"
+
+
+def create_web_pixel(external_db, normalized_shop: str, access_token: str, idempotency_key: str) -> dict:
+	"""Create the tracking web pixel in the shop and record the connection.
+
+	Pixel failures are reported in the result rather than raised: the product sync
+	is more important, and the pixel can be retried later. A shop holds one pixel
+	per app, so repeating the mutation cannot create a second one.
+
+	Returns:
+		{"connected", "message", "pixelId"}
+	"""
+	pixel_result = {
+		"connected": False,
+		"message": "Pixel creation not attempted",
+		"pixelId": None
+	}
+
+	try:
+		logger.info(f"Creating web pixel for shop: {normalized_shop}")
+		
+		# GraphQL mutation to create web pixel
+		graphql_mutation = """
+		mutation webPixelCreate($webPixel: WebPixelInput!) {
+			webPixelCreate(webPixel: $webPixel) {
+				userErrors {
+					field
+					message
+				}
+				webPixel {
+					settings
+					id
+				}
+			}
+		}
+		"""
+		
+		# Extract shop name from domain (remove .myshopify.com)
+		shop_name = normalized_shop.replace('.myshopify.com', '')
+		
+		# Prepare GraphQL variables
+		variables = {
+			"webPixel": {
+				"settings": {
+					"accountID": "konsiyer-tracking-pixel",
+					"shopID": shop_name
+				}
+			}
+		}
+		
+		# Make GraphQL request to Shopify Admin API
+		shopify_graphql_url = f"https://{normalized_shop}/admin/api/2025-10/graphql.json"
+		
+		pixel_response = resilient.post(
+			shopify_graphql_url,
+			SHOPIFY_ADMIN_POLICY,
+			json={
+				"query": graphql_mutation,
+				"variables": variables
+			},
+			headers={
+				"Content-Type": "application/json",
+				"X-Shopify-Access-Token": access_token,
+				"Idempotency-Key": idempotency_key
+			}
+		)
+		
+		if pixel_response.status_code == 200:
+			pixel_data = pixel_response.json()
+			
+			if pixel_data.get("data", {}).get("webPixelCreate", {}).get("webPixel", {}).get("id"):
+				pixel_id = pixel_data["data"]["webPixelCreate"]["webPixel"]["id"]
+				pixel_result = {
+					"connected": True,
+					"message": "✅ Web pixel created and connected successfully!",
+					"pixelId": pixel_id
+				}
+				logger.info(f"Successfully created web pixel for {normalized_shop}: {pixel_id}")
+				
+				# Store pixel connection in external Firebase
+				try:
+					pixel_connections_ref = external_db.collection("pixel_connections").document(shop_name)
+					pixel_connections_ref.set({
+						"shop": normalized_shop,
+						"pixelId": pixel_id,
+						"connected": True,
+						"connectedAt": firestore.SERVER_TIMESTAMP
+					}, merge=True)
+				except Exception as e:
+					logger.warning(f"Failed to store pixel connection in Firebase: {str(e)}")
+			
+			elif pixel_data.get("data", {}).get("webPixelCreate", {}).get("userErrors"):
+				errors = pixel_data["data"]["webPixelCreate"]["userErrors"]
+				
+				# Check if pixel already exists
+				already_set_error = any("already been set" in str(err.get("message", "")) for err in errors)
+				
+				if already_set_error:
+					pixel_result = {
+						"connected": True,
+						"message": "✅ Web pixel already exists and is connected!",
+						"pixelId": "existing-pixel"
+					}
+					logger.info(f"Web pixel already exists for {normalized_shop}")
+				else:
+					error_messages = ", ".join([err.get("message", "") for err in errors])
+					pixel_result = {
+						"connected": False,
+						"message": f"Failed to create pixel: {error_messages}",
+						"pixelId": None
+					}
+					logger.warning(f"Failed to create web pixel for {normalized_shop}: {error_messages}")
+		else:
+			logger.error(f"Pixel GraphQL request failed: {pixel_response.status_code} {pixel_response.text}")
+			pixel_result = {
+				"connected": False,
+				"message": f"Pixel API request failed: {pixel_response.status_code}",
+				"pixelId": None
+			}
+			
+	except Exception as e:
+		logger.exception(f"Error creating web pixel: {str(e)}")
+		pixel_result = {
+			"connected": False,
+			"message": f"Error creating pixel: {str(e)}",
+			"pixelId": None
+		}
+
+	return pixel_result
+
+
+def trigger_product_sync(payload: dict, idempotency_key: str) -> tuple:
+	"""Call the external project's function that runs the product sync.
+
+	The sync takes 40-50 minutes, so the call only waits long enough to confirm the
+	request was received; a read timeout means it started. Every attempt of a job
+	sends the same Idempotency-Key, so the function can tell a retry from a new sync.
+
+	Returns:
+		(outcome, detail): outcome is "started", "retry" for failures worth another
+		attempt (401 while the new access token propagates, SSL and connection
+		errors) or "failed"; detail describes the failure
+	"""
+	# The external Firebase project should have a publicly accessible Cloud Function
+	# Format: https://us-central1-<project-id>.cloudfunctions.net/<function-name>
+	function_url = f"https://us-central1-{EXTERNAL_FIREBASE_PROJECT_ID}.cloudfunctions.net/upload_products_shopify_app_with_embeddings"
+	logger.info(f"Calling external Firebase function: {function_url}")
+
+	try:
+		# The shared client keeps the TLS connection to the external project warm
+		response = resilient.post(
+			function_url,
+			EXTERNAL_TRIGGER_POLICY,
+			json=payload,
+			headers={"Content-Type": "application/json", "Idempotency-Key": idempotency_key},
+			timeout=(10, 30),  # (connect timeout, read timeout) in seconds
+			verify=True  # Ensure SSL verification is enabled
+		)
+	except requests.exceptions.ReadTimeout:
+		# Timeout is OK - processing was likely started successfully
+		logger.info(f"Request timed out but processing likely started for shop: {payload['shop_domain']}")
+		return "started", None
+	except CircuitOpenError as circuit_error:
+		# The function failed repeatedly just now; let the queue retry after its backoff
+		logger.warning(f"Not calling external function: {str(circuit_error)}")
+		return "retry", f"External processing function unavailable: {str(circuit_error)}"
+	except requests.exceptions.SSLError as ssl_error:
+		return "retry", f"SSL connection error to external function: {str(ssl_error)}"
+	except requests.exceptions.ConnectionError as conn_error:
+		# Includes connect timeouts: the request never reached the function
+		return "retry", f"Connection error to external function: {str(conn_error)}"
+	except Exception as e:
+		logger.error(f"Error calling external function: {str(e)}")
+		return "failed", f"Failed to start processing: {str(e)}"
+
+	if response.status_code == 200:
+		return "started", None
+	if response.status_code == 401:
+		# Likely the Shopify access token propagation delay
+		return "retry", "External function returned 401"
+	error_message = response.text or "Failed to start processing"
+	logger.error(f"External function error: {response.status_code} - {error_message}")
+	return "failed", f"Failed to start processing ({response.status_code}): {error_message}"
+
+
+def run_shopify_processing_job(job_id: str):
+	"""One attempt of a processing job: create the web pixel and trigger the sync.
+
+	Both steps only need the access token, so the pixel is created on the step pool
+	while this thread calls the external function; the attempt takes as long as
+	the slower of the two. Step durations are stored in step_timings_ms. The access
+	token is read from the session on every attempt, and a pixel created by an
+	earlier attempt is not created again.
+
+	Raises:
+		JobRetry: If the trigger failed transiently or the attempt crashed, and
+			attempts remain
+	"""
+	db = firestore.client()
+	job = claim_job(db, job_id)
+	if job is None:
+		logger.info(f"Processing job {job_id} is missing or already finished")
+		return
+	run_attempt(db, job_id, job, lambda: _run_claimed_job(db, job_id, job))
+
+
+def _run_claimed_job(db, job_id: str, job: dict):
+	params = job["params"]
+	shop_domain = params["shop_domain"]
+	normalized_shop = normalize_shop_domain(shop_domain)
+	logger.info(f"Running processing job {job_id} for {shop_domain}, attempt {job['attempts']}")
+
+	try:
+		external_db = get_external_firebase_client()
+		session_id, access_token, _ = _read_access_token(external_db, normalized_shop)
+	except Exception as e:
+		logger.exception(f"Failed to retrieve access token from external Firebase: {str(e)}")
+		retry_job(db, job_id, job, f"Failed to retrieve shop credentials: {str(e)}")
+		return
+	if not access_token:
+		finish_job(db, job_id, "failed", error=f"Access token not found in session {session_id}. Please reconnect your shop.")
+		return
+
+	started = time.perf_counter()
+	pixel_result = job.get("pixel_status")
+	pixel_future = None
+	if not (pixel_result or {}).get("connected"):
+		pixel_future = _step_executor.submit(
+			_timed, create_web_pixel, external_db, normalized_shop, access_token, job_idempotency_key(job_id, "pixel")
+		)
+
+	(outcome, detail), trigger_ms = _timed(trigger_product_sync, {
+		"shop_domain": shop_domain,
+		"access_token": access_token,
+		"user_email": params.get("user_email"),
+		"user_name": params.get("user_name", ""),
+		"shopify_user_id": params.get("shopify_user_id", "")
+	}, job_idempotency_key(job_id, "trigger"))
+
+	timings = {"trigger": trigger_ms}
+	if pixel_future is not None:
+		pixel_result, timings["pixel"] = pixel_future.result()
+	timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+	_step_timings.record(timings)
+	logger.info(f"Processing job {job_id} steps took {timings} ms")
+	update_job(db, job_id, {"pixel_status": pixel_result, "step_timings_ms": timings})
+
+	if outcome == "retry":
+		retry_job(db, job_id, job, detail)
+	elif outcome == "failed":
+		finish_job(db, job_id, "failed", error=detail)
+	else:
+		logger.info(f"Processing started for {shop_domain}, pixel status: {pixel_result['connected']}")
+		finish_job(db, job_id, "succeeded", result={"message": "Product sync started successfully"})
+
+
+# Used instead of the Cloud Tasks queue when PROCESSING_JOB_DISPATCH=local
+local_worker = LocalJobWorker(run_shopify_processing_job)
+
+
+@endpoint(auth="required")
+def start_shopify_processing(ctx: RequestContext) -> https_fn.Response:
+	"""Queue the product sync of a Shopify shop in the external project.
+
+	Checks the shop's access token, records a processing job and returns its id
+	without waiting for the web pixel or the external function; poll
+	get_processing_job or get_processing_status for progress.
+
+	Returns: 202 JSON with job_id and status "queued"
+	"""
+	uid = ctx.uid
+	shop_domain = ctx.body.get("shop_domain", "").strip()
+
+	# Validate required fields
+	if not shop_domain:
+		return ctx.error("Missing required field: shop_domain", 400)
+	if not EXTERNAL_FIREBASE_PROJECT_ID:
+		return ctx.error("External Firebase project not configured", 500)
+
+	logger.info(f"Starting Shopify processing for shop: {shop_domain}, user: {uid}")
+
+	# Fail fast on a missing token instead of queueing a job that cannot run
+	try:
+		session_id, access_token, session_exists = _read_access_token(
+			get_external_firebase_client(), normalize_shop_domain(shop_domain)
+		)
+	except Exception as e:
+		logger.exception(f"Failed to retrieve access token from external Firebase: {str(e)}")
+		return ctx.error(f"Failed to retrieve shop credentials: {str(e)}", 500)
+
+	if not session_exists:
+		logger.error(f"Shopify session not found: {session_id}")
+		return ctx.json({
+			"error": "Shopify session not found. Please reconnect your shop.",
+			"session_id": session_id
+		}, status=404)
+	if not access_token:
+		logger.error(f"Access token not found in session: {session_id}")
+		return ctx.error("Access token not found in session. Please reconnect your shop.", 404)
+
+	db = firestore.client()
+	job_id = create_job(db, PROCESSING_JOB_KIND, uid, {
+		"shop_domain": shop_domain,
+		"user_email": ctx.decoded.get("email"),
+		"user_name": ctx.body.get("user_name", ""),
+		"shopify_user_id": ctx.body.get("shopify_user_id", "")
+	})
+
+	try:
+		dispatch_job(job_id, PROCESSING_JOB_QUEUE, local_worker)
+	except Exception as e:
+		logger.exception(f"Failed to dispatch processing job {job_id}: {str(e)}")
+		finish_job(db, job_id, "failed", error=f"Failed to queue processing: {str(e)}")
+		return ctx.json({"error": "Failed to queue processing, please try again", "job_id": job_id}, status=503)
+
+	logger.info(f"Queued processing job {job_id} for shop: {shop_domain}")
+	return ctx.json({
+		"success": True,
+		"message": "Product sync queued",
+		"shop_domain": shop_domain,
+		"job_id": job_id,
+		"status": "queued"
+	}, status=202)
+
+
+@endpoint(methods=("GET",), auth="required")
+def get_processing_job(ctx: RequestContext) -> https_fn.Response:
+	"""Status of a job queued by start_shopify_processing.
+
+	Expects: GET with job_id and the ID token in an Authorization: Bearer header;
+		only the user who started the job and admins may read it
+	Returns: JSON with job_id, shop_domain, status (queued, running, retrying,
+		succeeded, failed), attempts, pixel_status, step_timings_ms (pixel,
+		trigger and total duration of the last attempt), result and error
+	"""
+	job_id = ctx.query.get("job_id")
+	if not job_id:
+		return ctx.error("job_id parameter is required", 400)
+
+	db = firestore.client()
+	snapshot = job_ref(db, job_id).get()
+	if not snapshot.exists:
+		return ctx.error("Processing job not found", 404)
+
+	job = snapshot.to_dict()
+	if job.get("uid") != ctx.uid and not ctx.authz.is_admin:
+		return ctx.error("Processing job not found", 404)
+	job = expire_stale_job(db, job_id, job)
+
+	response_data = {"job_id": job_id, "shop_domain": (job.get("params") or {}).get("shop_domain")}
+	for field in PROCESSING_JOB_FIELDS:
+		response_data[field] = job.get(field)
+	return ctx.json(response_data)
+
@@ -0,0 +1,811 @@
+"""Read-only Shopify onboarding status endpoints backed by the external project."""
+
+from firebase_functions import https_fn
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from handlers.common import logger, register_stats
+from handlers.external import get_external_firebase_client
+from handlers.pipeline import RequestContext, endpoint
+from handlers.serialization import dumps
+
+# How long wait_shopify_access_token holds a request open (the function timeout is 60s)
+TOKEN_WAIT_DEFAULT_SECONDS = 25
+TOKEN_WAIT_MAX_SECONDS = 50
+
+# Pauses between re-reads when a snapshot listener cannot be used; the last one repeats
+TOKEN_WAIT_POLL_DELAYS = (0.5, 1.0, 2.0, 4.0)
+
+# stream_processing_status: idle time before a heartbeat comment, and how long one
+# connection lasts before the client is asked to reconnect (well below the function
+# timeout, so instances are released between connections)
+STATUS_STREAM_HEARTBEAT_SECONDS = 15
+STATUS_STREAM_MAX_SECONDS = 120
+
+# Milliseconds the browser waits before reconnecting a closed stream
+STATUS_STREAM_RETRY_MS = 3000
+
+# How long a serialized get_processing_status body may be reused while its documents are unchanged
+STATUS_CACHE_TTL_SECONDS = 30
+
+
+def normalize_shop_domain(shop_domain: str) -> str:
+	"""Normalize shop domain to standard format."""
+	if not shop_domain:
+		return ""
+	shop_domain = shop_domain.lower().strip()
+	# Remove https:// or http:// if present
+	shop_domain = shop_domain.replace("https://", "").replace("http://", "")
+	# Remove trailing slash if present
+	shop_domain = shop_domain.rstrip("/")
+	return shop_domain
+
+
+def generate_shop_id(shop_domain: str) -> str:
+	"""
+	Generate a unique shop ID by hashing the shop domain.
+	
+	Args:
+		shop_domain: The Shopify shop domain (e.g., "example.myshopify.com")
+	
+	Returns:
+		A hashed shop ID string
+	"""
+	# Normalize the shop domain first
+	normalized_domain = normalize_shop_domain(shop_domain)
+	
+	# Create SHA256 hash of the domain
+	hash_object = hashlib.sha256(normalized_domain.encode())
+	
+	# Return first 16 characters of the hex digest for a shorter ID
+	return hash_object.hexdigest()[:16]
+
+
+def sync_state(shop_data, processing_data) -> tuple:
+	"""Derive the sync state from the shops and processing_status documents.
+
+	Args:
+		shop_data: shops/{shop_id} data, or None if it does not exist
+		processing_data: processing_status data, or None if it does not exist
+
+	Returns:
+		(has_synced, is_connected, is_processing)
+	"""
+	# Prioritize 'connected' field in shops collection
+	is_connected = False
+	has_synced = False
+	is_processing = False
+
+	if shop_data is not None:
+		has_synced = True
+
+		# Get embedding status to help determine connection state
+		embedding_status = shop_data.get('embeddingStatus', {})
+		embedding_status_value = embedding_status.get('status', 'unknown')
+
+		# Check if currently processing
+		if processing_data is not None:
+			current_status = processing_data.get('simple_status', 'unknown')
+
+			if current_status == 'processing':
+				is_processing = True
+				is_connected = False  # Don't show as connected while processing
+			elif current_status == 'completed':
+				is_processing = False
+				# For completed status, always use shop's connected field
+				connected_field = shop_data.get('connected')
+				if connected_field is not None:
+					is_connected = connected_field
+				else:
+					# Fallback: if embeddings completed or failed, consider connected
+					is_connected = embedding_status_value in ['completed', 'failed']
+			else:  # error state
+				is_processing = False
+				# For error state, check if shop was previously connected
+				connected_field = shop_data.get('connected')
+				if connected_field is not None:
+					is_connected = connected_field
+				else:
+					is_connected = embedding_status_value in ['completed', 'failed']
+		else:
+			# No current processing status, check if shop is connected
+			is_processing = False
+			connected_field = shop_data.get('connected')
+			if connected_field is not None:
+				is_connected = connected_field
+			else:
+				is_connected = embedding_status_value in ['completed', 'failed']
+
+	elif processing_data is not None:
+		# Fallback to processing status if shop document doesn't exist
+		has_synced = True
+		current_status = processing_data.get('simple_status', 'unknown')
+
+		if current_status == 'processing':
+			is_processing = True
+			is_connected = False
+		else:
+			is_processing = False
+			is_connected = False
+
+	return has_synced, is_connected, is_processing
+
+
+@endpoint(methods=("GET",))
+def check_shop_sync_status(ctx: RequestContext) -> https_fn.Response:
+	"""Check if shop has already synced products (from konsiyer-sync project).
+	
+	This checks the external Firebase project to see if the shop is onboarded.
+	"""
+	# Get shop_domain from query parameters
+	query_params = ctx.query
+	shop_domain = query_params.get("shop_domain")
+
+	if not shop_domain:
+		return ctx.json({
+			"error": "shop_domain parameter is required",
+			"usage": "GET /check_shop_sync_status?shop_domain=<domain>"
+		}, status=400)
+
+	# Normalize shop domain
+	normalized_shop_domain = normalize_shop_domain(shop_domain)
+	shop_id = generate_shop_id(normalized_shop_domain)
+
+	# Connect to external Firebase project
+	external_db = get_external_firebase_client()
+
+	# Check if shop has any processing status or shop document
+	processing_doc = external_db.collection('processing_status').document(shop_id).get()
+	shop_doc = external_db.collection('shops').document(shop_id).get()
+
+	has_synced, is_connected, is_processing = sync_state(
+		shop_doc.to_dict() if shop_doc.exists else None,
+		processing_doc.to_dict() if processing_doc.exists else None
+	)
+
+	response_data = {
+		"shop_domain": normalized_shop_domain,
+		"shop_id": shop_id,
+		"has_synced": has_synced,
+		"connected": is_connected,
+		"is_processing": is_processing,
+		"redirect_to_dashboard": has_synced
+	}
+
+	logger.info(f"Sync status check for {shop_id}: has_synced={has_synced}, connected={is_connected}, is_processing={is_processing}")
+
+	return ctx.json(response_data)
+
+
+def _token_check_params(shop_domain: str, start_time_str) -> tuple:
+	"""Normalize the access token check parameters: (shop domain, session id, start_time in seconds)."""
+	# Normalize shop domain
+	normalized_shop_domain = normalize_shop_domain(shop_domain)
+	
+	# Build session ID
+	session_id = f"offline_{normalized_shop_domain}"
+
+	# Parse start_time (convert from milliseconds to seconds if provided)
+	start_time = None
+	if start_time_str:
+		try:
+			start_time = float(start_time_str) / 1000.0  # Convert ms to seconds
+		except (ValueError, TypeError):
+			logger.warning(f"Invalid start_time provided: {start_time_str}")
+	return normalized_shop_domain, session_id, start_time
+
+
+def _session_token_state(session_data, start_time) -> tuple:
+	"""Decide whether a shopify_sessions document holds a usable access token.
+
+	Args:
+		session_data: The session document's data, or None if it does not exist
+		start_time: Epoch seconds the token must have been updated after, or None
+
+	Returns:
+		(token_exists, updated_at in epoch seconds or None)
+	"""
+	if not session_data or not session_data.get('accessToken'):
+		return False, None
+
+	updated_at = None
+	updated_at_field = session_data.get('updatedAt')
+	if hasattr(updated_at_field, 'timestamp'):
+		# It's a Firestore Timestamp
+		updated_at = updated_at_field.timestamp()
+	elif isinstance(updated_at_field, (int, float)):
+		# It's already a numeric timestamp
+		updated_at = float(updated_at_field)
+
+	# Without start_time any token counts; otherwise it must have been updated after it
+	if start_time is None:
+		return True, updated_at
+	token_exists = bool(updated_at and updated_at > start_time)
+	return token_exists, updated_at
+
+
+@endpoint(methods=("GET",))
+def check_shopify_access_token(ctx: RequestContext) -> https_fn.Response:
+	"""Check if Shopify access token exists in shopify_sessions collection.
+	
+	This checks the external Firebase project (shopify_sessions collection) 
+	to see if the access token has been created/updated for the shop.
+	Only returns true if the token exists AND was updated after the provided start_time.
+	"""
+	# Get shop_domain and start_time from query parameters
+	query_params = ctx.query
+	shop_domain = query_params.get("shop_domain")
+	start_time_str = query_params.get("start_time")  # Expected in milliseconds
+
+	if not shop_domain:
+		return ctx.json({
+			"error": "shop_domain parameter is required",
+			"usage": "GET /check_shopify_access_token?shop_domain=<domain>&start_time=<timestamp_ms>"
+		}, status=400)
+
+	normalized_shop_domain, session_id, start_time = _token_check_params(shop_domain, start_time_str)
+
+	# Connect to external Firebase project
+	external_db = get_external_firebase_client()
+
+	# Check if session document exists with access token
+	session_doc = external_db.collection('shopify_sessions').document(session_id).get()
+	token_exists, updated_at = _session_token_state(session_doc.to_dict() if session_doc.exists else None, start_time)
+
+	response_data = {
+		"shop_domain": normalized_shop_domain,
+		"session_id": session_id,
+		"token_exists": token_exists,
+		"updated_at": updated_at
+	}
+
+	logger.info(f"Access token check for {normalized_shop_domain}: token_exists={token_exists}")
+
+	return ctx.json(response_data)
+
+
+class _TokenWaitStats:
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._stats = {"waits": 0, "ready": 0, "timeouts": 0, "listener_failures": 0, "polled_reads": 0}
+
+	def add(self, **counts):
+		with self._lock:
+			for key, value in counts.items():
+				self._stats[key] += value
+
+	def snapshot(self) -> dict:
+		with self._lock:
+			return dict(self._stats)
+
+
+_token_wait_stats = _TokenWaitStats()
+register_stats("token_wait", _token_wait_stats.snapshot)
+
+
+def _poll_session(session_ref, start_time, deadline: float) -> tuple:
+	"""Re-read the session with growing pauses until the token is ready or deadline passes."""
+	delays = iter(TOKEN_WAIT_POLL_DELAYS)
+	delay = 0.0
+	while True:
+		snapshot = session_ref.get()
+		_token_wait_stats.add(polled_reads=1)
+		token_exists, updated_at = _session_token_state(snapshot.to_dict() if snapshot.exists else None, start_time)
+		remaining = deadline - time.monotonic()
+		if token_exists or remaining <= 0:
+			return token_exists, updated_at
+		delay = next(delays, delay)
+		time.sleep(min(delay, remaining))
+
+
+def wait_for_session_token(session_ref, start_time, timeout: float) -> tuple:
+	"""Block until the session document holds a token updated after start_time.
+
+	A snapshot listener is attached to the document, so the wait costs one read
+	plus one per change instead of a read per poll. If the listener cannot be
+	started, the document is re-read with back-off (TOKEN_WAIT_POLL_DELAYS).
+
+	Returns:
+		(token_exists, updated_at) as of the moment the wait ended
+	"""
+	deadline = time.monotonic() + timeout
+	ready = threading.Event()
+	state = {"token_exists": False, "updated_at": None}
+
+	def on_snapshot(snapshots, changes, read_time):
+		for snapshot in snapshots:
+			token_exists, updated_at = _session_token_state(snapshot.to_dict() if snapshot.exists else None, start_time)
+			state["token_exists"], state["updated_at"] = token_exists, updated_at
+			if token_exists:
+				ready.set()
+
+	try:
+		watch = session_ref.on_snapshot(on_snapshot)
+	except Exception as e:
+		logger.warning(f"Snapshot listener unavailable for {session_ref.id}, polling instead: {str(e)}")
+		_token_wait_stats.add(listener_failures=1)
+		return _poll_session(session_ref, start_time, deadline)
+
+	try:
+		ready.wait(max(0.0, deadline - time.monotonic()))
+	finally:
+		watch.unsubscribe()
+	return state["token_exists"], state["updated_at"]
+
+
+@endpoint(methods=("GET",))
+def wait_shopify_access_token(ctx: RequestContext) -> https_fn.Response:
+	"""Long-poll variant of check_shopify_access_token.
+
+	Holds the request open until the shop's shopify_sessions document holds an
+	access token updated after start_time, or until timeout elapses. Clients call
+	it again right away when it returns token_exists: false, so one request
+	replaces a whole stretch of one-second polls.
+
+	Expects: GET with shop_domain, optional start_time (epoch milliseconds) and
+		timeout (seconds, default 25, max 50)
+	Returns: JSON like check_shopify_access_token plus waited_ms and timed_out
+	"""
+	query_params = ctx.query
+	shop_domain = query_params.get("shop_domain")
+
+	if not shop_domain:
+		return ctx.json({
+			"error": "shop_domain parameter is required",
+			"usage": "GET /wait_shopify_access_token?shop_domain=<domain>&start_time=<timestamp_ms>&timeout=<seconds>"
+		}, status=400)
+
+	try:
+		timeout = float(query_params.get("timeout") or TOKEN_WAIT_DEFAULT_SECONDS)
+	except (TypeError, ValueError):
+		return ctx.error("timeout must be a number of seconds", 400)
+	timeout = max(0.0, min(timeout, TOKEN_WAIT_MAX_SECONDS))
+
+	normalized_shop_domain, session_id, start_time = _token_check_params(shop_domain, query_params.get("start_time"))
+
+	external_db = get_external_firebase_client()
+	session_ref = external_db.collection('shopify_sessions').document(session_id)
+
+	started = time.monotonic()
+	token_exists, updated_at = wait_for_session_token(session_ref, start_time, timeout)
+	waited_ms = int((time.monotonic() - started) * 1000)
+	_token_wait_stats.add(waits=1, ready=1 if token_exists else 0, timeouts=0 if token_exists else 1)
+
+	logger.info(f"Access token wait for {normalized_shop_domain}: token_exists={token_exists} after {waited_ms}ms")
+
+	return ctx.json({
+		"shop_domain": normalized_shop_domain,
+		"session_id": session_id,
+		"token_exists": token_exists,
+		"updated_at": updated_at,
+		"waited_ms": waited_ms,
+		"timed_out": not token_exists
+	})
+
+
+def read_processing_docs(external_db, shop_id: str, shop_domain: str = None, include_shop: bool = True,
+						 extra_refs=()) -> tuple:
+	"""Read a shop's processing job and shop documents in one batched get_all.
+
+	The job is stored under processing_status/{shop_id}, or under the shop name
+	for older jobs; both candidates and shops/{shop_id} are fetched together and
+	the fallback is resolved from the batch. extra_refs are read in the same batch.
+
+	Returns:
+		(processing_doc or None, shop_doc or None when include_shop is False,
+		[snapshot for each of extra_refs])
+	"""
+	processing_ref = external_db.collection('processing_status').document(shop_id)
+	refs = [processing_ref]
+	fallback_ref = None
+	if shop_domain:
+		shop_name = normalize_shop_domain(shop_domain).replace('.myshopify.com', '')
+		if shop_name and shop_name != shop_id:
+			fallback_ref = external_db.collection('processing_status').document(shop_name)
+			refs.append(fallback_ref)
+	shop_ref = external_db.collection('shops').document(shop_id) if include_shop else None
+	if shop_ref is not None:
+		refs.append(shop_ref)
+	refs.extend(extra_refs)
+
+	snapshots = {snapshot.reference.path: snapshot for snapshot in external_db.get_all(refs)}
+
+	processing_doc = None
+	for ref in (processing_ref, fallback_ref):
+		snapshot = snapshots.get(ref.path) if ref is not None else None
+		if snapshot is not None and snapshot.exists:
+			processing_doc = snapshot
+			break
+	logger.info(f"Processing status lookup - shop_id: {shop_id}, shop_domain: {shop_domain}, found: {processing_doc.id if processing_doc else None}")
+
+	shop_doc = snapshots.get(shop_ref.path) if shop_ref is not None else None
+	return processing_doc, shop_doc, [snapshots[ref.path] for ref in extra_refs]
+
+
+class _StatusResponseCache:
+	"""Per-instance cache of serialized get_processing_status bodies.
+
+	Entries are keyed on the shop and validated against the update_time of both
+	source documents, so a poll that finds neither document changed reuses the
+	body instead of compiling and serializing it again. Entries expire after
+	STATUS_CACHE_TTL_SECONDS to bound memory.
+	"""
+
+	def __init__(self, max_entries: int = 256):
+		self._max_entries = max_entries
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key, version):
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None and entry[0] == version and time.monotonic() - entry[2] < STATUS_CACHE_TTL_SECONDS:
+				self._entries.move_to_end(key)
+				self.hits += 1
+				return entry[1]
+			self.misses += 1
+			return None
+
+	def put(self, key, version, body: str):
+		with self._lock:
+			self._entries[key] = (version, body, time.monotonic())
+			self._entries.move_to_end(key)
+			while len(self._entries) > self._max_entries:
+				self._entries.popitem(last=False)
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+status_response_cache = _StatusResponseCache()
+register_stats("processing_status_cache", status_response_cache.stats)
+
+
+def build_processing_status(shop_id: str, processing_data: dict, shop_data: dict) -> dict:
+	"""Compile the dashboard's view of a processing job from its two documents."""
+	# Compile comprehensive status
+	response_data = {
+		"shop_id": shop_id,
+		"shop_domain": processing_data.get('shop_domain'),
+		"status": processing_data.get('status', 'unknown'),
+		"stage": processing_data.get('stage', 'unknown'),
+		"progress": processing_data.get('progress', 0),
+		"started_at": processing_data.get('started_at'),
+		"completed_at": processing_data.get('completed_at'),
+		"error": processing_data.get('error'),
+		"error_at": processing_data.get('error_at'),
+		"steps": processing_data.get('steps', {}),
+		"shop_info": {
+			"shop_name": shop_data.get('shopName'),
+			"last_updated": shop_data.get('lastUpdated'),
+			"upload_results": shop_data.get('uploadResults', {}),
+			"embedding_status": shop_data.get('embeddingStatus', {})
+		}
+	}
+
+	# Add simple status for frontend
+	simple_status = "processing"
+	if processing_data.get('status') == 'completed':
+		simple_status = "completed"
+	elif processing_data.get('status') == 'error':
+		simple_status = "error"
+
+	response_data["simple_status"] = simple_status
+
+	# Add summary if completed
+	if processing_data.get('status') == 'completed':
+		processing_summary = processing_data.get('summary', {})
+		upload_results = shop_data.get('uploadResults', {})
+
+		response_data["summary"] = {
+			"total_products_fetched": processing_summary.get('total_products_fetched') or upload_results.get('total_products_fetched', 0),
+			"total_products_processed": processing_summary.get('total_products_processed') or upload_results.get('total_products_processed', 0),
+			"total_variants": processing_summary.get('total_variants') or upload_results.get('total_variants', 0),
+			"apparel_count": processing_summary.get('apparel_count') or upload_results.get('apparel_count', 0),
+			"non_apparel_count": processing_summary.get('non_apparel_count') or upload_results.get('non_apparel_count', 0),
+			"embeddings_generated": processing_summary.get('embeddings_generated', 0),
+			"publishable_products": processing_summary.get('publishable_products', 0),
+			"published_count": processing_summary.get('published_count', 0),
+			"publishing_errors": processing_summary.get('publishing_errors', 0),
+			"completed_at": processing_summary.get('completed_at') or upload_results.get('completed_at')
+		}
+
+	# Filter out None values
+	response_data = {k: v for k, v in response_data.items() if v is not None}
+
+	return response_data
+
+
+@endpoint(methods=("GET",))
+def get_processing_status(ctx: RequestContext) -> https_fn.Response:
+	"""Get processing status for dashboard (from konsiyer-sync project).
+	
+	This retrieves the processing status from the external Firebase project.
+	"""
+	# Get shop_id from query parameters
+	query_params = ctx.query
+	shop_id = query_params.get("shop_id")
+	shop_domain = query_params.get("shop_domain")
+
+	# Determine shop_id if shop_domain provided
+	if not shop_id and shop_domain:
+		shop_id = generate_shop_id(normalize_shop_domain(shop_domain))
+
+	if not shop_id and not shop_domain:
+		return ctx.json({
+			"error": "shop_id or shop_domain parameter is required",
+			"usage": "GET /get_processing_status?shop_id=<shop_id> OR ?shop_domain=<domain>"
+		}, status=400)
+
+	# Connect to external Firebase project
+	external_db = get_external_firebase_client()
+
+	# Get the processing status document (by shop_id or shop name) and the shop document in one round trip
+	processing_doc, shop_doc, _ = read_processing_docs(external_db, shop_id, shop_domain)
+
+	if processing_doc is None:
+		logger.warning(f"Processing status not found for shop_id: {shop_id}, shop_domain: {shop_domain}")
+		return ctx.json({
+			"error": "Processing status not found",
+			"shop_id": shop_id,
+			"suggestion": "No processing job found for this shop"
+		}, status=404)
+
+	# Neither document changed since the last poll on this instance: reuse the serialized body
+	cache_key = (shop_id, processing_doc.id)
+	version = (processing_doc.update_time, shop_doc.update_time if shop_doc.exists else None)
+	body = status_response_cache.get(cache_key, version)
+	if body is None:
+		processing_data = processing_doc.to_dict()
+		shop_data = shop_doc.to_dict() if shop_doc.exists else {}
+		response_data = build_processing_status(shop_id, processing_data, shop_data)
+		body = dumps(response_data)
+		status_response_cache.put(cache_key, version, body)
+		logger.info(f"Retrieved processing status for shop: {shop_id} - {response_data['simple_status']}")
+
+	return https_fn.Response(body, status=200, headers=ctx.headers("application/json"))
+
+
+def _status_version(status: dict) -> str:
+	"""Short digest of a compiled status, used as the SSE event id."""
+	return hashlib.sha256(dumps(status).encode()).hexdigest()[:16]
+
+
+def _sse(event: str, data: dict, event_id: str = None) -> str:
+	lines = [f"event: {event}"]
+	if event_id:
+		lines.append(f"id: {event_id}")
+	lines.append(f"data: {dumps(data)}")
+	return "\n".join(lines) + "\n\n"
+
+
+def _changed_fields(previous: dict, current: dict) -> dict:
+	"""Top-level fields of current that differ from previous; removed fields map to None."""
+	changes = {key: value for key, value in current.items() if previous.get(key) != value}
+	changes.update({key: None for key in previous if key not in current})
+	return changes
+
+
+def _stream_processing_events(processing_ref, shop_ref, shop_id: str, last_event_id: str = None):
+	"""Yield SSE events for one processing job until it ends or the connection expires.
+
+	The first event is a full "snapshot" (skipped when last_event_id shows the
+	client already has the current state); later "status" events carry only the
+	fields that changed. "end" is sent once the job completed or failed.
+	"""
+	condition = threading.Condition()
+	documents = {"processing": None, "shop": None}
+	received = set()
+
+	def listener(name):
+		def on_snapshot(snapshots, changes, read_time):
+			with condition:
+				for snapshot in snapshots:
+					documents[name] = snapshot.to_dict() if snapshot.exists else None
+				received.add(name)
+				condition.notify_all()
+		return on_snapshot
+
+	watches = []
+	try:
+		watches.append(processing_ref.on_snapshot(listener("processing")))
+		watches.append(shop_ref.on_snapshot(listener("shop")))
+
+		yield f"retry: {STATUS_STREAM_RETRY_MS}\n\n"
+
+		deadline = time.monotonic() + STATUS_STREAM_MAX_SECONDS
+		sent = None
+		version = last_event_id
+		while True:
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				# The browser reconnects with Last-Event-ID and resumes from this state
+				return
+			with condition:
+				changed = condition.wait_for(
+					lambda: len(received) == 2 and documents["processing"] is not None and (
+						sent is None or build_processing_status(shop_id, documents["processing"], documents["shop"] or {}) != sent
+					),
+					timeout=min(STATUS_STREAM_HEARTBEAT_SECONDS, remaining)
+				)
+				current = None
+				if changed:
+					current = build_processing_status(shop_id, documents["processing"], documents["shop"] or {})
+
+			if current is None:
+				yield ": heartbeat\n\n"
+				continue
+
+			current_version = _status_version(current)
+			if sent is None:
+				if current_version != version:
+					yield _sse("snapshot", current, current_version)
+			elif current_version != version:
+				yield _sse("status", _changed_fields(sent, current), current_version)
+			sent, version = current, current_version
+
+			if current["simple_status"] in ("completed", "error"):
+				yield _sse("end", {"simple_status": current["simple_status"]}, current_version)
+				return
+	finally:
+		for watch in watches:
+			try:
+				watch.unsubscribe()
+			except Exception:
+				logger.exception(f"Failed to stop processing status listener for {shop_id}")
+
+
+@endpoint(methods=("GET",))
+def stream_processing_status(ctx: RequestContext) -> https_fn.Response:
+	"""Server-Sent Events stream of a shop's processing status.
+
+	Listens to processing_status/{id} and shops/{shop_id} in the external project
+	and pushes updates as they happen, instead of the dashboard polling
+	get_processing_status. Event data uses the get_processing_status fields:
+
+		snapshot   the full status, sent first
+		status     only the fields that changed (removed fields are null)
+		end        the job completed or failed; the stream closes
+
+	Every event id is a digest of the full status. EventSource resends the last
+	one as Last-Event-ID when it reconnects (after STATUS_STREAM_MAX_SECONDS or a
+	dropped connection); if the status has not changed since, the snapshot is
+	skipped. A comment line is sent after STATUS_STREAM_HEARTBEAT_SECONDS of
+	silence to keep proxies from closing the connection.
+
+	Expects: GET with shop_id or shop_domain, optional last_event_id (for clients
+		that cannot send the Last-Event-ID header)
+	Returns: text/event-stream, or JSON 400/404 like get_processing_status
+	"""
+	query_params = ctx.query
+	shop_id = query_params.get("shop_id")
+	shop_domain = query_params.get("shop_domain")
+
+	if not shop_id and shop_domain:
+		shop_id = generate_shop_id(normalize_shop_domain(shop_domain))
+
+	if not shop_id and not shop_domain:
+		return ctx.json({
+			"error": "shop_id or shop_domain parameter is required",
+			"usage": "GET /stream_processing_status?shop_id=<shop_id> OR ?shop_domain=<domain>"
+		}, status=400)
+
+	external_db = get_external_firebase_client()
+
+	# Resolve which document holds the job once; the listeners then follow it
+	processing_doc, _, _ = read_processing_docs(external_db, shop_id, shop_domain, include_shop=False)
+	if processing_doc is None:
+		return ctx.json({
+			"error": "Processing status not found",
+			"shop_id": shop_id,
+			"suggestion": "No processing job found for this shop"
+		}, status=404)
+
+	last_event_id = ctx.req.headers.get("Last-Event-ID") or query_params.get("last_event_id")
+	logger.info(f"Streaming processing status for shop: {shop_id} (resume: {bool(last_event_id)})")
+
+	response = ctx.stream(
+		_stream_processing_events(
+			processing_doc.reference,
+			external_db.collection('shops').document(shop_id),
+			shop_id,
+			last_event_id
+		),
+		"text/event-stream"
+	)
+	response.headers["Cache-Control"] = "no-cache"
+	return response
+
+
+def onboarding_stage(token_exists: bool, has_synced: bool, is_connected: bool, is_processing: bool,
+					 simple_status: str = None) -> str:
+	"""Collapse the token, sync and processing state into the onboarding step to show.
+
+	Returns:
+		"processing"      a product sync is running
+		"error"           the last sync failed and the shop is not connected
+		"connected"       the shop is synced and connected
+		"disconnected"    the shop synced before but is not connected now
+		"ready_to_sync"   the access token exists, nothing synced yet
+		"awaiting_token"  the Shopify app has not created the access token yet
+	"""
+	if is_processing:
+		return "processing"
+	if simple_status == "error" and not is_connected:
+		return "error"
+	if is_connected:
+		return "connected"
+	if has_synced:
+		return "disconnected"
+	if token_exists:
+		return "ready_to_sync"
+	return "awaiting_token"
+
+
+@endpoint(methods=("GET",))
+def get_onboarding_status(ctx: RequestContext) -> https_fn.Response:
+	"""Token, sync and processing state of a Shopify shop in one call.
+
+	Combines check_shopify_access_token, check_shop_sync_status and
+	get_processing_status: the processing_status (by shop id and shop name),
+	shops and shopify_sessions documents are read in a single batched get_all.
+	The sync state is derived from the processing document found by either id,
+	the same one get_processing_status reports.
+
+	Expects: GET with shop_domain, optional start_time (epoch milliseconds, as for
+		check_shopify_access_token)
+	Returns: JSON with stage (see onboarding_stage), token, sync and, when a job
+		exists, processing (the get_processing_status body)
+	"""
+	query_params = ctx.query
+	shop_domain = query_params.get("shop_domain")
+
+	if not shop_domain:
+		return ctx.json({
+			"error": "shop_domain parameter is required",
+			"usage": "GET /get_onboarding_status?shop_domain=<domain>&start_time=<timestamp_ms>"
+		}, status=400)
+
+	normalized_shop_domain, session_id, start_time = _token_check_params(shop_domain, query_params.get("start_time"))
+	shop_id = generate_shop_id(normalized_shop_domain)
+
+	external_db = get_external_firebase_client()
+	session_ref = external_db.collection('shopify_sessions').document(session_id)
+	processing_doc, shop_doc, (session_doc,) = read_processing_docs(
+		external_db, shop_id, normalized_shop_domain, extra_refs=(session_ref,)
+	)
+
+	processing_data = processing_doc.to_dict() if processing_doc is not None else None
+	shop_data = shop_doc.to_dict() if shop_doc.exists else None
+	token_exists, updated_at = _session_token_state(session_doc.to_dict() if session_doc.exists else None, start_time)
+	has_synced, is_connected, is_processing = sync_state(shop_data, processing_data)
+
+	processing = build_processing_status(shop_id, processing_data, shop_data or {}) if processing_data else None
+	stage = onboarding_stage(
+		token_exists, has_synced, is_connected, is_processing,
+		processing["simple_status"] if processing else None
+	)
+
+	logger.info(f"Onboarding status for {normalized_shop_domain}: {stage}")
+
+	response_data = {
+		"shop_domain": normalized_shop_domain,
+		"shop_id": shop_id,
+		"stage": stage,
+		"token": {"token_exists": token_exists, "updated_at": updated_at},
+		"sync": {
+			"has_synced": has_synced,
+			"connected": is_connected,
+			"is_processing": is_processing,
+			"redirect_to_dashboard": has_synced
+		}
+	}
+	if processing:
+		response_data["processing"] = processing
+	return ctx.json(response_data)
@@ -0,0 +1,38 @@
+"""User status endpoint used for conditional routing: check_user_status."""
+
+from firebase_functions import https_fn
+from firebase_admin import firestore
+
+from handlers.pipeline import RequestContext, endpoint
+
+
+@endpoint(auth="required")
+def check_user_status(ctx: RequestContext) -> https_fn.Response:
+	"""Check if user has verified shops for conditional routing.
+	
+	Expects: POST request with idToken in body
+	Returns: JSON with verification status and shop info
+	"""
+	uid = ctx.uid
+	db = firestore.client()
+	
+	# Check main user document
+	user_doc_ref = db.collection("users").document(uid)
+	user_doc = user_doc_ref.get()
+	
+	# Check for verified shops in subcollection
+	shops_ref = db.collection("users").document(uid).collection("shops")
+	verified_shops_query = shops_ref.where("verified", "==", True).limit(1)
+	verified_shops = list(verified_shops_query.stream())
+	
+	has_verified_shop = len(verified_shops) > 0
+	user_data = user_doc.to_dict() if user_doc.exists else {}
+	
+	response_data = {
+		"verified": has_verified_shop,
+		"hasShop": has_verified_shop,
+		"shop": user_data.get("shop") if has_verified_shop else None,
+		"userId": uid
+	}
+
+	return ctx.json(response_data)
@@ -0,0 +1,158 @@
+"""Bounded in-memory write-behind buffers flushed by a background thread.
+
+A buffer accepts items until it holds max_items, then refuses them so callers can
+fall back to a synchronous write (backpressure). A daemon thread hands queued
+items to the flush callback once flush_items are waiting or the oldest item is
+max_age_seconds old. That age is the durability window: items accepted but not yet
+flushed are lost if the instance dies without a clean shutdown. atexit and the
+SIGTERM hook installed by main.py drain every buffer through flush_all().
+
+Background threads only get CPU while the instance does. On Cloud Run without
+always-allocated CPU the window therefore stretches until the next request or
+the shutdown signal.
+"""
+
+import atexit
+import collections
+import threading
+import time
+
+from handlers.common import logger, register_stats
+
+_buffers = []
+
+
+class WriteBehindBuffer:
+	"""Queue of pending writes flushed in bulk by size or age.
+
+	Args:
+		name: Name the buffer's stats are registered under
+		flush: Callable taking a list of items and writing them; returns a dict of
+			outcome counters (e.g. {"written": 10, "duplicates": 1}) that is added
+			to the stats
+		max_items: Queue bound; offer() refuses items beyond it
+		flush_items: Queue depth that triggers a flush
+		max_age_seconds: Age of the oldest queued item that triggers a flush
+	"""
+
+	def __init__(self, name: str, flush, max_items: int, flush_items: int, max_age_seconds: float):
+		self.name = name
+		self._flush = flush
+		self._max_items = max_items
+		self._flush_items = flush_items
+		self._max_age_seconds = max_age_seconds
+		self._queue = collections.deque()
+		self._condition = threading.Condition()
+		self._flush_lock = threading.Lock()
+		self._thread = None
+		self._closed = False
+		self._stats = {
+			"accepted": 0,
+			"refused": 0,
+			"flushes": 0,
+			"flush_failures": 0,
+			"flushed_items": 0,
+			"max_depth": 0,
+			"flush_ms_total": 0.0,
+			"flush_ms_max": 0.0,
+			"flush_ms_last": 0.0,
+		}
+		_buffers.append(self)
+		register_stats(name, self.stats)
+
+	def offer(self, item) -> bool:
+		"""Queue item for the next flush; False when the buffer is full or closed."""
+		with self._condition:
+			if self._closed or len(self._queue) >= self._max_items:
+				self._stats["refused"] += 1
+				return False
+			self._queue.append((time.monotonic(), item))
+			self._stats["accepted"] += 1
+			self._stats["max_depth"] = max(self._stats["max_depth"], len(self._queue))
+			if self._thread is None:
+				self._thread = threading.Thread(target=self._run, name=f"{self.name}-flusher", daemon=True)
+				self._thread.start()
+			if len(self._queue) >= self._flush_items:
+				self._condition.notify()
+		return True
+
+	def _run(self):
+		while True:
+			with self._condition:
+				while not self._closed:
+					if len(self._queue) >= self._flush_items:
+						break
+					if self._queue:
+						wait = self._queue[0][0] + self._max_age_seconds - time.monotonic()
+						if wait <= 0:
+							break
+					else:
+						wait = None
+					self._condition.wait(wait)
+				if self._closed:
+					return
+			self.flush(limit=self._flush_items)
+
+	def _take(self, limit) -> list:
+		with self._condition:
+			count = len(self._queue) if limit is None else min(limit, len(self._queue))
+			return [self._queue.popleft()[1] for _ in range(count)]
+
+	def flush(self, limit: int = None) -> int:
+		"""Write up to limit queued items (all when None) now; returns how many were taken."""
+		with self._flush_lock:
+			items = self._take(limit)
+			if not items:
+				return 0
+			started = time.perf_counter()
+			try:
+				outcome = self._flush(items) or {}
+			except Exception:
+				logger.exception(f"Failed to flush {len(items)} items from {self.name}")
+				outcome = {"failed": len(items)}
+				failed = True
+			else:
+				failed = False
+			elapsed_ms = (time.perf_counter() - started) * 1000
+
+			with self._condition:
+				self._stats["flushes"] += 1
+				self._stats["flush_failures"] += 1 if failed else 0
+				self._stats["flushed_items"] += len(items)
+				self._stats["flush_ms_total"] += elapsed_ms
+				self._stats["flush_ms_max"] = max(self._stats["flush_ms_max"], elapsed_ms)
+				self._stats["flush_ms_last"] = elapsed_ms
+				for key, value in outcome.items():
+					self._stats[key] = self._stats.get(key, 0) + value
+			return len(items)
+
+	def close(self):
+		"""Stop accepting items and flush everything still queued."""
+		with self._condition:
+			self._closed = True
+			self._condition.notify_all()
+		self.flush()
+
+	def stats(self) -> dict:
+		with self._condition:
+			depth = len(self._queue)
+			oldest_age_ms = (time.monotonic() - self._queue[0][0]) * 1000 if depth else 0.0
+			stats = dict(self._stats)
+		stats["depth"] = depth
+		stats["oldest_age_ms"] = oldest_age_ms
+		stats["flush_ms_avg"] = (stats["flush_ms_total"] / stats["flushes"]) if stats["flushes"] else 0.0
+		stats["max_items"] = self._max_items
+		stats["max_age_ms"] = self._max_age_seconds * 1000
+		return stats
+
+
+def flush_all():
+	"""Close and drain every buffer created in this process (shutdown hook)."""
+	for buffer in list(_buffers):
+		try:
+			buffer.close()
+		except Exception:
+			logger.exception(f"Failed to drain {buffer.name} on shutdown")
+
+
+atexit.register(flush_all)
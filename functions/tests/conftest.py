@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fakes import FakeFirestore  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_role_cache():
+	"""Start every test without roles cached by an earlier one."""
+	from handlers.auth import role_cache
+
+	role_cache.clear()
+	yield
+	role_cache.clear()
+
+
+@pytest.fixture
+def db(monkeypatch):
+	"""A FakeFirestore returned by every firestore.client() call."""
+	from firebase_admin import firestore
+
+	fake = FakeFirestore()
+	monkeypatch.setattr(firestore, "client", lambda *args, **kwargs: fake)
+	return fake
+
+
+def make_request(method: str = "POST", json: dict = None, query: dict = None, headers: dict = None):
+	"""A Flask request as Cloud Functions hands it to an on_request handler."""
+	from flask import Request
+	from werkzeug.test import EnvironBuilder
+
+	builder = EnvironBuilder(method=method, path="/", json=json, query_string=query, headers=headers)
+	return Request(builder.get_environ())
+
+
+@pytest.fixture
+def signed_in(monkeypatch):
+	"""Make every idToken verify to the claims passed: signed_in({"uid": ..., "admin": True})."""
+	import handlers.auth
+
+	def sign_in(claims: dict):
+		monkeypatch.setattr(handlers.auth, "verify_id_token", lambda token, check_revoked=False: dict(claims))
+
+	return sign_in
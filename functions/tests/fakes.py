@@ -0,0 +1,218 @@
+"""In-memory stand-in for the parts of the Firestore client the handlers use.
+
+Documents live in one dict keyed by path. Writes apply Increment, SERVER_TIMESTAMP
+and DELETE_FIELD like the server does, batches commit atomically (a failing
+create() leaves nothing written), and queries support where / order_by (including
+__name__) / start_after with a dict cursor / limit.
+"""
+
+from google.api_core import exceptions as google_exceptions
+from google.cloud.firestore_v1 import transforms
+
+import datetime
+import threading
+
+
+def _resolve(current, value):
+	if isinstance(value, transforms.Increment):
+		return (current if isinstance(current, (int, float)) else 0) + value.value
+	if value is transforms.SERVER_TIMESTAMP:
+		return datetime.datetime.now(datetime.timezone.utc)
+	if isinstance(value, dict):
+		base = dict(current) if isinstance(current, dict) else {}
+		for key, item in value.items():
+			if item is transforms.DELETE_FIELD:
+				base.pop(key, None)
+			else:
+				base[key] = _resolve(base.get(key), item)
+		return base
+	return value
+
+
+class FakeSnapshot:
+	def __init__(self, reference, data):
+		self.reference = reference
+		self.id = reference.id
+		self.exists = data is not None
+		self._data = data
+
+	def to_dict(self):
+		return dict(self._data) if self._data is not None else None
+
+	def get(self, field):
+		value = self._data or {}
+		for part in field.split("."):
+			value = value.get(part) if isinstance(value, dict) else None
+		return value
+
+
+class FakeDocument:
+	def __init__(self, client, path):
+		self._client = client
+		self.path = path
+		self.id = path.rsplit("/", 1)[-1]
+
+	def collection(self, name):
+		return FakeQuery(self._client, f"{self.path}/{name}")
+
+	def get(self, transaction=None):
+		return FakeSnapshot(self, self._client.documents.get(self.path))
+
+	def create(self, data):
+		self._client.commit([("create", self, data, False)])
+
+	def set(self, data, merge=False):
+		self._client.commit([("set", self, data, merge)])
+
+	def update(self, data):
+		self._client.commit([("update", self, data, True)])
+
+
+class FakeCount:
+	def __init__(self, value):
+		self.value = value
+
+
+class FakeQuery:
+	def __init__(self, client, path, filters=(), orders=(), cursor=None, limit=None):
+		self._client = client
+		self._path = path
+		self._filters = filters
+		self._orders = orders
+		self._cursor = cursor
+		self._limit = limit
+
+	def _copy(self, **changes):
+		state = {"filters": self._filters, "orders": self._orders, "cursor": self._cursor, "limit": self._limit}
+		state.update(changes)
+		return FakeQuery(self._client, self._path, **state)
+
+	def document(self, doc_id=None):
+		if doc_id is None:
+			doc_id = self._client.next_id()
+		if not isinstance(doc_id, str) or "/" in doc_id or not doc_id:
+			raise ValueError(f"Invalid document id: {doc_id!r}")
+		return FakeDocument(self._client, f"{self._path}/{doc_id}")
+
+	def where(self, field, op, value):
+		return self._copy(filters=self._filters + ((field, op, value),))
+
+	def order_by(self, field, direction="ASCENDING"):
+		return self._copy(orders=self._orders + ((field, direction),))
+
+	def start_after(self, values):
+		return self._copy(cursor=dict(values))
+
+	def limit(self, count):
+		return self._copy(limit=count)
+
+	def _value(self, snapshot, field):
+		return snapshot.id if field == "__name__" else snapshot.get(field)
+
+	def _matches(self, snapshot):
+		for field, op, value in self._filters:
+			actual = self._value(snapshot, field)
+			if actual is None:
+				return False
+			if op == "==" and actual != value:
+				return False
+			if op == ">=" and not actual >= value:
+				return False
+			if op == "<=" and not actual <= value:
+				return False
+			if op == "in" and actual not in value:
+				return False
+		return True
+
+	def _key(self, snapshot):
+		return tuple(self._value(snapshot, field) for field, _ in self._orders)
+
+	def stream(self, transaction=None):
+		prefix = self._path + "/"
+		snapshots = [
+			FakeSnapshot(FakeDocument(self._client, path), data)
+			for path, data in sorted(self._client.documents.items())
+			if path.startswith(prefix) and "/" not in path[len(prefix):]
+		]
+		snapshots = [snapshot for snapshot in snapshots if self._matches(snapshot)]
+		# Firestore skips documents missing an order_by field
+		snapshots = [snapshot for snapshot in snapshots if None not in self._key(snapshot)]
+		for field, direction in reversed(self._orders):
+			snapshots.sort(key=lambda snapshot: self._value(snapshot, field), reverse=str(direction).upper() == "DESCENDING")
+		if self._cursor is not None:
+			cursor = tuple(self._cursor[field] for field, _ in self._orders)
+			for index, snapshot in enumerate(snapshots):
+				if self._key(snapshot) == cursor:
+					snapshots = snapshots[index + 1:]
+					break
+		if self._limit is not None:
+			snapshots = snapshots[:self._limit]
+		return iter(snapshots)
+
+	def get(self, transaction=None):
+		return list(self.stream())
+
+	def count(self, alias=None):
+		query = self
+
+		class _Aggregation:
+			def get(self):
+				return [[FakeCount(sum(1 for _ in query.stream()))]]
+
+		return _Aggregation()
+
+
+class FakeBatch:
+	def __init__(self, client):
+		self._client = client
+		self._writes = []
+
+	def create(self, reference, data):
+		self._writes.append(("create", reference, data, False))
+
+	def set(self, reference, data, merge=False):
+		self._writes.append(("set", reference, data, merge))
+
+	def update(self, reference, data):
+		self._writes.append(("update", reference, data, True))
+
+	def commit(self):
+		self._client.commit(self._writes)
+		self._client.commits += 1
+
+
+class FakeFirestore:
+	"""Client stand-in: collection(), batch(), get_all() and the raw documents dict."""
+
+	def __init__(self, documents=None):
+		self.documents = dict(documents or {})
+		self.commits = 0
+		self._ids = 0
+		self._lock = threading.Lock()
+
+	def next_id(self) -> str:
+		with self._lock:
+			self._ids += 1
+			return f"auto{self._ids}"
+
+	def collection(self, name):
+		return FakeQuery(self, name)
+
+	def batch(self):
+		return FakeBatch(self)
+
+	def get_all(self, references):
+		for reference in references:
+			yield reference.get()
+
+	def commit(self, writes):
+		"""Apply writes atomically."""
+		with self._lock:
+			for method, reference, _, _ in writes:
+				if method == "create" and reference.path in self.documents:
+					raise google_exceptions.AlreadyExists(f"Document already exists: {reference.path}")
+				if method == "update" and reference.path not in self.documents:
+					raise google_exceptions.NotFound(f"No document to update: {reference.path}")
+			for method, reference, data, merge in writes:
+				current = self.documents.get(reference.path) if merge else None
+				self.documents[reference.path] = _resolve(current, data)
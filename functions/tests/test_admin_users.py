@@ -0,0 +1,109 @@
+import datetime
+
+import pytest
+
+import handlers.admin
+from handlers.admin import get_all_users
+from tests.conftest import make_request
+
+ADMIN_UID = "admin-1"
+
+
+@pytest.fixture
+def users(db, signed_in, monkeypatch):
+	monkeypatch.setattr(handlers.admin, "get_auth_profiles", lambda uids: {})
+	signed_in({"uid": ADMIN_UID, "admin": True, "role": "admin"})
+	start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+	db.documents[f"users/{ADMIN_UID}"] = {"role": "admin", "isAdmin": True, "createdAt": start}
+	# Pairs of users share a createdAt so the __name__ tie-breaker matters
+	for i in range(9):
+		db.documents[f"users/user-{i}"] = {"email": f"user{i}@example.com", "createdAt": start + datetime.timedelta(days=1 + i // 2)}
+	return db
+
+
+def _page(body):
+	response = get_all_users(make_request(json={"idToken": "token", **body}))
+	assert response.status_code == 200, response.get_data(as_text=True)
+	return response.get_json()
+
+
+def test_cursor_pages_cover_every_user_once(users):
+	seen = []
+	cursor = None
+	pages = 0
+	while True:
+		page = _page({"pageSize": 3, "cursor": cursor})
+		pages += 1
+		seen.extend(user["id"] for user in page["users"])
+		if not page["hasMore"]:
+			assert page["nextCursor"] is None
+			break
+		cursor = page["nextCursor"]
+
+	assert pages == 4
+	assert sorted(seen) == sorted([ADMIN_UID] + [f"user-{i}" for i in range(9)])
+	assert len(seen) == len(set(seen))
+
+
+def test_exact_page_size_has_no_more(users):
+	# 10 users: a page of 10 fetches 11, gets 10 and reports no further page
+	page = _page({"pageSize": 10})
+	assert len(page["users"]) == 10
+	assert page["hasMore"] is False
+	assert page["nextCursor"] is None
+
+	page = _page({"pageSize": 9})
+	assert len(page["users"]) == 9
+	assert page["hasMore"] is True
+	last = _page({"pageSize": 9, "cursor": page["nextCursor"]})
+	assert len(last["users"]) == 1
+	assert last["hasMore"] is False
+
+
+def test_cursor_must_match_order_field(users):
+	page = _page({"pageSize": 3})
+	response = get_all_users(make_request(json={"idToken": "token", "orderBy": "email", "cursor": page["nextCursor"]}))
+	assert response.status_code == 400
+
+
+def test_malformed_cursor_is_rejected(users):
+	response = get_all_users(make_request(json={"idToken": "token", "cursor": "not-a-cursor!"}))
+	assert response.status_code == 400
+
+
+def test_timestamps_are_epoch_millis(users):
+	page = _page({"pageSize": 1, "direction": "asc"})
+	assert page["users"][0]["createdAt"] == int(datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+
+def _all_pages(body):
+	seen = []
+	cursor = None
+	while True:
+		page = _page({**body, "cursor": cursor})
+		seen.extend(user["id"] for user in page["users"])
+		if not page["hasMore"]:
+			return seen
+		cursor = page["nextCursor"]
+
+
+@pytest.mark.parametrize("page_size", [1, 3, 9, 10, 11, 50])
+def test_users_without_the_order_field_are_listed_after_the_others(users, page_size):
+	# Written by ikas_connect before the first sign-in set createdAt
+	users.documents["users/legacy-a"] = {"shop": "store", "verified": True}
+	users.documents["users/legacy-b"] = {"email": "legacy@example.com"}
+
+	seen = _all_pages({"pageSize": page_size})
+
+	assert len(seen) == 12
+	assert seen[-2:] == ["legacy-b", "legacy-a"]
+	assert sorted(seen) == sorted([ADMIN_UID, "legacy-a", "legacy-b"] + [f"user-{i}" for i in range(9)])
+
+
+def test_scan_for_users_without_the_order_field_is_bounded(users, monkeypatch):
+	monkeypatch.setattr(handlers.admin, "USERS_MISSING_FIELD_SCAN_LIMIT", 4)
+	users.documents["users/zz-legacy"] = {"shop": "store"}
+
+	seen = _all_pages({"pageSize": 20, "orderBy": "lastUpdated", "direction": "asc"})
+
+	assert sorted(seen) == sorted([ADMIN_UID, "zz-legacy"] + [f"user-{i}" for i in range(9)])
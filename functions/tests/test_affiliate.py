@@ -0,0 +1,33 @@
+import pytest
+
+from handlers import affiliate
+from handlers.common import encode_cursor
+from tests.conftest import make_request
+
+
+@pytest.mark.parametrize("values", [
+	{"timestamp": "2025-11-03T10:00:00Z"},
+	{"timestamp": "2025-11-03T10:00:00Z", "__name__": "event", "eventType": "checkout_completed"},
+	{"createdAt": "2025-11-03T10:00:00Z", "__name__": "event"},
+	{"timestamp": "2025-11-03T10:00:00Z", "__name__": 12},
+	{"timestamp": "2025-11-03T10:00:00Z", "__name__": ""},
+	{"timestamp": "2025-11-03T10:00:00Z", "__name__": "other/event"},
+])
+def test_cursor_that_does_not_match_the_events_order_is_rejected(db, signed_in, values):
+	signed_in({"uid": "owner", "role": "user"})
+
+	response = affiliate.fetch_affiliate_stats(
+		make_request(json={"idToken": "token", "cursor": encode_cursor(values)})
+	)
+
+	assert response.status_code == 400
+
+
+def test_cursor_from_a_previous_page_is_accepted(db, signed_in):
+	signed_in({"uid": "owner", "role": "user"})
+	cursor = encode_cursor({"timestamp": "2025-11-03T10:00:00Z", "__name__": "event"})
+
+	response = affiliate.fetch_affiliate_stats(make_request(json={"idToken": "token", "cursor": cursor}))
+
+	# Past the cursor checks: the caller has no user document
+	assert response.status_code == 404
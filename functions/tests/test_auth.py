@@ -0,0 +1,74 @@
+import time
+
+from handlers import admin, auth as auth_module
+from handlers.auth import ADMIN_ROLE_CACHE_TTL_SECONDS, authorize, role_cache
+from tests.conftest import make_request
+
+
+def test_demoted_admin_with_stale_claims_is_not_admin(db):
+	# remove_admin ran on another instance: the document says user, the token still says admin
+	db.documents["users/demoted"] = {"role": "user", "isAdmin": False, "isSuperAdmin": False}
+	authz = authorize({"uid": "demoted", "admin": True, "role": "admin", "iat": 1})
+
+	assert authz.is_admin is False
+	assert authz.source == "firestore"
+
+
+def test_admin_claims_are_confirmed_once_per_cache_ttl(db):
+	db.documents["users/admin"] = {"role": "admin", "isAdmin": True}
+	decoded = {"uid": "admin", "admin": True, "role": "admin"}
+	assert authorize(decoded).source == "firestore"
+
+	db.documents["users/admin"] = {"role": "user", "isAdmin": False}
+	authz = authorize(decoded)
+	assert authz.is_admin is True
+	assert authz.source == "cache"
+
+
+def test_admin_role_expires_sooner_than_a_regular_role(db, monkeypatch):
+	db.documents["users/admin"] = {"role": "admin", "isAdmin": True}
+	db.documents["users/someone"] = {"role": "user"}
+	authorize({"uid": "admin", "admin": True, "role": "admin"})
+	authorize({"uid": "someone"})
+
+	later = time.time() + ADMIN_ROLE_CACHE_TTL_SECONDS
+	monkeypatch.setattr(time, "time", lambda: later)
+
+	assert role_cache.get("admin") is None
+	assert role_cache.get("someone") == (False, False)
+
+
+def test_remove_admin_drops_the_cached_admin_role(db, signed_in, monkeypatch):
+	db.documents["users/super"] = {"role": "super_admin", "isSuperAdmin": True}
+	db.documents["users/admin"] = {"role": "admin", "isAdmin": True}
+	decoded = {"uid": "admin", "admin": True, "role": "admin"}
+	assert authorize(decoded).is_admin is True
+	monkeypatch.setattr(admin, "SUPER_ADMIN_UID", "super")
+	monkeypatch.setattr(auth_module, "SUPER_ADMIN_UID", "super")
+	monkeypatch.setattr(admin.admin_auth, "set_custom_user_claims", lambda uid, claims: None)
+	# The fake has no transactions; the demotion itself is a plain update here
+	monkeypatch.setattr(db, "transaction", lambda: None, raising=False)
+	monkeypatch.setattr(admin, "_demote_admin", lambda transaction, db, uid, data: db.collection("users").document(uid).update(data))
+	signed_in({"uid": "super", "superAdmin": True, "role": "super_admin"})
+
+	response = admin.remove_admin(make_request(json={"idToken": "token", "targetUserId": "admin"}))
+
+	assert response.status_code == 200
+	assert authorize(decoded).is_admin is False
+
+
+def test_regular_user_claims_need_no_read(db):
+	authz = authorize({"uid": "someone", "admin": False, "role": "user"})
+
+	assert authz.is_admin is False
+	assert authz.source == "claims"
+
+
+def test_roles_without_claims_are_cached(db):
+	db.documents["users/no-claims-user"] = {"role": "user"}
+	assert authorize({"uid": "no-claims-user"}).is_admin is False
+
+	db.documents["users/no-claims-user"] = {"role": "admin"}
+	authz = authorize({"uid": "no-claims-user"})
+	assert authz.is_admin is False
+	assert authz.source == "cache"
@@ -0,0 +1,185 @@
+import pytest
+
+import threading
+import time
+
+from handlers import checkout
+from handlers.counters import COUNTER_DEFAULT_SHARDS, counters
+from tests.conftest import make_request
+
+
+@pytest.fixture(autouse=True)
+def shard_config():
+	"""Start every test with fresh default shard counts and no summary writes remembered."""
+
+	def reset():
+		counters._shard_counts = {}
+		counters._shard_counts_loaded_at = time.monotonic()
+		counters._summary_writes.clear()
+
+	reset()
+	yield
+	reset()
+
+
+def checkout_payload(transaction_id, value="18"):
+	return {
+		"kons_ref": "ref-1",
+		"timestamp": "2025-11-03T15:07:25.103Z",
+		"ecommerce": {
+			"transaction_id": transaction_id,
+			"affiliation": "dev-alfreya.ikas.shop",
+			"value": value,
+			"currency": "TRY",
+		},
+	}
+
+
+def counted_events(db, shop="dev-alfreya.ikas.shop"):
+	prefix = f"shops_events/{shop}/counter_shards/"
+	return sum(data.get("count", 0) for path, data in db.documents.items() if path.startswith(prefix))
+
+
+def rollup_checkouts(db, shop="dev-alfreya.ikas.shop"):
+	prefix = f"shops_events/{shop}/rollups/"
+	return sum(data.get("checkout_count", 0) for path, data in db.documents.items() if path.startswith(prefix))
+
+
+def test_duplicate_in_one_flush_is_written_and_counted_once(db):
+	items = [checkout.parse_checkout(checkout_payload(transaction_id)) for transaction_id in ("1011", "1012", "1011")]
+
+	outcome = checkout._bulk_write_checkouts(items)
+
+	assert outcome == {"written": 2, "duplicates": 1, "failed": 0}
+	assert "shops_events/dev-alfreya.ikas.shop/events/1011" in db.documents
+	assert counted_events(db) == 2
+	assert rollup_checkouts(db) == 2
+
+
+def test_flush_skips_stored_transactions(db):
+	checkout._bulk_write_checkouts([checkout.parse_checkout(checkout_payload("1011"))])
+
+	outcome = checkout._bulk_write_checkouts([checkout.parse_checkout(checkout_payload("1011"))])
+
+	assert outcome == {"written": 0, "duplicates": 1, "failed": 0}
+	assert counted_events(db) == 1
+	assert rollup_checkouts(db) == 1
+
+
+def test_batch_counts_each_transaction_once(db):
+	events = [checkout_payload("1011"), checkout_payload("1011"), checkout_payload("1012")]
+
+	response = checkout.track_checkout_batch(make_request(json={"events": events}))
+
+	body = response.get_json()
+	assert [result["status"] for result in body["results"]] == ["recorded", "duplicate", "recorded"]
+	assert counted_events(db) == 2
+	assert rollup_checkouts(db) == 2
+
+
+@pytest.mark.parametrize("transaction_id", [1011, "a/b", ".", "..", "__name__", "x" * 1501, "ş" * 751])
+def test_invalid_transaction_id_is_rejected(transaction_id):
+	with pytest.raises(ValueError):
+		checkout.parse_checkout(checkout_payload(transaction_id))
+
+
+def test_batch_reports_invalid_transaction_id_per_item(db):
+	events = [checkout_payload("1011"), checkout_payload("orders/1012"), checkout_payload("__id__")]
+
+	response = checkout.track_checkout_batch(make_request(json={"events": events}))
+
+	assert response.status_code == 200
+	body = response.get_json()
+	assert [result["status"] for result in body["results"]] == ["recorded", "invalid", "invalid"]
+	assert body["results"][1]["error"] == "Invalid transaction_id"
+	assert counted_events(db) == 1
+
+
+def shop_paths(db, collection, shop="dev-alfreya.ikas.shop"):
+	return [path for path in db.documents if path.startswith(f"shops_events/{shop}/{collection}/")]
+
+
+def test_new_shop_gets_its_summary_document(db):
+	checkout._bulk_write_checkouts([checkout.parse_checkout(checkout_payload(str(n))) for n in range(20)])
+
+	summary = db.documents["shops_events/dev-alfreya.ikas.shop"]
+	assert summary["shop_name"] == "dev-alfreya.ikas.shop"
+	assert summary["last_event_at"] is not None
+
+
+def test_summary_document_is_merged_once_per_interval(db):
+	checkout.record_checkout(db, *checkout.parse_checkout(checkout_payload("1")))
+	del db.documents["shops_events/dev-alfreya.ikas.shop"]
+
+	checkout.record_checkout(db, *checkout.parse_checkout(checkout_payload("2")))
+	checkout._bulk_write_checkouts([checkout.parse_checkout(checkout_payload("3"))])
+
+	assert "shops_events/dev-alfreya.ikas.shop" not in db.documents
+	assert counted_events(db) == 3
+
+
+def test_duplicate_hands_back_the_summary_claim(db):
+	checkout.record_checkout(db, *checkout.parse_checkout(checkout_payload("1")))
+	counters._summary_writes.clear()
+	del db.documents["shops_events/dev-alfreya.ikas.shop"]
+
+	assert checkout.record_checkout(db, *checkout.parse_checkout(checkout_payload("1"))) is False
+	checkout.record_checkout(db, *checkout.parse_checkout(checkout_payload("2")))
+
+	assert "shops_events/dev-alfreya.ikas.shop" in db.documents
+
+
+def test_every_shop_spreads_counts_and_rollups_over_the_default_shards(db):
+	for n in range(40):
+		checkout.record_checkout(db, *checkout.parse_checkout(checkout_payload(str(n))))
+
+	assert 1 < len(shop_paths(db, "rollups")) <= COUNTER_DEFAULT_SHARDS
+	assert 1 < len(shop_paths(db, "counter_shards")) <= COUNTER_DEFAULT_SHARDS
+	assert counted_events(db) == 40
+	assert rollup_checkouts(db) == 40
+
+
+def test_configured_shop_uses_its_own_shard_count(db):
+	counters._shard_counts = {"dev-alfreya.ikas.shop": 1}
+
+	for n in range(10):
+		checkout.record_checkout(db, *checkout.parse_checkout(checkout_payload(str(n))))
+
+	assert shop_paths(db, "counter_shards") == ["shops_events/dev-alfreya.ikas.shop/counter_shards/0"]
+
+
+def test_stale_shard_config_is_refreshed_off_the_request_path(db):
+	db.documents["counter_config/shard_counts"] = {"shards": {"dev-alfreya.ikas.shop": 1}}
+	counters._shard_counts_loaded_at = None
+	release = threading.Event()
+	config_ref = counters._config_ref
+
+	def slow_config_ref(client):
+		release.wait(5)
+		return config_ref(client)
+
+	counters._config_ref = slow_config_ref
+	try:
+		# The write goes ahead with the default count while the read is blocked
+		assert counters.shard_count(db, "dev-alfreya.ikas.shop") == COUNTER_DEFAULT_SHARDS
+	finally:
+		release.set()
+		counters._refresh_thread.join(5)
+		del counters._config_ref
+
+	assert counters.shard_count(db, "dev-alfreya.ikas.shop") == 1
+
+
+def test_failed_shard_config_read_keeps_the_current_counts(db):
+	counters._shard_counts = {"dev-alfreya.ikas.shop": 3}
+
+	def failing_config_ref(client):
+		raise RuntimeError("unavailable")
+
+	counters._config_ref = failing_config_ref
+	try:
+		counters.refresh(db)
+	finally:
+		del counters._config_ref
+
+	assert counters.shard_count(db, "dev-alfreya.ikas.shop") == 3
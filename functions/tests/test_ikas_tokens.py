@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+from handlers import ikas
+from handlers.ikas_tokens import IKAS_TOKEN_REFRESH_AHEAD_SECONDS, IkasTokenManager, token_expiry
+from tests.conftest import make_request
+
+SHOP_PATH = "users/owner/shops/store"
+
+
+class CountingFetch:
+	"""Stands in for the client_credentials exchange; every call issues a new token."""
+
+	def __init__(self, release=None):
+		self.calls = 0
+		self.release = release
+
+	def __call__(self, shop_name, client_id, client_secret):
+		if self.release is not None:
+			self.release.wait(5)
+		self.calls += 1
+		return f"token-{self.calls}", time.time() + 3600
+
+
+def store_shop(db, access_token="stored", expires_in=3600):
+	db.documents[SHOP_PATH] = {
+		"shopType": "ikas",
+		"shopName": "store",
+		"clientId": "id",
+		"clientSecret": "secret",
+		"accessToken": access_token,
+		"accessTokenExpiresAt": token_expiry(time.time() + expires_in),
+	}
+
+
+def test_stored_token_is_used_until_it_nears_expiry(db):
+	fetch = CountingFetch()
+	store_shop(db)
+	manager = IkasTokenManager(fetch=fetch)
+
+	assert manager.get_token(db, "owner", "store")[0] == "stored"
+	assert manager.get_token(db, "owner", "store")[0] == "stored"
+
+	assert fetch.calls == 0
+	assert manager.stats()["firestore_hits"] == 1
+	assert manager.stats()["memory_hits"] == 1
+
+
+def test_expired_token_is_refreshed_and_written_back(db):
+	fetch = CountingFetch()
+	store_shop(db, expires_in=-1)
+	manager = IkasTokenManager(fetch=fetch)
+
+	access_token, expires_at = manager.get_token(db, "owner", "store")
+
+	assert access_token == "token-1"
+	assert db.documents[SHOP_PATH]["accessToken"] == "token-1"
+	assert db.documents[SHOP_PATH]["accessTokenExpiresAt"].timestamp() == pytest.approx(expires_at)
+
+
+def test_token_near_expiry_is_returned_while_one_refresh_runs(db):
+	fetch = CountingFetch()
+	store_shop(db, expires_in=IKAS_TOKEN_REFRESH_AHEAD_SECONDS / 2)
+	manager = IkasTokenManager(fetch=fetch)
+
+	assert manager.get_token(db, "owner", "store")[0] == "stored"
+	manager._executor.shutdown(wait=True)
+
+	assert fetch.calls == 1
+	assert manager.stats()["refresh_ahead"] == 1
+	assert db.documents[SHOP_PATH]["accessToken"] == "token-1"
+
+
+def test_concurrent_callers_share_one_refresh(db):
+	release = threading.Event()
+	fetch = CountingFetch(release)
+	store_shop(db, expires_in=-1)
+	manager = IkasTokenManager(fetch=fetch)
+	tokens = []
+
+	callers = [threading.Thread(target=lambda: tokens.append(manager.get_token(db, "owner", "store")[0])) for _ in range(5)]
+	for caller in callers:
+		caller.start()
+	while manager.stats()["coalesced_waits"] < 4:
+		time.sleep(0.01)
+	release.set()
+	for caller in callers:
+		caller.join(5)
+
+	assert fetch.calls == 1
+	assert tokens == ["token-1"] * 5
+
+
+def test_access_token_endpoint_is_admin_only(db, signed_in):
+	store_shop(db)
+	signed_in({"uid": "owner", "role": "user"})
+
+	response = ikas.get_ikas_access_token(
+		make_request(json={"idToken": "token", "user_id": "owner", "shop_id": "store"})
+	)
+
+	assert response.status_code == 403
+
+
+def test_access_token_endpoint_serves_the_managed_token(db, signed_in, monkeypatch):
+	store_shop(db)
+	db.documents["users/admin"] = {"role": "admin", "isAdmin": True}
+	signed_in({"uid": "admin", "admin": True, "role": "admin"})
+	monkeypatch.setattr(ikas, "ikas_tokens", IkasTokenManager(fetch=CountingFetch()))
+
+	response = ikas.get_ikas_access_token(
+		make_request(json={"idToken": "token", "user_id": "owner", "shop_id": "store"})
+	)
+
+	body = response.get_json()
+	assert body["accessToken"] == "stored"
+	assert body["accessTokenExpiresAt"] == pytest.approx(db.documents[SHOP_PATH]["accessTokenExpiresAt"].timestamp() * 1000, abs=1)
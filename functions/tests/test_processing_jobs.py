@@ -0,0 +1,74 @@
+import datetime
+
+import pytest
+
+from handlers import processing_jobs, shopify_processing
+from handlers.processing_jobs import JOB_LEASE_SECONDS, JobRetry, run_attempt
+from tests.conftest import make_request
+
+
+def crash():
+	raise KeyError("params")
+
+
+def running_job(attempts, updated_at=None, uid="owner"):
+	return {
+		"kind": "shopify_processing",
+		"uid": uid,
+		"params": {"shop_domain": "shop.myshopify.com"},
+		"status": "running",
+		"attempts": attempts,
+		"max_attempts": processing_jobs.JOB_MAX_ATTEMPTS,
+		"updated_at": updated_at or datetime.datetime.now(datetime.timezone.utc),
+	}
+
+
+def test_crash_is_retried_while_attempts_remain(db):
+	job = db.documents["processing_jobs/job"] = running_job(attempts=1)
+
+	with pytest.raises(JobRetry):
+		run_attempt(db, "job", job, crash)
+
+	assert db.documents["processing_jobs/job"]["status"] == "retrying"
+
+
+def test_crash_on_the_last_attempt_fails_the_job(db):
+	job = db.documents["processing_jobs/job"] = running_job(attempts=processing_jobs.JOB_MAX_ATTEMPTS)
+
+	run_attempt(db, "job", job, crash)
+
+	stored = db.documents["processing_jobs/job"]
+	assert stored["status"] == "failed"
+	assert "params" in stored["error"]
+
+
+def test_last_attempt_past_its_lease_is_failed_when_read(db, signed_in):
+	stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=JOB_LEASE_SECONDS + 1)
+	db.documents["processing_jobs/job"] = running_job(attempts=processing_jobs.JOB_MAX_ATTEMPTS, updated_at=stale)
+	signed_in({"uid": "owner", "role": "user"})
+
+	response = shopify_processing.get_processing_job(
+		make_request("GET", query={"job_id": "job"}, headers={"Authorization": "Bearer token"})
+	)
+
+	assert response.get_json()["status"] == "failed"
+	assert db.documents["processing_jobs/job"]["status"] == "failed"
+
+
+def test_earlier_attempt_past_its_lease_is_left_to_the_queue(db):
+	stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=JOB_LEASE_SECONDS + 1)
+	job = db.documents["processing_jobs/job"] = running_job(attempts=2, updated_at=stale)
+
+	assert processing_jobs.expire_stale_job(db, "job", job)["status"] == "running"
+
+
+def test_job_is_hidden_from_demoted_admin(db, signed_in):
+	db.documents["processing_jobs/job"] = running_job(attempts=1)
+	db.documents["users/demoted"] = {"role": "user", "isAdmin": False}
+	signed_in({"uid": "demoted", "admin": True, "role": "admin"})
+
+	response = shopify_processing.get_processing_job(
+		make_request("GET", query={"job_id": "job"}, headers={"Authorization": "Bearer token"})
+	)
+
+	assert response.status_code == 404
@@ -0,0 +1,116 @@
+import pytest
+import requests
+
+from handlers.http_client import HostBusyError
+from handlers.resilience import CIRCUIT_FAILURE_THRESHOLD, ResilientClient, RetryBudget, RetryPolicy
+
+URL = "https://api.example.com/trigger"
+RETRYING = RetryPolicy(attempts=3)
+
+
+class FailingClient:
+	"""Raises error on every request and counts the calls."""
+
+	def __init__(self, error):
+		self.error = error
+		self.calls = 0
+
+	def request(self, method, url, **kwargs):
+		self.calls += 1
+		raise self.error
+
+
+def resilient_client(client):
+	return ResilientClient(client=client, budget=RetryBudget(max_tokens=100), sleep=lambda seconds: None)
+
+
+def test_local_saturation_does_not_open_the_breaker():
+	client = resilient_client(FailingClient(HostBusyError("Too many concurrent requests to api.example.com")))
+
+	for _ in range(CIRCUIT_FAILURE_THRESHOLD + 1):
+		with pytest.raises(HostBusyError):
+			client.get(URL, RETRYING)
+
+	assert client.breaker("api.example.com").stats()["state"] == "closed"
+	assert client._client.calls == CIRCUIT_FAILURE_THRESHOLD + 1
+
+
+def test_post_without_idempotency_key_is_not_retried():
+	client = resilient_client(FailingClient(requests.exceptions.ConnectionError("reset")))
+
+	with pytest.raises(requests.exceptions.ConnectionError):
+		client.post(URL, RETRYING, json={})
+
+	assert client._client.calls == 1
+
+
+def test_post_with_idempotency_key_is_retried():
+	client = resilient_client(FailingClient(requests.exceptions.ConnectionError("reset")))
+
+	with pytest.raises(requests.exceptions.ConnectionError):
+		client.post(URL, RETRYING, json={}, headers={"Idempotency-Key": "job-1"})
+
+	assert client._client.calls == RETRYING.attempts
+
+
+def test_get_is_retried():
+	client = resilient_client(FailingClient(requests.exceptions.ConnectionError("reset")))
+
+	with pytest.raises(requests.exceptions.ConnectionError):
+		client.get(URL, RETRYING)
+
+	assert client._client.calls == RETRYING.attempts
+
+
+class StatusClient:
+	"""Answers every request with status and records the headers sent."""
+
+	def __init__(self, status):
+		self.status = status
+		self.calls = []
+
+	def request(self, method, url, **kwargs):
+		self.calls.append(kwargs.get("headers") or {})
+		response = requests.Response()
+		response.status_code = self.status
+		response._content = b""
+		return response
+
+
+@pytest.fixture
+def shared_client(monkeypatch):
+	"""Swap the transport under the shared resilient client for the test's."""
+	from handlers import resilience
+
+	def install(client):
+		monkeypatch.setattr(resilience.resilient, "_client", client)
+		monkeypatch.setattr(resilience.resilient, "_sleep", lambda seconds: None)
+		monkeypatch.setattr(resilience.resilient, "_budget", RetryBudget(max_tokens=100))
+		monkeypatch.setattr(resilience.resilient, "_breakers", resilience.OrderedDict())
+		return client
+
+	return install
+
+
+def test_job_trigger_is_retried_with_the_job_key(shared_client):
+	from handlers import shopify_processing
+
+	client = shared_client(FailingClient(requests.exceptions.ConnectionError("reset")))
+
+	outcome, _ = shopify_processing.trigger_product_sync(
+		{"shop_domain": "shop.myshopify.com"}, shopify_processing.job_idempotency_key("job-1", "trigger")
+	)
+
+	assert outcome == "retry"
+	assert client.calls == shopify_processing.EXTERNAL_TRIGGER_POLICY.attempts
+
+
+def test_store_fetch_is_retried_on_gateway_errors(shared_client):
+	from handlers import gtm
+	from tests.conftest import make_request
+
+	client = shared_client(StatusClient(503))
+
+	gtm.verify_gtm(make_request(json={"storeUrl": "https://example.myikas.com"}))
+
+	assert len(client.calls) == gtm.STORE_FETCH_POLICY.attempts
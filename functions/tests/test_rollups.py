@@ -0,0 +1,59 @@
+from google.cloud.firestore_v1 import _helpers
+import pytest
+
+from handlers import checkout
+from handlers.rollups import compute_rollups, rollup_increment, rollup_increments
+from tests.test_checkout import checkout_payload, rollup_checkouts
+
+DOCUMENT_PATH = "projects/p/databases/(default)/documents/shops_events/shop/rollups/2025-11-03"
+
+BAD_CURRENCIES = [949, {"code": "TRY"}, ["TRY"], "", "__name__", "tr.y", "x" * 2000]
+BAD_KONS_REFS = [12, {"ref": 1}, "__name__", "a.b", "with space", "`tick`", "x" * 2000]
+
+
+def assert_valid_merge(update):
+	# Raises like the real client would when a map key is not a valid field name
+	_helpers.pbs_for_set_with_merge(DOCUMENT_PATH, update, merge=True)
+
+
+@pytest.mark.parametrize("currency", BAD_CURRENCIES)
+def test_unusable_currency_is_counted_as_unknown(currency):
+	update = rollup_increment({"currency": currency, "value": "5"}, "2025-11-03")
+
+	assert list(update["revenue"]) == ["UNKNOWN"]
+	assert_valid_merge(update)
+
+
+def test_currency_code_is_normalized():
+	update = rollup_increment({"currency": " try ", "value": "5"}, "2025-11-03")
+
+	assert list(update["revenue"]) == ["TRY"]
+
+
+@pytest.mark.parametrize("kons_ref", BAD_KONS_REFS)
+def test_unusable_kons_ref_gets_a_hashed_key(kons_ref):
+	update = rollup_increment({"kons_ref": kons_ref}, "2025-11-03")
+
+	key, = update["kons_ref_counts"]
+	assert len(key) <= 128
+	assert_valid_merge(update)
+
+
+def test_hashed_kons_ref_keys_match_between_increments_and_rebuilds():
+	events = [{"kons_ref": "a.b", "timestamp": "2025-11-03T10:00:00Z"}] * 2
+
+	assert list(rollup_increments(events)["2025-11-03"]["kons_ref_counts"]) == list(
+		compute_rollups(events)["2025-11-03"]["kons_ref_counts"]
+	)
+	assert_valid_merge(rollup_increments(events)["2025-11-03"])
+
+
+def test_checkout_with_odd_currency_and_kons_ref_is_recorded(db):
+	payload = checkout_payload("1011")
+	payload["kons_ref"] = "__name__"
+	payload["ecommerce"]["currency"] = 949
+
+	shop_doc_id, event_data = checkout.parse_checkout(payload)
+
+	assert checkout.record_checkout(db, shop_doc_id, event_data) is True
+	assert rollup_checkouts(db) == 1
@@ -43,7 +43,7 @@ const AdminDashboard = () => {
       ]);
       
       setStats(statsData);
-      // usersData returns { users: [], lastDoc, hasMore }, so we extract the users array
+      // usersData returns { users: [], hasMore, nextCursor }, so we extract the users array
       setUsers(usersData.users || []);
       setShops(shopsData || []);
     } catch (error) {
@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { getShopDetails } from '../../services/adminService';
-import { fetchIkasProducts, fetchIkasMerchant, validateAndRefreshToken } from '../../services/ikasService';
+import { fetchIkasProducts, fetchIkasMerchant, getIkasAccessToken } from '../../services/ikasService';
 import LoadingSpinner from '../LoadingSpinner';
 import { Card, CardContent, CardHeader, CardTitle } from '../ui/card';
 import { Badge } from '../ui/badge';
@@ -46,6 +46,10 @@ const IkasProcessingPipeline = () => {
   };
 
   const isTokenExpired = () => {
+    if (shop?.accessTokenExpiresAt) {
+      const expiresAt = shop.accessTokenExpiresAt.toDate ? shop.accessTokenExpiresAt.toDate() : new Date(shop.accessTokenExpiresAt);
+      return expiresAt <= new Date();
+    }
     if (!shop?.fetchedAt) return true;
     
     try {
@@ -93,7 +97,7 @@ const IkasProcessingPipeline = () => {
       
       // Step 1: Validate and refresh token if needed
       console.log('📋 Step 1: Validating access token...');
-      const validToken = await validateAndRefreshToken(userId, shopId, shop);
+      const { accessToken: validToken } = await getIkasAccessToken(userId, shopId);
       console.log('✅ Token validated successfully');
       
       // Step 2: Fetch merchant information from Ikas API
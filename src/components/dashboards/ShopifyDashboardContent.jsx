@@ -24,8 +24,10 @@ const FUNCTIONS_URL = import.meta.env.VITE_FIREBASE_FUNCTIONS_URL ||
   'https://us-central1-sharp-footing-314502.cloudfunctions.net';
 
 const GET_PROCESSING_STATUS_URL = `${FUNCTIONS_URL}/get_processing_status`;
+const STREAM_PROCESSING_STATUS_URL = `${FUNCTIONS_URL}/stream_processing_status`;
 const START_PROCESSING_URL = `${FUNCTIONS_URL}/start_shopify_processing`;
-const CHECK_ACCESS_TOKEN_URL = `${FUNCTIONS_URL}/check_shopify_access_token`;
+// Long-poll: the function holds the request open until the token is ready or timeout passes
+const WAIT_ACCESS_TOKEN_URL = `${FUNCTIONS_URL}/wait_shopify_access_token`;
 
 /**
  * ShopifyDashboardContent Component
@@ -49,16 +51,37 @@ export default function ShopifyDashboardContent({ shop }) {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [shopDomain]);
 
-  // Auto-refresh if still processing
+  // Follow the job over a Server-Sent Events stream while it is still processing
   useEffect(() => {
     if (processingStatus?.simple_status === 'processing') {
-      const interval = setInterval(() => {
-        fetchProcessingStatus(true); // Silent refresh
-      }, 5000); // Refresh every 5 seconds
+      const source = new EventSource(
+        `${STREAM_PROCESSING_STATUS_URL}?shop_domain=${encodeURIComponent(shopDomain)}`
+      );
+
+      // snapshot carries the full status, status only the fields that changed (null = removed)
+      source.addEventListener('snapshot', (event) => {
+        setProcessingStatus(JSON.parse(event.data));
+      });
+      source.addEventListener('status', (event) => {
+        const changes = JSON.parse(event.data);
+        setProcessingStatus((previous) => {
+          const next = { ...(previous || {}) };
+          Object.entries(changes).forEach(([key, value]) => {
+            if (value === null) {
+              delete next[key];
+            } else {
+              next[key] = value;
+            }
+          });
+          return next;
+        });
+      });
+      source.addEventListener('end', () => source.close());
 
-      return () => clearInterval(interval);
+      return () => source.close();
     }
-  }, [processingStatus?.simple_status]);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [processingStatus?.simple_status, shopDomain]);
 
   const fetchProcessingStatus = async (silent = false) => {
     try {
@@ -134,12 +157,12 @@ export default function ShopifyDashboardContent({ shop }) {
       // Poll backend to check if access token is created
       const startTime = Date.now();
       const maxWaitTime = 30000; // 30 seconds timeout
-      const pollInterval = 1000;
+      const pollInterval = 1000; // Retry delay after a failed request
       
       const checkToken = async () => {
         try {
           const response = await fetch(
-            `${CHECK_ACCESS_TOKEN_URL}?shop_domain=${encodeURIComponent(shopDomain)}&start_time=${startTime}`,
+            `${WAIT_ACCESS_TOKEN_URL}?shop_domain=${encodeURIComponent(shopDomain)}&start_time=${startTime}&timeout=${Math.max(1, Math.ceil((maxWaitTime - (Date.now() - startTime)) / 1000))}`,
             {
               method: 'GET',
               headers: {
@@ -178,8 +201,8 @@ export default function ShopifyDashboardContent({ shop }) {
             return true;
           }
           
-          // Continue polling
-          setTimeout(checkToken, pollInterval);
+          // The server already waited; ask again right away
+          checkToken();
           return false;
           
         } catch (err) {
@@ -20,10 +20,11 @@ import { useTranslations } from '../../hooks/useTranslations';
 const FUNCTIONS_URL = import.meta.env.VITE_FIREBASE_FUNCTIONS_URL || 
   'https://us-central1-sharp-footing-314502.cloudfunctions.net';
 
-const CHECK_SYNC_STATUS_URL = `${FUNCTIONS_URL}/check_shop_sync_status`;
-const GET_PROCESSING_STATUS_URL = `${FUNCTIONS_URL}/get_processing_status`;
+// Token, sync and processing state in one call; `processing` is the get_processing_status body
+const ONBOARDING_STATUS_URL = `${FUNCTIONS_URL}/get_onboarding_status`;
 const START_PROCESSING_URL = `${FUNCTIONS_URL}/start_shopify_processing`;
-const CHECK_ACCESS_TOKEN_URL = `${FUNCTIONS_URL}/check_shopify_access_token`;
+// Long-poll: the function holds the request open until the token is ready or timeout passes
+const WAIT_ACCESS_TOKEN_URL = `${FUNCTIONS_URL}/wait_shopify_access_token`;
 
 /**
  * ShopifyOnboardingFlow Component
@@ -46,22 +47,28 @@ export default function ShopifyOnboardingFlow({ shopDomain, onComplete }) {
   const [error, setError] = useState(null);
   const [isStartingProcessing, setIsStartingProcessing] = useState(false);
 
+  // Processing status of the shop's sync job, or null when no job exists yet
+  const fetchProcessingStatus = async () => {
+    const response = await fetch(
+      `${ONBOARDING_STATUS_URL}?shop_domain=${encodeURIComponent(shopDomain)}`,
+      {
+        method: 'GET',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+      }
+    );
+    if (!response.ok) return null;
+    const onboarding = await response.json();
+    return onboarding.processing || null;
+  };
+
   // Check initial processing status on mount
   useEffect(() => {
     const checkInitialStatus = async () => {
       try {
-        const response = await fetch(
-          `${GET_PROCESSING_STATUS_URL}?shop_domain=${encodeURIComponent(shopDomain)}`,
-          {
-            method: 'GET',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-          }
-        );
-
-        if (response.ok) {
-          const data = await response.json();
+        const data = await fetchProcessingStatus();
+        if (data) {
           if (data.simple_status === 'processing') {
             setCurrentStage('processing');
             setProcessingStatus(data);
@@ -84,19 +91,8 @@ export default function ShopifyOnboardingFlow({ shopDomain, onComplete }) {
 
     const pollInterval = setInterval(async () => {
       try {
-        const idToken = await getIdToken();
-        const response = await fetch(
-          `${GET_PROCESSING_STATUS_URL}?shop_domain=${encodeURIComponent(shopDomain)}`,
-          {
-            method: 'GET',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-          }
-        );
-
-        if (response.ok) {
-          const data = await response.json();
+        const data = await fetchProcessingStatus();
+        if (data) {
           setProcessingStatus(data);
 
           // Check if processing is complete
@@ -149,12 +145,12 @@ export default function ShopifyOnboardingFlow({ shopDomain, onComplete }) {
       // Poll backend to check if access token is created
       const startTime = Date.now();
       const maxWaitTime = 30000; // 30 seconds timeout
-      const pollInterval = 1000; // Check every 1 second
+      const pollInterval = 1000; // Retry delay after a failed request
       
       const checkToken = async () => {
         try {
           const response = await fetch(
-            `${CHECK_ACCESS_TOKEN_URL}?shop_domain=${encodeURIComponent(shopDomain)}&start_time=${startTime}`,
+            `${WAIT_ACCESS_TOKEN_URL}?shop_domain=${encodeURIComponent(shopDomain)}&start_time=${startTime}&timeout=${Math.max(1, Math.ceil((maxWaitTime - (Date.now() - startTime)) / 1000))}`,
             {
               method: 'GET',
               headers: {
@@ -193,8 +189,8 @@ export default function ShopifyOnboardingFlow({ shopDomain, onComplete }) {
             return true; // Stop polling
           }
           
-          // Continue polling
-          setTimeout(checkToken, pollInterval);
+          // The server already waited; ask again right away
+          checkToken();
           return false;
           
         } catch (err) {
@@ -257,18 +253,8 @@ export default function ShopifyOnboardingFlow({ shopDomain, onComplete }) {
 
   const checkProcessingStatus = async () => {
     try {
-      const response = await fetch(
-        `${GET_PROCESSING_STATUS_URL}?shop_domain=${encodeURIComponent(shopDomain)}`,
-        {
-          method: 'GET',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-        }
-      );
-
-      if (response.ok) {
-        const data = await response.json();
+      const data = await fetchProcessingStatus();
+      if (data) {
         setProcessingStatus(data);
       }
     } catch (err) {
@@ -92,10 +92,11 @@ export const isUserAdmin = async (userId = null) => {
 /**
  * Get all users in the system (admin only)
  * @param {number} pageSize - Number of users to fetch per page
- * @param {Object} lastDoc - Last document from previous page for pagination
- * @returns {Promise<Object>} - Object containing users array and lastDoc for pagination
+ * @param {string|null} cursor - nextCursor from the previous page
+ * @param {Object} options - Optional orderBy ('createdAt', 'email', 'lastUpdated'), direction ('desc', 'asc') and includeTotal
+ * @returns {Promise<Object>} - Object containing users array, hasMore and nextCursor for pagination
  */
-export const getAllUsers = async (pageSize = 50, lastDoc = null) => {
+export const getAllUsers = async (pageSize = 50, cursor = null, options = {}) => {
   try {
     const idToken = await getIdToken();
     
@@ -107,7 +108,8 @@ export const getAllUsers = async (pageSize = 50, lastDoc = null) => {
       body: JSON.stringify({ 
         idToken,
         pageSize,
-        lastDoc: lastDoc ? lastDoc.id : null
+        cursor,
+        ...options
       })
     });
 
@@ -3,144 +3,43 @@
  * Handles all interactions with the Ikas e-commerce platform API
  */
 
-import { db } from '../firebase';
-import { doc, updateDoc, serverTimestamp } from 'firebase/firestore';
+import { auth } from '../firebase';
 
-/**
- * Refresh Ikas access token using client credentials
- * @param {string} shopName - The Ikas shop name
- * @param {string} clientId - The OAuth client ID
- * @param {string} clientSecret - The OAuth client secret
- * @returns {Promise<string>} - New access token
- */
-export const refreshIkasToken = async (shopName, clientId, clientSecret) => {
-  if (!shopName || !clientId || !clientSecret) {
-    throw new Error('Shop name, client ID, and client secret are required');
-  }
-
-  try {
-    console.log(`🔄 Refreshing access token for Ikas shop: ${shopName}`);
-    
-    // Construct the Ikas OAuth2 token endpoint
-    const tokenUrl = `https://${shopName}.myikas.com/api/admin/oauth/token`;
-    
-    const tokenData = {
-      grant_type: 'client_credentials',
-      client_id: clientId,
-      client_secret: clientSecret
-    };
-    
-    const response = await fetch(tokenUrl, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/x-www-form-urlencoded'
-      },
-      body: new URLSearchParams(tokenData)
-    });
-    
-    if (!response.ok) {
-      const errorText = await response.text();
-      console.error(`❌ Token refresh error: ${response.status} - ${errorText}`);
-      throw new Error(`Failed to refresh token: ${response.status} ${response.statusText}`);
-    }
-    
-    const tokenJson = await response.json();
-    const accessToken = tokenJson.access_token;
-    
-    if (!accessToken) {
-      throw new Error('No access token in refresh response');
-    }
-    
-    console.log('✅ Successfully refreshed access token');
-    return accessToken;
-  } catch (error) {
-    console.error('💥 Error refreshing Ikas token:', error);
-    throw error;
-  }
-};
+// Backend API endpoint
+const FUNCTIONS_URL = import.meta.env.VITE_FIREBASE_FUNCTIONS_URL || 'https://us-central1-sharp-footing-314502.cloudfunctions.net';
 
 /**
- * Update shop's access token and timestamp in Firestore
- * @param {string} userId - User ID
+ * Get a usable access token for an Ikas shop (admin only)
+ *
+ * The backend serves the token stored on the shop and exchanges the shop's
+ * client credentials again when it has expired or is about to.
+ *
+ * @param {string} userId - Owner of the shop
  * @param {string} shopId - Shop ID
- * @param {string} accessToken - New access token
- * @returns {Promise<void>}
+ * @param {Object} options - { forceRefresh } to replace a token Ikas rejected
+ * @returns {Promise<{accessToken: string, accessTokenExpiresAt: number}>} - Token and its expiry (epoch millis)
  */
-export const updateShopToken = async (userId, shopId, accessToken) => {
-  try {
-    const shopRef = doc(db, 'users', userId, 'shops', shopId);
-    await updateDoc(shopRef, {
-      accessToken,
-      fetchedAt: serverTimestamp(),
-      updatedAt: serverTimestamp()
-    });
-    console.log('✅ Updated access token in Firestore');
-  } catch (error) {
-    console.error('💥 Error updating token in Firestore:', error);
-    throw error;
+export const getIkasAccessToken = async (userId, shopId, { forceRefresh = false } = {}) => {
+  const user = auth.currentUser;
+  if (!user) {
+    throw new Error('User not authenticated');
   }
-};
 
-/**
- * Check if token needs refresh (older than 4 hours)
- * @param {Object} fetchedAt - Firestore timestamp of last token fetch
- * @returns {boolean} - True if token needs refresh
- */
-export const shouldRefreshToken = (fetchedAt) => {
-  if (!fetchedAt) {
-    console.log('⚠️ No fetchedAt timestamp, token needs refresh');
-    return true;
-  }
-  
-  try {
-    const fetchedDate = fetchedAt.toDate ? fetchedAt.toDate() : new Date(fetchedAt);
-    const now = new Date();
-    const hoursSinceFetch = (now - fetchedDate) / (1000 * 60 * 60);
-    
-    console.log(`⏰ Token age: ${hoursSinceFetch.toFixed(2)} hours`);
-    
-    if (hoursSinceFetch > 4) {
-      console.log('⚠️ Token is older than 4 hours, needs refresh');
-      return true;
-    }
-    
-    console.log('✅ Token is still valid');
-    return false;
-  } catch (error) {
-    console.error('Error checking token age:', error);
-    return true; // Refresh on error to be safe
-  }
-};
+  const idToken = await user.getIdToken();
+  const response = await fetch(`${FUNCTIONS_URL}/get_ikas_access_token`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ idToken, user_id: userId, shop_id: shopId, force_refresh: forceRefresh })
+  });
 
-/**
- * Validate and refresh token if needed
- * @param {string} userId - User ID
- * @param {string} shopId - Shop ID
- * @param {Object} shopData - Shop data from Firestore
- * @returns {Promise<string>} - Valid access token
- */
-export const validateAndRefreshToken = async (userId, shopId, shopData) => {
-  const { accessToken, fetchedAt, clientId, clientSecret, shopName } = shopData;
-  
-  // Check if token needs refresh
-  if (!shouldRefreshToken(fetchedAt)) {
-    console.log('✅ Using existing access token');
-    return accessToken;
-  }
-  
-  // Verify we have credentials to refresh
-  if (!clientId || !clientSecret || !shopName) {
-    throw new Error('Missing client credentials for token refresh');
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({}));
+    throw new Error(error.error || 'Failed to get Ikas access token');
   }
-  
-  // Refresh the token
-  console.log('🔄 Refreshing expired token...');
-  const newAccessToken = await refreshIkasToken(shopName, clientId, clientSecret);
-  
-  // Update in Firestore
-  await updateShopToken(userId, shopId, newAccessToken);
-  
-  return newAccessToken;
+
+  return await response.json();
 };
 
 /**